@@ -0,0 +1,89 @@
+"""Load test of bid updates to a sniped auction, sending each bid against coalescing them.
+
+Connects many simulated Socket.IO clients to the server's auction rooms, most of them watching
+the hot auction, then places bids at a steady rate through the bid broadcaster and counts the
+frames and packets the server sends, with the delay from a bid to its arrival at a client:
+
+    python benchmarks/bid_broadcast.py --clients 2000 --bids-per-second 300 --seconds 3 --window 0.15
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def connect_clients(server, clients, rooms):
+    """Add the clients to the server's rooms as join_auction does, 80% of them to the first room."""
+    for index in range(clients):
+        room = 'hot-item' if index < clients * 0.8 else f'item-{index % rooms}'
+        sid = server.manager.connect(f'client-{index}', '/')
+        server.manager.enter_room(sid, '/', room)
+
+def run(clients, rooms, rate, seconds, window):
+    """Bids at the rate for the time, returns the broadcaster metrics, packets and delays."""
+    from flask import Flask
+    from main import socketio
+    from main.broadcast_utils import BidCoalescer
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark'
+    socketio.init_app(app, async_mode='threading', client_manager=None)
+    server = socketio.server
+    connect_clients(server, clients, rooms)
+
+    # Count what reaches the clients, decoding only the packets of the probe client
+    packets = itertools.count()
+    delays = []
+    placed = {}
+
+    def send(eio_sid, packet):
+        next(packets)
+        if eio_sid == 'client-0' and packet.data.startswith('2'):
+            arrived = time.perf_counter()
+            _, frame = json.loads(packet.data[1:])
+            delays.extend(arrived - placed[bid['bid_id']] for bid in frame['bids'])
+
+    server._send_eio_packet = send
+    broadcaster = BidCoalescer(window)
+
+    interval = 1 / rate
+    started = time.perf_counter()
+    for bid_id in range(int(rate * seconds)):
+        # Most bids are on the hot auction
+        room = 'hot-item' if bid_id % 5 else f'item-{bid_id % rooms}'
+        time.sleep(max(0, started + bid_id * interval - time.perf_counter()))
+        placed[bid_id] = time.perf_counter()
+        broadcaster.publish(room, {'bid_id': bid_id, 'bid_userid': 1, 'bid_username': 'sniper',
+                                   'bid_amount': 10 + bid_id, 'bid_time': '2025-01-01 12:00'})
+    # Let the last frames go out
+    time.sleep(window + 0.1)
+    elapsed = time.perf_counter() - started
+    return broadcaster.metrics(), next(packets), delays, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--rooms', type=int, default=5)
+    parser.add_argument('--bids-per-second', type=float, default=300)
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--window', type=float, default=0.15)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients in {args.rooms} auction rooms, "
+          f"{args.bids_per_second:.0f} bids/s for {args.seconds}s")
+    for name, window in [('Each bid', 0), (f'{args.window * 1000:.0f} ms window', args.window)]:
+        metrics, packets, delays, elapsed = run(args.clients, args.rooms, args.bids_per_second, args.seconds, window)
+        delays.sort()
+        print(f"{name:>16}: {metrics['frames']} frames for {metrics['bids']} bids "
+              f"({metrics['frames_saved']} saved, largest {metrics['largest_frame']}), "
+              f"{packets / elapsed:9.0f} packets/s, "
+              f"probe delay median {delays[len(delays) // 2] * 1000:.1f} ms, max {delays[-1] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
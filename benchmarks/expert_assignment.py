@@ -0,0 +1,103 @@
+"""Compares the total suitability of bulk expert assignment, greedy against the batch solver.
+
+The greedy approach gives each request in turn to a random best expert, the solver matches the
+whole batch at once, with and without a cap on the requests given to one expert. Fills a temporary
+database with experts of random availability and expertise:
+
+    python benchmarks/expert_assignment.py --experts 15 --requests 60 --max-per-expert 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def greedy(scorer, requests):
+    """The original bulk assignment, returns (request, expert, score) for each assigned request."""
+    from main.assignment_utils import best_experts
+    assignments = []
+    for request in requests:
+        scores = scorer.scores(request)
+        best = best_experts(scores)
+        if best:
+            expert = random.choice(best)
+            assignments.append((request, expert, dict(scores)[expert]))
+            scorer.assign(expert, request.request_id)
+    return assignments
+
+def summary(assignments):
+    """Total suitability, assigned requests and the most given to one expert."""
+    loads = Counter(expert.id for _, expert, _ in assignments)
+    return sum(score for _, _, score in assignments), len(assignments), max(loads.values(), default=0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--experts', type=int, default=15)
+    parser.add_argument('--requests', type=int, default=60)
+    parser.add_argument('--max-per-expert', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ['EMPTY_DB'] = '1'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    from datetime import datetime, time as day_time, timedelta
+    from main import create_app
+    from main.models import db, User, Category, Item, AuthenticationRequest, ExpertAvailability, ExpertCategory
+    from main.assignment_utils import ExpertScorer, solve_assignments
+
+    app = create_app(testing=True, database_path=os.path.join(tempfile.mkdtemp(), 'benchmark.db'))
+    with app.app_context():
+        random.seed(1)
+        now = datetime.now()
+        categories = [Category(name=f'Category {index}') for index in range(6)]
+        seller = User(username='seller', email='seller@benchmark.test', role=1)
+        seller.set_password('Password@123')
+        db.session.add_all(categories + [seller])
+        db.session.flush()
+
+        for index in range(args.experts):
+            expert = User(username=f'expert{index}', email=f'expert{index}@benchmark.test', role=2)
+            expert.set_password('Password@123')
+            db.session.add(expert)
+            db.session.flush()
+            for day in random.sample(range(8), random.randint(1, 5)):
+                start = random.randint(0, 20)
+                db.session.add(ExpertAvailability(
+                    expert_id=expert.id, day=now.date() + timedelta(days=day),
+                    start_time=day_time(start), end_time=day_time(start + 3), status=True))
+            for category in random.sample(categories, random.randint(1, 2)):
+                db.session.add(ExpertCategory(expert_id=expert.id, category_id=category.id))
+
+        for index in range(args.requests):
+            item = Item(seller_id=seller.id, category_id=random.choice(categories).id, title=f'Item {index}',
+                        description='Benchmark item', auction_start=now - timedelta(days=1),
+                        auction_end=now + timedelta(hours=random.randint(6, 8 * 24)), minimum_price=10)
+            db.session.add(item)
+            db.session.flush()
+            db.session.add(AuthenticationRequest(item_id=item.item_id, requester_id=seller.id, status=1))
+        db.session.commit()
+
+        requests = AuthenticationRequest.query.all()
+        request_ids = [request.request_id for request in requests]
+        print(f"{args.requests} requests, {args.experts} experts, at most {args.max_per_expert} each for the solver")
+        runs = [
+            ('Greedy', lambda scorer: greedy(scorer, requests)),
+            ('Solver, no cap', lambda scorer: solve_assignments(scorer, requests, len(requests))),
+            ('Solver, capped', lambda scorer: solve_assignments(scorer, requests, args.max_per_expert))
+        ]
+        for name, run in runs:
+            scorer = ExpertScorer(now, request_ids, workload_statuses=(1,))
+            started = time.perf_counter()
+            total, assigned, busiest = summary(run(scorer))
+            elapsed = time.perf_counter() - started
+            print(f"{name:14} total suitability {total:7.2f}, {assigned} assigned, "
+                  f"busiest expert {busiest}, {elapsed * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Compares building the manager revenue charts from the items table with reading the daily rollup.
+
+Fills a temporary database with completed auctions spread over the last 200 days:
+
+    python benchmarks/revenue_chart.py --items 100000 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def per_bucket(now):
+    """The original approach, two queries over the items for every bucket of the charts."""
+    from sqlalchemy import func
+    from main.models import db, Item
+    from main.page_dashboard.routes import revenue_buckets
+
+    def total(*conditions):
+        return float(db.session.query(func.sum(Item.current_bid_amount)).filter(*conditions).scalar() or 0.0)
+
+    data = {}
+    for chart, label, start, end in revenue_buckets(now):
+        bucket = (Item.auction_end >= start, Item.auction_end < end, Item.auction_end < now)
+        data.setdefault(chart, []).append((label, total(*bucket), total(*bucket, Item.status == 3)))
+    return data
+
+def grouped_by_day(now):
+    """A single query over the items grouped by the day they ended."""
+    from sqlalchemy import case, func
+    from main.models import db, Item
+    day = func.date(Item.auction_end)
+    return db.session.query(
+        day, func.sum(Item.current_bid_amount), func.sum(case((Item.status == 3, Item.current_bid_amount)))
+    ).filter(Item.auction_end >= now - timedelta(days=200), Item.auction_end < now).group_by(day).all()
+
+def timed(function, now, repeat):
+    """Best time in seconds of calling the function."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(now)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ['EMPTY_DB'] = '1'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    from sqlalchemy import insert
+    from main import create_app
+    from main.models import db, Item
+    from main.page_dashboard.routes import revenue_chart_data
+    from main.revenue_utils import rebuild_revenue_rollup
+
+    app = create_app(testing=True, database_path=os.path.join(tempfile.mkdtemp(), 'benchmark.db'))
+    with app.app_context():
+        now = datetime.now()
+        random.seed(1)
+        rows = []
+        for index in range(args.items):
+            auction_end = now - timedelta(minutes=random.randrange(200 * 24 * 60))
+            rows.append({
+                'seller_id': 1, 'category_id': 1, 'url': f'item{index}', 'title': f'Item {index}',
+                'description': 'Benchmark item', 'auction_start': auction_end - timedelta(days=3),
+                'auction_end': auction_end, 'minimum_price': 1, 'status': random.choice([2, 3]),
+                'auction_completed': True, 'base_fee': 1, 'auth_fee': 5,
+                'current_bid_amount': round(random.uniform(5, 500), 2), 'bid_count': 1
+            })
+        db.session.execute(insert(Item), rows)
+        db.session.commit()
+
+        started = time.perf_counter()
+        rebuild_revenue_rollup(now)
+        rebuild = time.perf_counter() - started
+
+        print(f"{args.items} completed auctions, best of {args.repeat}")
+        before = timed(per_bucket, now, args.repeat)
+        grouped = timed(grouped_by_day, now, args.repeat)
+        after = timed(revenue_chart_data, now, args.repeat)
+        print(f"Query per bucket: {before * 1000:8.1f} ms")
+        print(f"Grouped by day:   {grouped * 1000:8.1f} ms ({before / grouped:.1f}x)")
+        print(f"Daily rollup:     {after * 1000:8.1f} ms ({before / after:.1f}x), rebuilt in {rebuild * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Measures SQLite throughput with many simultaneous bids and item page views.
+
+Runs the same workload against a temporary database in the old rollback journal mode and with the
+tuned pragmas from main.db_utils, each in its own process:
+
+    python benchmarks/sqlite_concurrency.py --writers 8 --readers 8 --seconds 5
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Pragmas of each mode, passed to the app through its SQLITE_<NAME> settings
+MODES = {
+    'rollback journal': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'cache_size': '-2000',
+                         'mmap_size': '0', 'temp_store': 'DEFAULT'},
+    'tuned': {'journal_mode': 'WAL', 'synchronous': 'NORMAL'}
+}
+
+def run_workload(writers, readers, seconds):
+    """Runs the workload in this process and returns its counts."""
+    from datetime import datetime, timedelta
+    from main import create_app
+    from main.limiter_utils import limiter
+    from main.models import db, User, Category, Item
+
+    app = create_app(testing=True, database_path=os.path.join(tempfile.mkdtemp(), 'benchmark.db'))
+    app.config['WTF_CSRF_ENABLED'] = False
+    limiter.enabled = False
+
+    with app.app_context():
+        seller = User(username='seller', email='seller@example.com')
+        bidders = [User(username=f'bidder{i}', email=f'bidder{i}@example.com') for i in range(writers)]
+        for user in [seller] + bidders:
+            user.set_password('Password@123')
+        category = Category(name='Benchmark')
+        db.session.add_all([seller, category] + bidders)
+        db.session.commit()
+        item = Item(seller_id=seller.id, category_id=category.id, url='benchmark', title='Benchmark item',
+                    description='Benchmark item', minimum_price=1, auction_start=datetime.now(),
+                    auction_end=datetime.now() + timedelta(hours=1))
+        db.session.add(item)
+        db.session.commit()
+        bidder_ids = [bidder.id for bidder in bidders]
+
+    amounts = itertools.count(1)
+    counts = {'bids': 0, 'rejected': 0, 'errors': 0, 'reads': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def writer(user_id):
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+            while time.perf_counter() < deadline:
+                with lock:
+                    amount = next(amounts)
+                response = client.post('/item/benchmark/bid', json={'bid_amount': amount})
+                count('bids' if response.status_code == 200 else
+                      'rejected' if response.status_code < 500 else 'errors')
+
+    def reader():
+        with app.test_client() as client:
+            while time.perf_counter() < deadline:
+                response = client.get('/item/benchmark')
+                count('reads' if response.status_code == 200 else 'errors')
+
+    threads = [threading.Thread(target=writer, args=(user_id,)) for user_id in bidder_ids]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_workload(args.writers, args.readers, args.seconds)))
+        return
+
+    print(f"{args.writers} bidders and {args.readers} readers for {args.seconds}s")
+    for mode, pragmas in MODES.items():
+        environ = dict(os.environ, EMPTY_DB='1', SECRET_KEY=os.environ.get('SECRET_KEY', 'benchmark'))
+        environ.update({f'SQLITE_{name.upper()}': value for name, value in pragmas.items()})
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', '--writers', str(args.writers),
+             '--readers', str(args.readers), '--seconds', str(args.seconds)],
+            env=environ, cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        counts = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>16}: {counts['bids'] / args.seconds:7.1f} bids/s, "
+              f"{counts['reads'] / args.seconds:7.1f} reads/s, {counts['errors']} errors")
+
+
+if __name__ == '__main__':
+    main()
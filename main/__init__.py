@@ -14,7 +14,19 @@ from .models import db
 from .init_db import populate_db
 from .limiter_utils import configure_limiter
 from .extensions import csrf
-from .db_utils import reset_database
+from .db_utils import (
+    reset_database, drop_all_tables, add_bid_summary_columns, repair_bid_summaries, engine_options,
+    dispose_engine_after_fork, sqlite_pragmas, apply_sqlite_pragmas, create_missing_indexes,
+    add_availability_unique_index
+)
+from .search_utils import init_search_index
+from .cache_utils import init_stats_cache
+from .config_utils import init_config_cache, seed_manager_config
+from .socket_utils import init_socketio
+from .emit_utils import init_emitter
+from .broadcast_utils import init_bid_broadcaster
+from .presence_utils import init_presence
+from .chat_access_utils import init_chat_access
 
 socketio = SocketIO()
 scheduler = None
@@ -45,13 +57,6 @@ def create_app(testing=False, database_path='database.db'):
         if database_url.startswith('postgres://'):
             database_url = database_url.replace('postgres://', 'postgresql://', 1)
         app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-
-        # Set NullPool for PostgreSQL to avoid threading issues with Gunicorn
-        from sqlalchemy.pool import NullPool
-        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-            'poolclass': NullPool,
-            'connect_args': {}
-        }
     elif not testing:
         # Local SQLite database
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'database.db')
@@ -60,22 +65,10 @@ def create_app(testing=False, database_path='database.db'):
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, database_path)
 
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    # Set the SQLAlchemy engine options per environment
-    if os.environ.get('RENDER') != 'true':
-        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-            'connect_args': {
-                # Seconds to wait if db is locked
-                'timeout': 30
-            },
-            'pool_recycle': 120,
-            'pool_pre_ping': True
-        }
-    else:
-        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-        'pool_recycle': 120,
-        'pool_pre_ping': True
-    }
+
+    # Set the SQLAlchemy engine and connection pool options for the database backend
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLITE_PRAGMAS'] = sqlite_pragmas(testing=testing)
 
     # Initialise security features
     csrf.init_app(app)
@@ -119,6 +112,26 @@ def create_app(testing=False, database_path='database.db'):
         MAIL_DEFAULT_SENDER=os.environ.get('EMAIL_USER')
     )
 
+    # Send auction result notifications from a background task outside of tests
+    app.config['DELIVER_NOTIFICATIONS_ASYNC'] = not testing
+
+    # Redis shared by the workers for the stats cache, cache invalidations, WebSocket events and viewer counts
+    app.config['REDIS_URL'] = None if testing else os.environ.get('REDIS_URL')
+    # Seconds the manager statistics are cached for
+    app.config['STATS_CACHE_TTL'] = int(os.environ.get('STATS_CACHE_TTL') or 60)
+    # Seconds before a worker reloads manager configuration changed by another worker without Redis
+    app.config['CONFIG_CACHE_TTL'] = int(os.environ.get('CONFIG_CACHE_TTL') or 60)
+    # Seconds before a worker lets in experts assigned by another worker without Redis
+    app.config['CHAT_ACCESS_TTL'] = int(os.environ.get('CHAT_ACCESS_TTL') or 60)
+    # WebSocket events waiting to be sent by a background task before more are dropped, tests send each at once
+    app.config['EMIT_QUEUE_SIZE'] = 0 if testing else int(os.environ.get('EMIT_QUEUE_SIZE') or 10000)
+    # Seconds bids to one auction are gathered for into a single update, tests send each bid at once
+    app.config['BID_BROADCAST_WINDOW'] = 0 if testing else float(os.environ.get('BID_BROADCAST_WINDOW') or 0.15)
+    # Seconds between live viewer count updates to an auction or chat room
+    app.config['VIEWER_COUNT_INTERVAL'] = 0 if testing else float(os.environ.get('VIEWER_COUNT_INTERVAL') or 2)
+    # Names this worker's viewers in Redis, so the ones left by a crash are removed when it restarts
+    app.config['PRESENCE_WORKER_ID'] = os.environ.get('PRESENCE_WORKER_ID')
+
     # Add BASE_URL for generating links in emails
     app.config['BASE_URL'] = os.environ.get('BASE_URL', '127.0.0.1:5000/')
     
@@ -142,7 +155,10 @@ def create_app(testing=False, database_path='database.db'):
     )
 
     # Initialise the WebSocket server
-    socketio.init_app(app, cors_allowed_origins='*')
+    init_socketio(socketio, app)
+    init_emitter(app)
+    init_bid_broadcaster(app)
+    init_presence(app)
 
     # Initialise the scheduler
     if not testing and scheduler is None:
@@ -159,31 +175,62 @@ def create_app(testing=False, database_path='database.db'):
             @scheduler.task('interval', id='check_ended_auctions', seconds=60, misfire_grace_time=30)
             def check_ended_auctions_job():
                 with app.app_context():
-                    from .page_item.routes import check_ended_auctions
+                    from .auction_utils import finalise_ended_auctions
                     try:
-                        check_ended_auctions()
+                        finalise_ended_auctions()
                     except Exception as e:
                         print(f'Error checking ended auctions: {str(e)}')
 
+            # Send queued emails every 10 seconds
+            @scheduler.task('interval', id='send_queued_emails', seconds=10, misfire_grace_time=10)
+            def send_queued_emails_job():
+                with app.app_context():
+                    from .email_utils import drain_email_outbox
+                    try:
+                        drain_email_outbox()
+                    except Exception as e:
+                        print(f'Error sending queued emails: {str(e)}')
+
             scheduler.start()
 
     # Initialise the database
     db.init_app(app)
 
     with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        dispose_engine_after_fork(db.engine)
+
         # Creates tables if they don't exist
-        if os.environ.get('RENDER') == 'true':
+        rendering = os.environ.get('RENDER') == 'true'
+        if rendering:
             # If running on Render, reset the database completely
             reset_database(app, db)
         else:
             # Empty the database if required
             if os.environ.get('EMPTY_DB'):
-                db.drop_all()
-                db.create_all()
-            # Otherwise, populate dummy data if it doesn't already exist
-            else:
-                db.create_all()
-                populate_db(app)
+                drop_all_tables(db.engine, db.metadata)
+            db.create_all()
+
+        # Upgrade tables created by earlier versions, on every startup path
+        add_bid_summary_columns(db)
+        add_availability_unique_index(db)
+        create_missing_indexes(db)
+
+        # Populate dummy data if it doesn't already exist, unless the database was reset or emptied
+        if not rendering and not os.environ.get('EMPTY_DB'):
+            populate_db(app)
+
+        # Build the revenue rollup for a database that has none yet
+        from .revenue_utils import ensure_revenue_rollup
+        ensure_revenue_rollup()
+
+        # Default manager configuration, added once rather than by the pages reading it
+        init_config_cache(app)
+        seed_manager_config()
+
+        # Create the full-text search index
+        init_search_index()
 
     # Import and registers the blueprints
     from .page_home import home_page
@@ -230,6 +277,27 @@ def create_app(testing=False, database_path='database.db'):
                 flash('Your password has been changed. Please log in again.', 'info')
                 return redirect(url_for('auth_page.login'))
     
+    # Recalculates the stored highest bids, e.g. after bids were edited by hand
+    @app.cli.command('repair-bid-summaries')
+    def repair_bid_summaries_command():
+        count = repair_bid_summaries(db)
+        print(f'Repaired bid summaries for {count} items')
+
+    # Recalculates the daily revenue rollup shown on the manager dashboard
+    @app.cli.command('rebuild-revenue-rollup')
+    def rebuild_revenue_rollup_command():
+        from .revenue_utils import rebuild_revenue_rollup
+        count = rebuild_revenue_rollup()
+        print(f'Rebuilt the revenue rollup for {count} days')
+
+    # Repopulates the search index, e.g. after items were edited without its triggers
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        from .search_utils import rebuild_search_index
+        count = rebuild_search_index()
+        db.session.commit()
+        print(f'Rebuilt the search index for {count} items')
+
     @app.errorhandler(404)
     def page_not_found(e):
         return render_template('404.html'), 404
@@ -237,11 +305,17 @@ def create_app(testing=False, database_path='database.db'):
     # Initialise rate limiter
     configure_limiter(app)
 
+    # Initialise the statistics cache
+    init_stats_cache(app)
+
+    # Initialise the cache of who may join each authentication chat
+    init_chat_access(app)
+
     # Send pending notifications on startup
     with app.app_context():
-        from .page_item.routes import check_ended_auctions
+        from .auction_utils import finalise_ended_auctions
         try:
-            check_ended_auctions()
+            finalise_ended_auctions()
         except Exception as e:
             print(f'Error checking ended auctions on startup: {str(e)}')
 
@@ -0,0 +1,191 @@
+"""Score how suitable each expert is for pending authentication requests.
+
+ExpertScorer loads every expert with their categories, workload and existing assignments, and an
+AvailabilityIndex of their availability from today, in a handful of queries, then scores any number
+of requests in memory. The scores are the same as calculate_expert_suitability() in the dashboard
+routes.
+"""
+
+from collections import defaultdict
+from math import inf
+from datetime import timedelta
+from sqlalchemy import func
+from .models import db, User, ExpertAssignment, ExpertCategory
+from .availability_utils import AvailabilityIndex
+
+# Weights of the availability, workload and expertise parts of the score
+AVAILABILITY_WEIGHT = 0.4
+WORKLOAD_WEIGHT = 0.3
+EXPERTISE_WEIGHT = 0.3
+# Number of open assignments at which the workload score reaches zero
+MAX_WORKLOAD = 5
+# Most requests given to one expert by a bulk assignment, and the highest cap a manager may ask for
+MAX_BATCH_ASSIGNMENTS = 5
+BATCH_ASSIGNMENT_LIMIT = 20
+
+class ExpertProfile:
+    """What the score of one expert depends on, apart from their availability."""
+
+    def __init__(self, expert, workload, categories, today_score):
+        self.expert = expert
+        self.workload = workload
+        self.categories = categories
+        # Availability score from today's slots alone
+        self.today_score = today_score
+
+class ExpertScorer:
+    """Suitability scores of every expert for authentication requests, from one load of the data."""
+
+    def __init__(self, now, request_ids=(), workload_statuses=(1, 2)):
+        self.now = now
+        self.today = now.date()
+
+        experts = User.query.filter(User.role == 2).order_by(User.username.asc()).all()
+        workloads = dict(db.session.query(
+            ExpertAssignment.expert_id, func.count(ExpertAssignment.request_id)
+        ).filter(ExpertAssignment.status.in_(workload_statuses)).group_by(ExpertAssignment.expert_id).all())
+        categories = defaultdict(set)
+        for expert_id, category_id in db.session.query(ExpertCategory.expert_id, ExpertCategory.category_id):
+            categories[expert_id].add(category_id)
+
+        self.availability = AvailabilityIndex(self.today)
+        self.profiles = [ExpertProfile(expert, workloads.get(expert.id, 0), categories[expert.id],
+                                       self.today_score(expert.id)) for expert in experts]
+
+        # Experts who already have an assignment, of any status, for each request
+        self.assigned = defaultdict(set)
+        if request_ids:
+            assignments = db.session.query(ExpertAssignment.request_id, ExpertAssignment.expert_id)\
+                .filter(ExpertAssignment.request_id.in_(list(request_ids)))
+            for request_id, expert_id in assignments:
+                self.assigned[request_id].add(expert_id)
+
+    def today_score(self, expert_id):
+        """Availability score of the expert's slots today."""
+        if self.availability.available_at(expert_id, self.now):
+            # Currently available
+            return 1.0
+        if self.availability.available_later(expert_id, self.now):
+            # Available later today
+            return 0.7
+        return 0
+
+    def eligible(self, request):
+        """Profiles of the experts who may be assigned the request, ordered by username."""
+        assigned = self.assigned[request.request_id]
+        return [profile for profile in self.profiles
+                if profile.expert.id != request.requester_id and profile.expert.id not in assigned]
+
+    def score(self, profile, item, workload=None):
+        """Suitability of the expert for authenticating the item, -1 if they are unavailable.
+
+        The workload defaults to the expert's open assignments, a batch solver passes the workload
+        the expert would have after its earlier picks.
+        """
+        expert_id = profile.expert.id
+        if not self.availability.available_before(expert_id, item.auction_end, self.now):
+            return -1
+
+        avail_score = profile.today_score
+        if self.availability.available_between(expert_id, self.today + timedelta(days=1), item.auction_end.date()):
+            # Available in future
+            avail_score = max(avail_score, 0.5)
+
+        workload = profile.workload if workload is None else workload
+        workload_score = max(0, 1 - (workload / MAX_WORKLOAD))
+        expertise_score = 1.0 if item.category_id in profile.categories else 0
+
+        return (AVAILABILITY_WEIGHT * avail_score) + (WORKLOAD_WEIGHT * workload_score) + \
+            (EXPERTISE_WEIGHT * expertise_score)
+
+    def assign(self, expert, request_id):
+        """Count an assignment made since loading towards the expert's workload."""
+        for profile in self.profiles:
+            if profile.expert.id == expert.id:
+                profile.workload += 1
+        self.assigned[request_id].add(expert.id)
+
+    def scores(self, request):
+        """(expert, score) for every eligible expert of the request."""
+        return [(profile.expert, self.score(profile, request.item)) for profile in self.eligible(request)]
+
+def best_experts(scores):
+    """The experts sharing the highest positive score."""
+    if not scores:
+        return []
+    max_score = max(score for _, score in scores)
+    return [expert for expert, score in scores if score == max_score and score > 0]
+
+def solve_assignments(scorer, requests, max_per_expert=MAX_BATCH_ASSIGNMENTS):
+    """Assign a batch of requests to experts with the highest total suitability.
+
+    Each expert gets one column per request they may take in the batch, scored at the workload
+    they would have by then, so later picks of a busy expert are worth less. The matching of
+    requests to columns is solved exactly, a request with no suitable expert is left out.
+    Returns a list of (request, expert, score).
+    """
+    rows = [(request, {profile.expert.id for profile in scorer.eligible(request)}) for request in requests]
+    slots = max(0, min(max_per_expert, len(requests)))
+    columns = []
+    for profile in scorer.profiles:
+        scores = [[] for _ in range(slots)]
+        for request, eligible in rows:
+            for slot in range(slots):
+                score = scorer.score(profile, request.item, profile.workload + slot) \
+                    if profile.expert.id in eligible else 0
+                scores[slot].append(max(score, 0))
+        # Experts not suitable for any request can't improve the matching
+        if any(scores[0]):
+            columns.extend((profile, column) for column in scores)
+    if not rows or not columns:
+        return []
+
+    # Costs are negated scores, zero cost columns pad the matrix so every request has one
+    width = max(len(columns), len(rows))
+    costs = [[-columns[j][1][i] if j < len(columns) else 0 for j in range(width)] for i in range(len(rows))]
+    assignments = []
+    for i, j in enumerate(hungarian(costs)):
+        if j < len(columns) and costs[i][j] < 0:
+            assignments.append((rows[i][0], columns[j][0].expert, -costs[i][j]))
+    return assignments
+
+def hungarian(costs):
+    """Column of each row in the minimum cost matching of a matrix with at least as many columns as rows."""
+    n, m = len(costs), len(costs[0])
+    u, v = [0] * (n + 1), [0] * (m + 1)
+    # Row matched to each column, 1-based with 0 meaning free
+    matched = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for row in range(1, n + 1):
+        matched[0] = row
+        column = 0
+        minimum = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while matched[column]:
+            used[column] = True
+            current, delta, next_column = matched[column], inf, 0
+            cost_row = costs[current - 1]
+            for j in range(1, m + 1):
+                if not used[j]:
+                    reduced = cost_row[j - 1] - u[current] - v[j]
+                    if reduced < minimum[j]:
+                        minimum[j], way[j] = reduced, column
+                    if minimum[j] < delta:
+                        delta, next_column = minimum[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[matched[j]] += delta
+                    v[j] -= delta
+                else:
+                    minimum[j] -= delta
+            column = next_column
+        # Follow the augmenting path back to the start
+        while column:
+            previous = way[column]
+            matched[column] = matched[previous]
+            column = previous
+    result = [0] * n
+    for j in range(1, m + 1):
+        if matched[j]:
+            result[matched[j] - 1] = j - 1
+    return result
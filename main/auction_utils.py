@@ -0,0 +1,210 @@
+"""Finalise ended auctions in batches."""
+
+import logging
+import time
+from datetime import datetime
+from sqlalchemy import case, func, select
+from .models import db, Item, Bid, User, AuthenticationRequest, ExpertAssignment
+from .notification_utils import notify, notification_event
+from .revenue_utils import refresh_revenue_days
+from .cache_utils import mark_stats_changed
+from .emit_utils import emitter
+
+logger = logging.getLogger(__name__)
+
+# Number of auctions finalised per transaction
+BATCH_SIZE = 200
+
+# Totals across runs, used to report the finalisation rate
+finalise_metrics = {'runs': 0, 'items': 0, 'seconds': 0.0, 'last_rate': 0.0}
+
+def finalise_ended_auctions(now=None, item_ids=None, batch_size=BATCH_SIZE):
+    """Finalise every auction that has ended, returns the number of auctions finalised."""
+    now = now or datetime.now()
+    started = time.perf_counter()
+    total = 0
+
+    while True:
+        claimed, emits = finalise_batch(now, item_ids, batch_size)
+        if not claimed:
+            break
+        total += len(claimed)
+        emit_room_events(emits)
+        if len(claimed) < batch_size:
+            break
+
+    elapsed = time.perf_counter() - started
+    if total:
+        rate = total / elapsed if elapsed else float(total)
+        finalise_metrics['runs'] += 1
+        finalise_metrics['items'] += total
+        finalise_metrics['seconds'] += elapsed
+        finalise_metrics['last_rate'] = rate
+        logger.info(f"Finalised {total} auctions in {elapsed:.2f}s ({rate:.1f} items/s)")
+    return total
+
+def finalisation_metrics():
+    """Totals of this worker's finalisation runs and their average rate in items per second."""
+    seconds = finalise_metrics['seconds']
+    return dict(finalise_metrics, rate=finalise_metrics['items'] / seconds if seconds else 0.0)
+
+def finalise_batch(now, item_ids, batch_size):
+    """Finalise one batch of ended auctions in a single transaction.
+
+    Returns the finalised item ids and the room events to send once committed.
+    """
+    items = Item.__table__
+    ended = (
+        Item.auction_end <= now,
+        Item.auction_completed.is_(False),
+        Item.winning_bid_id.is_(None)
+    )
+    if item_ids is not None:
+        ended += (Item.item_id.in_(item_ids),)
+
+    try:
+        # Claim the batch, the winner is the highest bid already stored on each item
+        batch = db.session.execute(
+            select(Item.item_id).where(*ended).order_by(Item.auction_end, Item.item_id).limit(batch_size)
+        ).scalars().all()
+        if not batch:
+            db.session.rollback()
+            return [], []
+        claimed = db.session.execute(
+            items.update()
+            .where(items.c.item_id.in_(batch), items.c.auction_completed.is_(False))
+            .values(
+                auction_completed=True,
+                winning_bid_id=items.c.current_bid_id,
+                status=case((items.c.current_bid_id.isnot(None), 2), else_=items.c.status)
+            )
+            .returning(items.c.item_id)
+        ).scalars().all()
+        if not claimed:
+            db.session.rollback()
+            return [], []
+
+        rows = db.session.execute(
+            select(
+                Item.item_id, Item.title, Item.url, Item.seller_id, Item.current_bid_amount,
+                Item.current_bidder_id, Item.auction_end, User.username
+            )
+            .outerjoin(User, User.id == Item.current_bidder_id)
+            .where(Item.item_id.in_(claimed))
+        ).all()
+
+        # Every losing bidder of the batch in one grouped query
+        losers = db.session.execute(
+            select(Bid.item_id, Bid.bidder_id)
+            .join(Item, Item.item_id == Bid.item_id)
+            .where(Bid.item_id.in_(claimed), Bid.bidder_id != Item.current_bidder_id)
+            .group_by(Bid.item_id, Bid.bidder_id)
+        ).all()
+
+        cancelled = cancel_pending_authentications(claimed)
+        refresh_revenue_days(row.auction_end.date() for row in rows)
+        mark_stats_changed()
+
+        events = []
+        emits = []
+        for row in rows:
+            emits.append(('auction_ended', auction_ended_payload(row), row.url))
+            if row.current_bidder_id:
+                events.append(notification_event(
+                    row.current_bidder_id, 2,
+                    f"Congratulations! You won the auction for '{row.title}' with a bid of £{row.current_bid_amount}.",
+                    row
+                ))
+                events.append(notification_event(
+                    row.seller_id, 5,
+                    f"Your auction for '{row.title}' has ended. "
+                    f"The item was sold to {row.username} for £{row.current_bid_amount}.",
+                    row
+                ))
+            else:
+                events.append(notification_event(
+                    row.seller_id, 6, f"Your auction for '{row.title}' has ended without any bids.", row
+                ))
+
+        titles = {row.item_id: row for row in rows}
+        for item_id, bidder_id in losers:
+            row = titles[item_id]
+            events.append(notification_event(
+                bidder_id, 3, f"The auction for '{row.title}' has ended. Unfortunately, you didn't win.", row,
+                email=False
+            ))
+
+        for item_id, request_url, expert_id in cancelled:
+            row = titles[item_id]
+            emits.append(('force_reload', {'status': 'Auction ended'}, request_url))
+            events.append(notification_event(
+                row.seller_id, 4,
+                f"Your authentication request for '{row.title}' has been cancelled as the auction has ended.", row
+            ))
+            if expert_id:
+                events.append(notification_event(
+                    expert_id, 4,
+                    f"The authentication request for '{row.title}' has been cancelled as the auction has ended.",
+                    row
+                ))
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # All notifications of the batch are saved with one insert that commits the batch
+    notify(events)
+    return claimed, emits
+
+def cancel_pending_authentications(item_ids):
+    """Cancel pending authentication requests of ended auctions and their latest expert assignment.
+
+    Returns (item_id, request url, expert_id) for each cancelled request.
+    """
+    pending = db.session.execute(
+        select(AuthenticationRequest.request_id, AuthenticationRequest.item_id, AuthenticationRequest.url)
+        .where(AuthenticationRequest.item_id.in_(item_ids), AuthenticationRequest.status == 1)
+    ).all()
+    if not pending:
+        return []
+    request_ids = [request_id for request_id, _, _ in pending]
+
+    latest = dict(db.session.execute(
+        select(ExpertAssignment.request_id, func.max(ExpertAssignment.assignment_id))
+        .where(ExpertAssignment.request_id.in_(request_ids))
+        .group_by(ExpertAssignment.request_id)
+    ).all())
+    experts = dict(db.session.execute(
+        select(ExpertAssignment.assignment_id, ExpertAssignment.expert_id)
+        .where(ExpertAssignment.assignment_id.in_(latest.values()))
+    ).all()) if latest else {}
+
+    db.session.execute(
+        AuthenticationRequest.__table__.update()
+        .where(AuthenticationRequest.request_id.in_(request_ids))
+        .values(status=4)
+    )
+    if latest:
+        db.session.execute(
+            ExpertAssignment.__table__.update()
+            .where(ExpertAssignment.assignment_id.in_(latest.values()))
+            .values(status=4)
+        )
+
+    return [(item_id, url, experts.get(latest.get(request_id)))
+            for request_id, item_id, url in pending]
+
+def auction_ended_payload(row):
+    """Data sent to the auction room when the auction ends."""
+    if not row.current_bidder_id:
+        return {'winner': False}
+    return {
+        'winner': True,
+        'winning_bidder_id': row.current_bidder_id,
+        'winning_bidder_username': row.username,
+        'winning_bid_amount': float(row.current_bid_amount)
+    }
+
+def emit_room_events(emits):
+    """Tell the auction and authentication rooms that their auctions have ended."""
+    for event, payload, room in emits:
+        emitter.emit(event, payload, room=room)
@@ -0,0 +1,140 @@
+"""Answer expert availability questions from one load of their availability over a window of days.
+
+AvailabilityIndex keeps, for each expert, the sorted days they are available and the sorted start
+times of each day's slots, so checks like "available now" or "available before the auction ends"
+are binary searches instead of a query per expert.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import timedelta
+from .models import db, ExpertAvailability
+
+# An expert must start before this long ahead of the auction end to be suitable
+AUCTION_END_MARGIN = timedelta(hours=3)
+
+Slot = namedtuple('Slot', ['day', 'start_time', 'end_time', 'status'])
+
+class DaySlots:
+    """The available slots of one expert on one day, sorted by start time."""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        # Latest end of the slots starting at or before each position
+        self.latest_end = []
+
+    def add(self, start_time, end_time):
+        self.starts.append(start_time)
+        self.ends.append(end_time)
+
+    def finish(self):
+        slots = sorted(zip(self.starts, self.ends))
+        self.starts = [start for start, _ in slots]
+        self.ends = [end for _, end in slots]
+        latest = None
+        for end in self.ends:
+            latest = end if latest is None else max(latest, end)
+            self.latest_end.append(latest)
+
+    def covers(self, moment):
+        """Whether a slot starts at or before the time and ends after it."""
+        position = bisect_right(self.starts, moment)
+        return position > 0 and self.latest_end[position - 1] > moment
+
+    def starts_after(self, moment):
+        return bisect_right(self.starts, moment) < len(self.starts)
+
+    def starts_before(self, moment):
+        return bool(self.starts) and self.starts[0] < moment
+
+class AvailabilityIndex:
+    """Availability of experts between two days, inclusive, from a single query.
+
+    The end can be None for no upper bound, and the experts limited to the given ids.
+    """
+
+    def __init__(self, start, end=None, expert_ids=None):
+        self.start = start
+        self.end = end
+        # First record of each expert and day, whatever its status, as shown in the availability grid
+        self.records = {}
+        # Sorted days each expert is available, and their slots
+        self.days = {}
+        self.slots = {}
+
+        query = db.session.query(
+            ExpertAvailability.expert_id, ExpertAvailability.day, ExpertAvailability.start_time,
+            ExpertAvailability.end_time, ExpertAvailability.status
+        ).filter(ExpertAvailability.day >= start)
+        if end is not None:
+            query = query.filter(ExpertAvailability.day <= end)
+        if expert_ids is not None:
+            query = query.filter(ExpertAvailability.expert_id.in_(list(expert_ids)))
+
+        rows = query.order_by(ExpertAvailability.day, ExpertAvailability.availability_id)
+        for expert_id, day, start_time, end_time, status in rows:
+            self.records.setdefault((expert_id, day), Slot(day, start_time, end_time, status))
+            if status:
+                self.slots.setdefault(expert_id, {}).setdefault(day, DaySlots()).add(start_time, end_time)
+        for expert_id, days in self.slots.items():
+            for day_slots in days.values():
+                day_slots.finish()
+            self.days[expert_id] = sorted(days)
+
+    def record(self, expert_id, day):
+        """The expert's availability record for the day, or None if they haven't set one."""
+        return self.records.get((expert_id, day))
+
+    def available_on(self, expert_id, day):
+        """Whether the expert's record marks them available on the day."""
+        record = self.record(expert_id, day)
+        return bool(record and record.status)
+
+    def available_at(self, expert_id, moment):
+        """Whether one of the expert's slots covers the date and time."""
+        day_slots = self.slots.get(expert_id, {}).get(moment.date())
+        return bool(day_slots and day_slots.covers(moment.time()))
+
+    def available_later(self, expert_id, moment):
+        """Whether the expert has a slot starting later on the same day."""
+        day_slots = self.slots.get(expert_id, {}).get(moment.date())
+        return bool(day_slots and day_slots.starts_after(moment.time()))
+
+    def available_between(self, expert_id, first_day, last_day):
+        """Whether the expert is available on any day from the first to the last, inclusive."""
+        days = self.days.get(expert_id, [])
+        position = bisect_left(days, first_day)
+        return position < len(days) and days[position] <= last_day
+
+    def available_before(self, expert_id, auction_end, now, margin=AUCTION_END_MARGIN):
+        """Whether the expert is available from now until the margin before the auction end.
+
+        Any available day before the auction's last day counts, on the last day the expert has to
+        start before the margin.
+        """
+        end_date = auction_end.date()
+        if self.available_between(expert_id, now.date(), end_date - timedelta(days=1)):
+            return True
+        if end_date < now.date():
+            return False
+        day_slots = self.slots.get(expert_id, {}).get(end_date)
+        return bool(day_slots and day_slots.starts_before((auction_end - margin).time()))
+
+def upsert_availability(rows, update=('start_time', 'end_time', 'status')):
+    """Save availability rows with one INSERT ... ON CONFLICT statement, in the caller's transaction.
+
+    Each row is a dict of the expert_id, day, start_time, end_time and status. Days the expert
+    already has a record for only get the given columns updated.
+    """
+    if not rows:
+        return
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(ExpertAvailability).values(rows)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[ExpertAvailability.expert_id, ExpertAvailability.day],
+        set_={column: statement.excluded[column] for column in update}
+    ))
@@ -0,0 +1,101 @@
+"""Bid acceptance as a single compare-and-set on the item row."""
+
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import or_, select
+from .models import db, Item, Bid
+from .cache_utils import mark_stats_changed
+
+logger = logging.getLogger(__name__)
+
+MAX_BID = Decimal('999999.00')
+
+# Reasons a bid can be rejected
+NOT_FOUND = 'not_found'
+OWN_AUCTION = 'own_auction'
+ENDED = 'ended'
+BELOW_MINIMUM = 'below_minimum'
+TOO_LOW = 'too_low'
+
+def parse_bid_amount(value):
+    """Convert a submitted bid amount to pence precision, returns None if it is not a number."""
+    try:
+        amount = Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+    return amount if amount.is_finite() else None
+
+def place_bid(item_id, bidder_id, amount, now=None):
+    """Place a bid, returns (bid, None) if it was accepted or (None, reason) if it was rejected.
+
+    The bid is validated and claimed with one conditional UPDATE of the item's bid summary, so
+    concurrent bids on the same item cannot both win and no lock is held while Python runs.
+    """
+    now = now or datetime.now()
+    items = Item.__table__
+    bids = Bid.__table__
+
+    try:
+        claimed = db.session.execute(
+            items.update()
+            .where(
+                items.c.item_id == item_id,
+                items.c.auction_end > now,
+                items.c.seller_id != bidder_id,
+                items.c.minimum_price <= amount,
+                or_(items.c.current_bid_amount.is_(None), items.c.current_bid_amount < amount)
+            )
+            .values(
+                current_bid_amount=amount,
+                current_bidder_id=bidder_id,
+                bid_count=items.c.bid_count + 1
+            )
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return None, rejection_reason(item_id, bidder_id, amount, now)
+
+        # The item row stays locked until commit, so the previous highest bid cannot change
+        previous_bidder_id = db.session.execute(
+            select(bids.c.bidder_id)
+            .where(bids.c.item_id == item_id)
+            .order_by(bids.c.bid_amount.desc(), bids.c.bid_id.asc())
+            .limit(1)
+        ).scalar()
+
+        # Core insert, the summary has already been updated so the ORM listener must not run
+        bid_id = db.session.execute(bids.insert().values(
+            item_id=item_id,
+            bidder_id=bidder_id,
+            bid_amount=amount,
+            bid_time=now
+        )).inserted_primary_key[0]
+        db.session.execute(items.update().where(items.c.item_id == item_id).values(current_bid_id=bid_id))
+        mark_stats_changed()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'bid_id': bid_id,
+        'item_id': item_id,
+        'bidder_id': bidder_id,
+        'bid_amount': amount,
+        'bid_time': now,
+        'previous_bidder_id': previous_bidder_id
+    }, None
+
+def rejection_reason(item_id, bidder_id, amount, now):
+    """Work out why the conditional update did not accept a bid."""
+    item = db.session.get(Item, item_id)
+    if item is None:
+        return NOT_FOUND
+    if item.seller_id == bidder_id:
+        return OWN_AUCTION
+    if now >= item.auction_end:
+        return ENDED
+    if item.current_bid_amount is not None and amount <= item.current_bid_amount:
+        return TOO_LOW
+    return BELOW_MINIMUM
@@ -0,0 +1,84 @@
+"""Coalesce the bid updates sent to busy auction rooms.
+
+When bids arrive close together, as when an auction is sniped in its final seconds, sending each
+one to every viewer floods the room. Instead the first bid of a room opens a short window, and
+every bid accepted in it goes out as one bid_update frame. The frame has the latest bid's fields,
+as a single update had, and the list of all its bids, oldest first.
+"""
+
+import logging
+import threading
+from .emit_utils import emitter
+
+logger = logging.getLogger(__name__)
+
+# Seconds bids to one room are gathered for before being sent, 0 sends each bid straight away
+DEFAULT_WINDOW = 0.15
+
+def bid_frame(bids):
+    """The bid_update data for bids of one room, oldest first."""
+    frame = dict(bids[-1])
+    frame['bids'] = list(bids)
+    return frame
+
+class BidCoalescer:
+    """Batches the bids sent to each auction room within a window and counts the frames saved."""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        # Bids waiting to be sent to each room
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.bids = 0
+        self.frames = 0
+        self.largest_frame = 0
+
+    def publish(self, room, bid):
+        """Send the bid to the room, with any others accepted before the room's window closes."""
+        from main import socketio
+        with self.lock:
+            self.bids += 1
+            batch = self.pending.get(room)
+            if batch is not None:
+                batch.append(bid)
+                return
+            self.pending[room] = [bid]
+        if self.window > 0:
+            socketio.start_background_task(self.flush_later, room)
+        else:
+            self.flush(room)
+
+    def flush_later(self, room):
+        from main import socketio
+        socketio.sleep(self.window)
+        self.flush(room)
+
+    def flush(self, room):
+        """Send the room's waiting bids as one frame."""
+        with self.lock:
+            bids = self.pending.pop(room, None)
+            if not bids:
+                return
+            self.frames += 1
+            self.largest_frame = max(self.largest_frame, len(bids))
+        emitter.emit('bid_update', bid_frame(bids), room=room)
+
+    def metrics(self):
+        """Bids and frames sent by this process."""
+        with self.lock:
+            return {
+                'window': self.window,
+                'bids': self.bids,
+                'frames': self.frames,
+                'frames_saved': self.bids - self.frames - sum(len(bids) for bids in self.pending.values()),
+                'largest_frame': self.largest_frame,
+                'pending_rooms': len(self.pending)
+            }
+
+
+# Bid updates of every auction room
+bid_broadcaster = BidCoalescer()
+
+def init_bid_broadcaster(app):
+    """Set the window bid updates are gathered for."""
+    bid_broadcaster.window = app.config.get('BID_BROADCAST_WINDOW', DEFAULT_WINDOW)
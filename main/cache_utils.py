@@ -0,0 +1,160 @@
+"""Cache expensive statistics in process, or in Redis so every worker shares them."""
+
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from .models import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds cached statistics are served for before being recomputed
+DEFAULT_TTL = 60
+# Entries kept by the in-process cache
+MAX_ENTRIES = 128
+
+class MemoryCache:
+    """Thread-safe least recently used cache whose entries expire after their time to live."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, clock=time.monotonic):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (found, value)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires <= self.clock():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (self.clock() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class RedisCache:
+    """Cache shared by every worker, entries are expired by Redis itself."""
+
+    PREFIX = 'vintage-vault:stats:'
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=1)
+        self.client.ping()
+
+    def get(self, key):
+        """Returns (found, value)."""
+        data = self.client.get(self.PREFIX + key)
+        if data is None:
+            return False, None
+        return True, pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.PREFIX + key, pickle.dumps(value), ex=max(1, int(ttl)))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.PREFIX + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+class StatsCache:
+    """Caches computed statistics and counts how often they are served from the cache."""
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL):
+        self.configure(backend or MemoryCache(), ttl)
+
+    def configure(self, backend, ttl=DEFAULT_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value of the key, computing and caching it on a miss."""
+        try:
+            found, value = self.backend.get(key)
+        except Exception as e:
+            # A cache failure must not break the page, the value is just recomputed
+            logger.error(f"Stats cache read failed: {str(e)}")
+            found = False
+        if found:
+            self.count('hits')
+            return value
+
+        self.count('misses')
+        value = compute()
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logger.error(f"Stats cache write failed: {str(e)}")
+        return value
+
+    def invalidate(self):
+        """Drop every cached value so the next request recomputes them."""
+        try:
+            self.backend.clear()
+        except Exception as e:
+            logger.error(f"Stats cache invalidation failed: {str(e)}")
+        self.count('invalidations')
+
+    def metrics(self):
+        """Hit and miss counters of this process."""
+        requests = self.hits + self.misses
+        return {
+            'backend': 'redis' if isinstance(self.backend, RedisCache) else 'memory',
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / requests * 100, 1) if requests else 0.0
+        }
+
+
+# Statistics shown on the manager dashboard
+stats_cache = StatsCache()
+
+def init_stats_cache(app):
+    """Use Redis for the stats cache if REDIS_URL is set, otherwise an in-process cache."""
+    backend = MemoryCache()
+    url = app.config.get('REDIS_URL')
+    if url:
+        try:
+            backend = RedisCache(url)
+        except Exception as e:
+            logger.error(f"Stats cache falling back to memory, Redis is unavailable: {str(e)}")
+    stats_cache.configure(backend, app.config.get('STATS_CACHE_TTL', DEFAULT_TTL))
+
+def mark_stats_changed():
+    """Invalidate the cached statistics once the current transaction commits."""
+    db.session.info['stats_changed'] = True
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidate_after_commit(session):
+    """Invalidate after the commit, so the next request can't cache the old figures again."""
+    if session.info.pop('stats_changed', False):
+        stats_cache.invalidate()
+
+@db.event.listens_for(db.session, 'after_rollback')
+def forget_rolled_back_changes(session):
+    session.info.pop('stats_changed', None)
@@ -0,0 +1,169 @@
+"""Cache who may join each authentication chat room.
+
+A chat is open to the item's requester, the expert of its latest assignment unless they gave it
+up, and managers. The requester and expert of each room are loaded on the first join and kept in
+memory, so a burst of tabs reconnecting after a deploy doesn't query the database for each one.
+A room is dropped from the cache once a change to its experts commits, and other workers drop it
+straight away when Redis is configured, otherwise after the TTL.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import func
+from .models import db, AuthenticationRequest, ExpertAssignment
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker trusts a room's members changed by another worker without Redis
+DEFAULT_TTL = 60
+# Rooms kept, including unknown ones so repeated joins to them don't query either
+MAX_ROOMS = 10000
+# Redis channel announcing the requests whose experts changed
+CHANNEL = 'vintage-vault:chat-access'
+
+class ChatAccessCache:
+    """Request id and member ids of each chat room, by the request's URL."""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_rooms=MAX_ROOMS, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_rooms = max_rooms
+        self.clock = clock
+        # URL -> (loaded at, request id, member ids), request id and members are None for unknown URLs
+        self.rooms = OrderedDict()
+        self.loads = 0
+        self.lock = threading.Lock()
+        # Counts invalidations, so a load that overlapped one of its request isn't cached
+        self.generation = 0
+        self.cleared = 0
+        # Generation each request was last invalidated at, kept while loads are running
+        self.changed = {}
+        self.loading = 0
+
+    def members(self, url):
+        """The users other than managers allowed in the room, None if there is no such request."""
+        with self.lock:
+            entry = self.rooms.get(url)
+            if entry is not None and self.clock() - entry[0] < self.ttl:
+                self.rooms.move_to_end(url)
+                return entry[2]
+            started = self.generation
+            self.loading += 1
+        try:
+            request_id, members = self.load(url)
+        except Exception:
+            with self.lock:
+                self.finish_load()
+            raise
+        with self.lock:
+            # The members may be from before a change committed while they were loading
+            if self.cleared <= started and self.changed.get(request_id, 0) <= started:
+                self.rooms[url] = (self.clock(), request_id, members)
+                self.rooms.move_to_end(url)
+                while len(self.rooms) > self.max_rooms:
+                    self.rooms.popitem(last=False)
+            self.finish_load()
+        return members
+
+    def finish_load(self):
+        self.loading -= 1
+        if not self.loading:
+            self.changed.clear()
+
+    def load(self, url):
+        self.loads += 1
+        request = db.session.query(AuthenticationRequest.request_id, AuthenticationRequest.requester_id)\
+            .filter(AuthenticationRequest.url == url).first()
+        if request is None:
+            return None, None
+        members = {request.requester_id}
+        # The latest assignment, as the chat page checks
+        latest = db.session.query(func.max(ExpertAssignment.assignment_id))\
+            .filter(ExpertAssignment.request_id == request.request_id).scalar_subquery()
+        expert = db.session.query(ExpertAssignment.expert_id, ExpertAssignment.status)\
+            .filter(ExpertAssignment.assignment_id == latest).first()
+        if expert and expert.status != 3:
+            members.add(expert.expert_id)
+        return request.request_id, frozenset(members)
+
+    def allowed(self, url, user):
+        """Whether the user may join the room."""
+        members = self.members(url)
+        if members is None:
+            return False
+        return user.role == 3 or user.id in members
+
+    def invalidate(self, request_ids):
+        """Drop the rooms of the requests."""
+        request_ids = set(request_ids)
+        with self.lock:
+            self.generation += 1
+            if self.loading:
+                self.changed.update(dict.fromkeys(request_ids, self.generation))
+            for url in [url for url, entry in self.rooms.items() if entry[1] in request_ids]:
+                del self.rooms[url]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.cleared = self.generation
+            self.rooms.clear()
+
+
+chat_access = ChatAccessCache()
+# Publishes changes to the other workers when Redis is configured
+broadcaster = None
+
+def mark_chat_access_changed(*request_ids):
+    """Drop the requests' rooms from every worker's cache once the current transaction commits."""
+    db.session.info.setdefault('chat_access_changed', set()).update(request_ids)
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidate_after_commit(session):
+    request_ids = session.info.pop('chat_access_changed', None)
+    if not request_ids:
+        return
+    chat_access.invalidate(request_ids)
+    if broadcaster:
+        try:
+            broadcaster.publish(CHANNEL, ','.join(str(request_id) for request_id in request_ids))
+        except Exception as e:
+            logger.error(f"Failed to broadcast chat access change: {str(e)}")
+
+@db.event.listens_for(db.session, 'after_rollback')
+def forget_rolled_back_changes(session):
+    session.info.pop('chat_access_changed', None)
+
+def listen_for_changes(client):
+    """Drop the rooms other workers changed."""
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            for message in pubsub.listen():
+                chat_access.invalidate(int(request_id) for request_id in message['data'].split(b','))
+        except Exception as e:
+            logger.error(f"Lost the chat access change subscription: {str(e)}")
+            # Changes may have been missed while disconnected
+            chat_access.clear()
+            time.sleep(5)
+
+def init_chat_access(app):
+    """Set the TTL and subscribe to changes from other workers if Redis is configured."""
+    global broadcaster
+    chat_access.ttl = app.config.get('CHAT_ACCESS_TTL', DEFAULT_TTL)
+    chat_access.clear()
+    url = app.config.get('REDIS_URL')
+    if not url:
+        return
+    try:
+        import redis
+        broadcaster = redis.Redis.from_url(url, socket_timeout=1)
+        broadcaster.ping()
+        # The listener blocks on its own connection, without the timeout used to publish
+        listener = redis.Redis.from_url(url)
+        threading.Thread(target=listen_for_changes, args=(listener,), daemon=True).start()
+    except Exception as e:
+        broadcaster = None
+        logger.error(f"Chat access changes will not be broadcast, Redis is unavailable: {str(e)}")
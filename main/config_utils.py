@@ -0,0 +1,123 @@
+"""Process-wide cache of the manager configuration.
+
+The fees and maximum auction duration are read on every listing, so they are loaded once and kept
+in memory. Updates go through set_config(), which refreshes this process and, when Redis is
+configured, tells the other workers to reload. Otherwise other workers reload after the TTL.
+"""
+
+import logging
+import threading
+import time
+from .models import db, ManagerConfig
+
+logger = logging.getLogger(__name__)
+
+# Default value and description of each configuration key
+DEFAULTS = {
+    ManagerConfig.BASE_FEE_KEY: ('1.00', 'Base platform fee percentage for standard items'),
+    ManagerConfig.AUTHENTICATED_FEE_KEY: ('5.00', 'Platform fee percentage for authenticated items'),
+    ManagerConfig.MAX_DURATION_KEY: ('5', 'Maximum auction duration in days')
+}
+# Seconds before a worker reloads the configuration written by another worker
+DEFAULT_TTL = 60
+# Redis channel announcing configuration changes
+CHANNEL = 'vintage-vault:manager-config'
+
+class ConfigCache:
+    """The configuration values of this process, reloaded when invalidated or older than the TTL."""
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.values = None
+        self.loaded_at = 0.0
+        self.loads = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """The value of the key as a string, or its default if it has not been set."""
+        values = self.values
+        if values is None or self.clock() - self.loaded_at >= self.ttl:
+            values = self.load()
+        return values.get(key, DEFAULTS[key][0])
+
+    def load(self):
+        values = dict(db.session.query(ManagerConfig.config_key, ManagerConfig.config_value).all())
+        with self.lock:
+            self.values = values
+            self.loaded_at = self.clock()
+            self.loads += 1
+        return values
+
+    def invalidate(self):
+        self.values = None
+
+
+config_cache = ConfigCache()
+# Publishes changes to the other workers when Redis is configured
+broadcaster = None
+
+def get_config(key):
+    """The current value of a manager configuration key, as a string."""
+    return config_cache.get(key)
+
+def set_config(key, value):
+    """Save a configuration value and make every worker use it, returns the saved row."""
+    config = db.session.get(ManagerConfig, key)
+    if not config:
+        config = ManagerConfig(config_key=key, description=DEFAULTS[key][1])
+        db.session.add(config)
+    config.config_value = str(value)
+    db.session.commit()
+
+    config_cache.invalidate()
+    if broadcaster:
+        try:
+            broadcaster.publish(CHANNEL, key)
+        except Exception as e:
+            logger.error(f"Failed to broadcast configuration change: {str(e)}")
+    return config
+
+def seed_manager_config():
+    """Add the default of any configuration key missing from the database."""
+    existing = {key for key, in db.session.query(ManagerConfig.config_key)}
+    missing = [ManagerConfig(config_key=key, config_value=value, description=description)
+               for key, (value, description) in DEFAULTS.items() if key not in existing]
+    if missing:
+        db.session.add_all(missing)
+        db.session.commit()
+        logger.info(f"Seeded manager configuration: {', '.join(config.config_key for config in missing)}")
+    config_cache.invalidate()
+
+def listen_for_changes(client):
+    """Reload the configuration whenever another worker changes it."""
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            for _ in pubsub.listen():
+                config_cache.invalidate()
+        except Exception as e:
+            logger.error(f"Lost the configuration change subscription: {str(e)}")
+            # Changes may have been missed while disconnected
+            config_cache.invalidate()
+            time.sleep(5)
+
+def init_config_cache(app):
+    """Set the reload interval and subscribe to changes from other workers if Redis is configured."""
+    global broadcaster
+    config_cache.ttl = app.config.get('CONFIG_CACHE_TTL', DEFAULT_TTL)
+    config_cache.invalidate()
+    url = app.config.get('REDIS_URL')
+    if not url:
+        return
+    try:
+        import redis
+        broadcaster = redis.Redis.from_url(url, socket_timeout=1)
+        broadcaster.ping()
+        # The listener blocks on its own connection, without the timeout used to publish
+        listener = redis.Redis.from_url(url)
+        threading.Thread(target=listen_for_changes, args=(listener,), daemon=True).start()
+    except Exception as e:
+        broadcaster = None
+        logger.error(f"Configuration changes will not be broadcast, Redis is unavailable: {str(e)}")
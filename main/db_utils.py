@@ -1,16 +1,137 @@
-"""Database utilities for resetting and recreating the database."""
+"""Database utilities for configuring, resetting and recreating the database."""
 
 import logging
+import os
+import weakref
 from flask import current_app
 
 logger = logging.getLogger(__name__)
 
+def engine_options(database_uri, environ=None):
+    """Builds the SQLAlchemy engine options for the database backend.
+
+    PostgreSQL keeps a pool of open connections so requests don't pay for a new connection and
+    login each time. The pool can be sized with DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and
+    DB_POOL_RECYCLE, or turned off with DB_POOL=null when an external pooler such as PgBouncer is used.
+    """
+    environ = os.environ if environ is None else environ
+
+    def setting(name, default):
+        return int(environ.get(name) or default)
+
+    if database_uri.startswith('sqlite'):
+        return {
+            'connect_args': {
+                # Seconds to wait if db is locked
+                'timeout': setting('SQLITE_TIMEOUT', 30)
+            },
+            'pool_recycle': 120,
+            'pool_pre_ping': True
+        }
+
+    options = {
+        # Check connections before use so ones dropped by the server are replaced
+        'pool_pre_ping': True,
+        'pool_recycle': setting('DB_POOL_RECYCLE', 300)
+    }
+    if environ.get('DB_POOL', '').lower() == 'null':
+        from sqlalchemy.pool import NullPool
+        options['poolclass'] = NullPool
+    else:
+        options.update(
+            pool_size=setting('DB_POOL_SIZE', 5),
+            max_overflow=setting('DB_MAX_OVERFLOW', 10),
+            pool_timeout=setting('DB_POOL_TIMEOUT', 30),
+            # Reuse the most recently returned connection so idle ones can be recycled
+            pool_use_lifo=True
+        )
+    if database_uri.startswith('postgresql'):
+        options['connect_args'] = {'connect_timeout': setting('DB_CONNECT_TIMEOUT', 10)}
+    return options
+
+
+# Engines whose pools are replaced in forked processes, held weakly so engines of finished apps are dropped
+forked_engines = weakref.WeakSet()
+
+def dispose_engines_after_fork():
+    for engine in list(forked_engines):
+        # close=False leaves the parent's connections open for the parent to keep using
+        engine.dispose(close=False)
+
+
+# Registered once, as fork callbacks can't be removed
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=dispose_engines_after_fork)
+
+def dispose_engine_after_fork(engine):
+    """Stops forked worker processes, e.g. gunicorn's, from sharing the parent's pooled connections."""
+    forked_engines.add(engine)
+
+
+# Pragmas applied to every SQLite connection, each can be overridden with SQLITE_<NAME>
+SQLITE_PRAGMAS = {
+    # Readers no longer block the writer, or the writer readers
+    'journal_mode': 'WAL',
+    # Safe with WAL, only syncs to disk at checkpoints
+    'synchronous': 'NORMAL',
+    # 64MB page cache per connection
+    'cache_size': '-64000',
+    # Read the database through a 256MB memory map
+    'mmap_size': '268435456',
+    'temp_store': 'MEMORY',
+    # Dropping the tables turns this off for the drops, see drop_all_tables
+    'foreign_keys': 'ON'
+}
+
+def sqlite_pragmas(environ=None, testing=False):
+    """Builds the pragmas for SQLite connections from the defaults and the environment."""
+    environ = os.environ if environ is None else environ
+    pragmas = dict(SQLITE_PRAGMAS)
+    if testing:
+        # The test database is deleted between runs and the tests clear tables in any order
+        pragmas.update(journal_mode='DELETE', foreign_keys='OFF')
+
+    for name in pragmas:
+        value = environ.get(f'SQLITE_{name.upper()}')
+        if value:
+            # Pragma values can't be bound as parameters, so only allow plain words and numbers
+            if not value.lstrip('-').isalnum():
+                raise ValueError(f'Invalid value for SQLITE_{name.upper()}: {value}')
+            pragmas[name] = value
+    return pragmas
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Sets the pragmas on every new connection made by a SQLite engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+def drop_all_tables(engine, metadata):
+    """Drops every table, turning SQLite's foreign key checks off as items and bids reference each other."""
+    if engine.dialect.name != 'sqlite':
+        metadata.drop_all(engine)
+        return
+    with engine.connect() as connection:
+        foreign_keys = connection.exec_driver_sql('PRAGMA foreign_keys').scalar()
+        # Has no effect inside a transaction, so set before the drops begin one
+        connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        try:
+            metadata.drop_all(connection)
+            connection.commit()
+        finally:
+            connection.exec_driver_sql(f'PRAGMA foreign_keys={int(foreign_keys)}')
+
 def reset_database(app, db):
     """Drops all tables and recreates them"""
     with app.app_context():
         logger.info("Resetting database...")
         try:
-            db.drop_all()
+            drop_all_tables(db.engine, db.metadata)
             logger.info("All tables dropped successfully")
             db.create_all()
             logger.info("All tables created successfully")
@@ -23,4 +144,74 @@ def reset_database(app, db):
             return True
         except Exception as e:
             logger.error(f"Error resetting database: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+def add_bid_summary_columns(db):
+    """Adds the bid summary columns to an items table created before they existed."""
+    from sqlalchemy import inspect, text
+    columns = {column['name'] for column in inspect(db.engine).get_columns('items')}
+    missing = {
+        'current_bid_amount': 'NUMERIC(10, 2)',
+        'current_bid_id': 'INTEGER',
+        'current_bidder_id': 'INTEGER',
+        'bid_count': 'INTEGER NOT NULL DEFAULT 0'
+    }
+    missing = {name: ddl for name, ddl in missing.items() if name not in columns}
+    if not missing:
+        return False
+
+    for name, ddl in missing.items():
+        db.session.execute(text(f'ALTER TABLE items ADD COLUMN {name} {ddl}'))
+    db.session.commit()
+    logger.info(f"Added bid summary columns: {', '.join(missing)}")
+
+    # Backfill the new columns from the existing bids
+    repair_bid_summaries(db)
+    return True
+
+def repair_bid_summaries(db):
+    """Recalculates the bid summary of every item from the bids table, returns the number of items."""
+    from .models import bid_summary_update
+    result = db.session.execute(bid_summary_update())
+    db.session.commit()
+    logger.info(f"Repaired bid summaries for {result.rowcount} items")
+    return result.rowcount
+
+def add_availability_unique_index(db):
+    """Removes duplicate days from an expert_availability table created before they were disallowed.
+
+    The first record of each expert and day is kept, as that is the one the pages showed. The unique
+    index itself is then added by create_missing_indexes. Returns the number of records removed.
+    """
+    from sqlalchemy import inspect, text
+    indexes = {index['name'] for index in inspect(db.engine).get_indexes('expert_availability')}
+    if 'uq_expert_availability_expert_day' in indexes:
+        return 0
+
+    result = db.session.execute(text(
+        'DELETE FROM expert_availability WHERE availability_id NOT IN '
+        '(SELECT MIN(availability_id) FROM expert_availability GROUP BY expert_id, day)'
+    ))
+    # Replaced by the unique index on the same columns
+    if 'ix_expert_availability_expert_day' in indexes:
+        db.session.execute(text('DROP INDEX ix_expert_availability_expert_day'))
+    db.session.commit()
+    logger.info(f"Removed {result.rowcount} duplicate expert availability records")
+    return result.rowcount
+
+def create_missing_indexes(db):
+    """Creates indexes added to the models after the tables were created, returns their names."""
+    from sqlalchemy import inspect
+    inspector = inspect(db.engine)
+    existing = {
+        index['name'] for table in db.metadata.tables for index in inspector.get_indexes(table)
+    }
+    created = []
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                created.append(index.name)
+    if created:
+        logger.info(f"Created missing indexes: {', '.join(created)}")
+    return created
@@ -1,42 +1,179 @@
-"""Send email notifications to users."""
+"""Send email notifications to users.
+
+Emails are written to the outbox table and sent by the scheduler, so requests never wait on SMTP.
+"""
 
-from flask import current_app
-from flask_mail import Mail, Message
 import logging
+import smtplib
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_mail import Message
 
 logger = logging.getLogger(__name__)
 
+# Emails sent over each SMTP connection
+BATCH_SIZE = 50
+# Failed emails are retried with exponential backoff before being given up on
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timedelta(seconds=30)
+MAX_RETRY_DELAY = timedelta(hours=1)
+# Emails claimed by a worker on SQLite are left alone for this long, then retried if the worker died
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+def email_content(notification_type, message, item_title=None, item_url=None):
+    """Subject and body of the email for a notification."""
+    # Determine subject based on notification type
+    subject = "Vintage Vault Notification"
+
+    # Customise subject based on notification type
+    # 1 = Outbid, 2 = Winner, 3 = Loser
+    if notification_type == 1:
+        subject = f"You've been outbid on {item_title}"
+    elif notification_type == 2:
+        subject = f"Congratulations! You won the auction for {item_title}"
+    elif notification_type in [3, 5, 6]:
+        subject = f"Auction for {item_title} has ended"
+    elif notification_type == 4:
+        subject = f"Update on authentication request for {item_title}"
+
+    # Build email body
+    body = f"{message}\n\n"
+    if item_url:
+        body += f"View item: {current_app.config.get('BASE_URL', '127.0.0.1:5000/')}item/{item_url}\n\n"
+    body += "Thank you for using Vintage Vault!"
+    return subject, body
+
 def send_notification_email(user, notification):
-    # Send an email notification to the user.
+    # Queue an email notification to the user, sent once the caller commits.
+    try:
+        subject, body = email_content(notification.notification_type, notification.message,
+                                      notification.item_title, notification.item_url)
+        queue_email(user.email, subject, body)
+        logger.info(f"Email notification queued for {user.email}")
+    except Exception as e:
+        logger.error(f"Failed to queue email notification: {str(e)}")
+
+def queue_email(recipient, subject, body):
+    """Add an email to the outbox."""
+    queue_emails([(recipient, subject, body)])
+
+def queue_emails(emails):
+    """Add (recipient, subject, body) emails to the outbox with one insert.
+
+    The emails are saved when the caller commits. The insert runs in a savepoint, so if it fails only
+    the emails are rolled back and the caller's transaction can carry on.
+    """
+    from sqlalchemy import insert
+    from .models import db, EmailOutbox
+    if not emails:
+        return
+    now = datetime.now()
+    savepoint = db.session.begin_nested()
     try:
-        mail = Mail(current_app)
-
-        # Determine subject based on notification type
-        subject = "Vintage Vault Notification"
-
-        # Customise subject based on notification type
-        # 1 = Outbid, 2 = Winner, 3 = Loser
-        if notification.notification_type == 1:
-            subject = f"You've been outbid on {notification.item_title}"
-        elif notification.notification_type == 2:
-            subject = f"Congratulations! You won the auction for {notification.item_title}"
-        elif notification.notification_type in [3, 5, 6]:
-            subject = f"Auction for {notification.item_title} has ended"
-        elif notification.notification_type == 4:
-            subject = f"Update on authentication request for {notification.item_title}"
-
-        # Build email body
-        body = f"{notification.message}\n\n"
-        if notification.item_url:
-            body += f"View item: {current_app.config.get('BASE_URL', '127.0.0.1:5000/')}item/{notification.item_url}\n\n"
-        body += "Thank you for using Vintage Vault!"
-
-        msg = Message(
-            subject=subject,
-            recipients=[user.email],
-            body=body
-        )
-        mail.send(msg)
-        logger.info(f"Email notification sent to {user.email}")
+        db.session.execute(insert(EmailOutbox), [{
+            'recipient': recipient,
+            'subject': subject,
+            'body': body,
+            'status': EmailOutbox.PENDING,
+            'attempts': 0,
+            'created_at': now,
+            'next_attempt_at': now
+        } for recipient, subject, body in emails])
+        savepoint.commit()
+    except Exception:
+        savepoint.rollback()
+        raise
+
+def retry_delay(attempts):
+    """Delay before the next attempt after the given number of failed attempts."""
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+def record_failure(email, error, now):
+    """Schedule a retry of a failed email, or give up after too many attempts."""
+    from .models import EmailOutbox
+    email.attempts += 1
+    email.last_error = str(error)[:255]
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = EmailOutbox.FAILED
+        logger.error(f"Giving up on email {email.id} to {email.recipient}: {error}")
+    else:
+        email.next_attempt_at = now + retry_delay(email.attempts)
+
+def claim_emails(ids, now):
+    """Claim due emails for this worker on databases without row locks, returns the claimed emails.
+
+    The claim moves the emails' next attempt past CLAIM_TIMEOUT and is committed before sending. SQLite
+    runs one write at a time, so an email claimed by another worker is no longer due and is skipped.
+    """
+    from sqlalchemy import update
+    from .models import db, EmailOutbox
+    if not ids:
+        return []
+    claimed = db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(ids),
+               EmailOutbox.status == EmailOutbox.PENDING,
+               EmailOutbox.next_attempt_at <= now)
+        .values(next_attempt_at=now + CLAIM_TIMEOUT)
+        .returning(EmailOutbox.id)
+    ).scalars().all()
+    db.session.commit()
+    if not claimed:
+        return []
+    return EmailOutbox.query.filter(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id).all()
+
+def send_queued_emails(batch_size=BATCH_SIZE):
+    """Send one batch of due emails over a single SMTP connection, returns the number sent."""
+    from main import mail
+    from .models import db, EmailOutbox
+
+    now = datetime.now()
+    query = EmailOutbox.query.filter(
+        EmailOutbox.status == EmailOutbox.PENDING,
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.id).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        # Lets several workers drain the outbox without sending an email twice
+        query = query.with_for_update(skip_locked=True)
+        pending = query.all()
+    else:
+        pending = claim_emails([email.id for email in query], now)
+    if not pending:
+        db.session.rollback()
+        return 0
+
+    sent = 0
+    try:
+        with mail.connect() as connection:
+            while pending:
+                email = pending[0]
+                try:
+                    connection.send(Message(subject=email.subject, recipients=[email.recipient], body=email.body))
+                    email.status = EmailOutbox.SENT
+                    email.sent_at = datetime.now()
+                    sent += 1
+                except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                    raise
+                except Exception as e:
+                    # Only this email was rejected, the connection can still be used
+                    record_failure(email, e, now)
+                pending.pop(0)
     except Exception as e:
-        logger.error(f"Failed to send email notification: {str(e)}")
+        # The connection failed, the rest of the batch is retried later
+        logger.error(f"SMTP connection failed: {str(e)}")
+        for email in pending:
+            record_failure(email, e, now)
+
+    db.session.commit()
+    if sent:
+        logger.info(f"Sent {sent} queued emails")
+    return sent
+
+def drain_email_outbox(batch_size=BATCH_SIZE):
+    """Send due emails until the outbox is empty or a batch fails, returns the number sent."""
+    total = 0
+    while True:
+        sent = send_queued_emails(batch_size)
+        total += sent
+        if sent < batch_size:
+            return total
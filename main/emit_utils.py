@@ -0,0 +1,171 @@
+"""Send Socket.IO events from a bounded queue so requests don't wait on slow rooms.
+
+Handlers queue their events with emitter.emit and return straight away. A background task sends
+them oldest first, each event type at most at its rate per second. A bid_update or viewer_count
+still waiting for a room takes in the newer one rather than queueing behind it, so clients never
+get stale frames. Once the queue is full new viewer counts are dropped, as the next one supersedes
+them, while other events may still fill a reserve of the same size before they are dropped too.
+Drops are counted by event type and logged.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Events waiting to be sent before viewer counts are dropped, other events are dropped at twice
+# this, 0 sends each event in the caller
+DEFAULT_QUEUE_SIZE = 10000
+# Most events of each type sent per second, other types aren't limited
+DEFAULT_RATES = {'bid_update': 200, 'viewer_count': 50}
+# Upper bounds in seconds of the latency histogram buckets, from queueing an event to sending it
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+# Events dropped as soon as the queue is full, since the next one supersedes them
+SHED_FIRST = {'viewer_count'}
+
+def merge_bid_updates(waiting, new):
+    """One frame of the waiting frame's bids followed by the new one's, showing the highest bid."""
+    latest = new if new['bid_amount'] >= waiting['bid_amount'] else waiting
+    return dict(latest, bids=waiting['bids'] + new['bids'])
+
+
+# How a waiting event for a room takes in a newer one of the same type
+MERGES = {
+    'bid_update': merge_bid_updates,
+    'viewer_count': lambda waiting, new: new
+}
+
+class EmitDispatcher:
+    """Queue of Socket.IO events sent by a background task."""
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, rates=None, clock=time.monotonic):
+        self.clock = clock
+        self.configure(queue_size, rates)
+
+    def configure(self, queue_size=DEFAULT_QUEUE_SIZE, rates=None):
+        self.queue_size = queue_size
+        self.rates = dict(DEFAULT_RATES if rates is None else rates)
+        # Waiting events of each type as [event, data, room, queued at], and the mergeable ones by room
+        self.queues = {}
+        self.waiting = {}
+        self.depth = 0
+        # Tokens left for each rate limited event type and when they were counted
+        self.tokens = {}
+        self.sending = False
+        self.lock = threading.Lock()
+        self.counts = {'queued': 0, 'sent': 0, 'merged': 0, 'failed': 0, 'max_depth': 0}
+        self.dropped = {}
+        # Whether a drop was logged since the queue last had room
+        self.full = False
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def emit(self, event, data, room=None):
+        """Send the event to the room soon, never raising."""
+        if not self.queue_size:
+            self.send([event, data, room, self.clock()])
+            return
+        from main import socketio
+        with self.lock:
+            waiting = self.waiting.get((event, room)) if event in MERGES else None
+            if waiting is not None:
+                waiting[1] = MERGES[event](waiting[1], data)
+                self.counts['merged'] += 1
+                return
+            limit = self.queue_size if event in SHED_FIRST else 2 * self.queue_size
+            if self.depth >= limit:
+                self.dropped[event] = self.dropped.get(event, 0) + 1
+                if not self.full:
+                    self.full = True
+                    logger.warning(f"Emit queue is full at {self.depth} events, dropping {event}")
+                return
+            entry = [event, data, room, self.clock()]
+            self.queues.setdefault(event, deque()).append(entry)
+            if event in MERGES:
+                self.waiting[(event, room)] = entry
+            self.depth += 1
+            self.counts['queued'] += 1
+            self.counts['max_depth'] = max(self.counts['max_depth'], self.depth)
+            if self.sending:
+                return
+            self.sending = True
+        socketio.start_background_task(self.send_queued)
+
+    def send_queued(self):
+        """Send waiting events until the queue is empty."""
+        from main import socketio
+        while True:
+            with self.lock:
+                entry, wait = self.next_entry()
+                if entry is None and not wait:
+                    self.sending = False
+                    return
+            if entry is None:
+                socketio.sleep(wait)
+            else:
+                self.send(entry)
+
+    def next_entry(self):
+        """Take the oldest event allowed by its rate, or return how long until one is."""
+        now = self.clock()
+        entry, wait = None, None
+        for event, queue in self.queues.items():
+            if not queue:
+                continue
+            available = self.available(event, now)
+            if available < 1:
+                rate_wait = (1 - available) / self.rates[event]
+                wait = rate_wait if wait is None else min(wait, rate_wait)
+            elif entry is None or queue[0][3] < entry[3]:
+                entry = queue[0]
+        if entry is None:
+            return None, wait
+        event, _, room, _ = self.queues[entry[0]].popleft()
+        if self.waiting.get((event, room)) is entry:
+            del self.waiting[(event, room)]
+        if event in self.rates:
+            self.tokens[event] = (self.available(event, now) - 1, now)
+        self.depth -= 1
+        if self.depth < self.queue_size:
+            self.full = False
+        return entry, None
+
+    def available(self, event, now):
+        """Tokens of the event type, refilled at its rate up to a second's worth."""
+        rate = self.rates.get(event)
+        if rate is None:
+            return 1
+        tokens, counted = self.tokens.get(event, (rate, now))
+        return min(rate, tokens + (now - counted) * rate)
+
+    def send(self, entry):
+        from main import socketio
+        event, data, room, queued_at = entry
+        try:
+            socketio.emit(event, data, room=room)
+        except Exception as e:
+            logger.error(f"Error sending {event}: {str(e)}")
+            with self.lock:
+                self.counts['failed'] += 1
+            return
+        latency = self.clock() - queued_at
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+        with self.lock:
+            self.counts['sent'] += 1
+            self.latency[bucket] += 1
+
+    def metrics(self):
+        """Queue depth, counters and latency histogram of this process."""
+        with self.lock:
+            labels = [f'<={bound}s' for bound in LATENCY_BUCKETS] + [f'>{LATENCY_BUCKETS[-1]}s']
+            return dict(self.counts, queue_size=self.queue_size, depth=self.depth, dropped=dict(self.dropped),
+                        latency=dict(zip(labels, self.latency)))
+
+
+# Sends the Socket.IO events of the routes and background jobs, in the caller until init_emitter sets a queue
+emitter = EmitDispatcher(queue_size=0)
+
+def init_emitter(app):
+    """Set the queue size, tests send each event in the caller."""
+    emitter.configure(app.config.get('EMIT_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
@@ -4,10 +4,12 @@ from calendar import c
 from datetime import datetime, timedelta
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, func, inspect, or_, select
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.util import identity_key
 from uuid import uuid4
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import current_app
-from .email_utils import send_notification_email
 from .s3_utils import init_s3
 
 db = SQLAlchemy()
@@ -16,7 +18,9 @@ logger = logging.getLogger(__name__)
 # Table for watched items
 user_watched_items = db.Table('user_watched_items',
                               db.Column('user_id', db.Integer, db.ForeignKey('users.id')),
-                              db.Column('item_id', db.Integer, db.ForeignKey('items.item_id'))
+                              db.Column('item_id', db.Integer, db.ForeignKey('items.item_id')),
+                              db.Index('ix_user_watched_items_user_item', 'user_id', 'item_id'),
+                              db.Index('ix_user_watched_items_item', 'item_id')
                               )
 
 # User Model
@@ -101,40 +105,15 @@ class User(UserMixin, db.Model):
     # Schedule a task to automate checking and finalising auctions that have ended
     def schedule_auction_finalisation(self):
         # Check for finished auctions and set the winner
-        finished_items = Item.query.filter(Item.auction_end <= datetime.now(),
-                                           Item.winning_bid_id.is_(None)).all()
-        for item in finished_items:
-            item.finalise_auction()
+        from .auction_utils import finalise_ended_auctions
+        finalise_ended_auctions()
 
     # Send a welcome notification to a new user
     def send_welcome_notification(self):
-        notification = Notification(
-            user_id=self.id,
-            message=f"Welcome to Vintage Vault, {self.username}! Get started by browsing auctions or creating your own.",
-            notification_type=0,
-            created_at=datetime.now()
-        )
-        db.session.add(notification)
-        db.session.commit()
-
-        # Send welcome notification
-        try:
-            from main import socketio
-            socketio.emit('new_notification', {
-                'id': notification.id,
-                'message': notification.message,
-                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M')
-            }, room=f'user_{self.secret_key}')
-        except Exception as e:
-            logger.error(f"Failed to send welcome notification: {e}")
-
-        # Send welcome email
-        try:
-            send_notification_email(self, notification)
-        except Exception as e:
-            logger.error(f"Failed to send welcome email: {e}")
-
-        return notification
+        from .notification_utils import notify, notification_event
+        message = f"Welcome to Vintage Vault, {self.username}! Get started by browsing auctions or creating your own."
+        notification_ids = notify([notification_event(self, 0, message)])
+        return db.session.get(Notification, notification_ids[0]) if notification_ids else None
 
 # Item Model
 class Item(db.Model):
@@ -162,6 +141,11 @@ class Item(db.Model):
     # Store the fee per item
     base_fee = db.Column(db.Numeric(10, 2), nullable=False, default=1.00)
     auth_fee = db.Column(db.Numeric(10, 2), nullable=False, default=5.00)
+    # Summary of the highest bid, updated in the same transaction as every new bid
+    current_bid_amount = db.Column(db.Numeric(10, 2), nullable=True)
+    current_bid_id = db.Column(db.Integer, nullable=True)
+    current_bidder_id = db.Column(db.Integer, nullable=True)
+    bid_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     winning_bid_id = db.Column(
         db.Integer,
@@ -183,36 +167,43 @@ class Item(db.Model):
     )
     authentication_requests = db.relationship('AuthenticationRequest', backref='item', lazy=True)
 
+    # Indexes matching the listing, dashboard and finalisation queries
+    __table_args__ = (
+        db.Index('ix_items_end_revenue', 'auction_end', 'status', 'current_bid_amount'),
+        db.Index('ix_items_completed_end', 'auction_completed', 'auction_end'),
+        db.Index('ix_items_seller_end', 'seller_id', 'auction_end'),
+        db.Index('ix_items_status_end', 'status', 'auction_end'),
+        db.Index('ix_items_category_end', 'category_id', 'auction_end'),
+        db.Index('ix_items_winning_bid', 'winning_bid_id')
+    )
+
     def __init__(self, **kwargs):
         """Initialise the item and set the fees"""
         super().__init__(**kwargs)
         self.set_fees()
 
     def set_fees(self):
-        """Set fees from the ManagerConfig if available"""
-        from .models import ManagerConfig
+        """Set fees from the cached ManagerConfig"""
+        from .config_utils import get_config
 
         # Set unathenticated item fee
-        base_config = ManagerConfig.query.filter_by(config_key=ManagerConfig.BASE_FEE_KEY).first()
-        if base_config:
-            self.base_fee = float(base_config.config_value)
-        else:
-            self.base_fee = 1.00
+        self.base_fee = float(get_config(ManagerConfig.BASE_FEE_KEY))
 
         # Set authenticated item fee
-        auth_config = ManagerConfig.query.filter_by(config_key=ManagerConfig.AUTHENTICATED_FEE_KEY).first()
-        if auth_config:
-            self.auth_fee = float(auth_config.config_value)
-        else:
-            self.auth_fee = 5.00
+        self.auth_fee = float(get_config(ManagerConfig.AUTHENTICATED_FEE_KEY))
 
     def __repr__(self):
         return f"<Item {self.title} (ID: {self.item_id})>"
 
     def highest_bid(self):
-        if not self.bids:
+        # Uses the stored summary so the bid history does not need to be loaded
+        if not self.current_bid_id:
             return None
-        return max(self.bids, key=lambda bid: bid.bid_amount)
+        return db.session.get(Bid, self.current_bid_id)
+
+    def current_price(self):
+        """The highest bid amount, or the minimum price if there are no bids."""
+        return self.current_bid_amount if self.current_bid_amount is not None else self.minimum_price
 
     def user_highest_bid(self, user_id):
         """Get the highest bid for a specific user on this item."""
@@ -223,230 +214,38 @@ class Item(db.Model):
 
     # Send notification to the outbid user
     def notify_outbid(self, user):
-        notification = Notification(
-            user_id=user.id,
-            message=f"You have been outbid on '{self.title}'.",
-            item_url=self.url,
-            item_title=self.title,
-            notification_type=1,
-            created_at=datetime.now()
-        )
-        db.session.add(notification)
-        db.session.commit()
-
-        # Send real-time notification
-        try:
-            from main import socketio
-            socketio.emit('new_notification', {
-                'id': notification.id,
-                'message': notification.message,
-                'item_url': notification.item_url,
-                'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-            }, room=f'user_{user.secret_key}')
-        except Exception as e:
-            logger.error(f"Failed to send notification: {e}")
-
-        # Send email
-        send_notification_email(user, notification)
-
-    # Send notification to the winner
-    def notify_winner(self):
-        if not self.winning_bid:
-            return
-        
-        winner = db.session.get(User, self.winning_bid.bidder_id)
-        notification = Notification(
-            user_id=winner.id,
-            message=f"Congratulations! You won the auction for '{self.title}' with a bid of £{self.winning_bid.bid_amount}.",
-            item_url=self.url,
-            item_title=self.title,
-            notification_type=2,
-            created_at=datetime.now()
-        )
-        db.session.add(notification)
-        db.session.commit()
-
-        # Send real-time notification
-        try:
-            from main import socketio
-            socketio.emit('new_notification', {
-                'id': notification.id,
-                'message': notification.message,
-                'item_url': notification.item_url,
-                'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-            }, room=f'user_{winner.secret_key}')
-        except Exception as e:
-            logger.error(f"Failed to send notification: {e}")
-
-        # Send email
-        send_notification_email(winner, notification)
-
-    # Send notification to the losers
-    def notify_losers(self):
-        if not self.winning_bid:
-            return
-
-        # Get unique bidders excluding winner
-        bidders = set()
-        for bid in self.bids:
-            if bid.bidder_id != self.winning_bid.bidder_id:
-                bidders.add(bid.bidder_id)
-
-        for bidder_id in bidders:
-            bidder = db.session.get(User, bidder_id)
-            notification = Notification(
-                user_id=bidder.id,
-                message=f"The auction for '{self.title}' has ended. Unfortunately, you didn't win.",
-                item_url=self.url,
-                item_title=self.title,
-                notification_type=3,
-                created_at=datetime.now()
-            )
-            db.session.add(notification)
-            db.session.commit()
-
-            # Send real-time notification
-            try:
-                from main import socketio
-                socketio.emit('new_notification', {
-                    'id': notification.id,
-                    'message': notification.message,
-                    'item_url': notification.item_url,
-                    'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-                }, room=f'user_{bidder.secret_key}')
-            except Exception as e:
-                logger.error(f"Failed to send notification: {e}")
+        from .notification_utils import notify, notification_event
+        notify([notification_event(user, 1, f"You have been outbid on '{self.title}'.", self)])
 
     # Set the winning bid and notify users about the auction outcome
     def finalise_auction(self):
-        highest = self.highest_bid()
-        if highest:
-            self.winning_bid_id = highest.bid_id
-            self.status = 2  # Auction is won (but not yet paid)
-            db.session.commit()
-            # Notify winner and losers
-            self.notify_winner()
-            self.notify_losers()
-
-        # Notify the seller if the auction has bid or not
-        self.notify_seller()
-
-    # Notify the seller
-    def notify_seller(self):
-        if self.winning_bid:
-            message = f"Your auction for '{self.title}' has ended. The item was sold to {self.winning_bid.bidder.username} for £{self.winning_bid.bid_amount}."
-            notification_type = 5
-        else:
-            message = f"Your auction for '{self.title}' has ended without any bids."
-            notification_type = 6
-
-        # Create and save the notification
-        notification = Notification(
-            user_id=self.seller_id,
-            message=message,
-            item_url=self.url,
-            item_title=self.title,
-            notification_type=notification_type,
-            created_at=datetime.now()
-        )
-        db.session.add(notification)
-        db.session.commit()
-
-        # Send real-time notification
-        try:
-            from main import socketio
-            socketio.emit('new_notification', {
-                'message': notification.message,
-                'item_url': notification.item_url,
-                'id': notification.id,
-                'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-            }, room=f'user_{self.seller.secret_key}')
-        except Exception as e:
-            logger.error(f"Failed to send notification: {e}")
-
-        send_notification_email(self.seller, notification)
+        from .auction_utils import finalise_ended_auctions
+        finalise_ended_auctions(item_ids=[self.item_id])
 
+    # Notify the seller and the buyer that the item has been paid for
     def notify_payment(self):
         if not self.winning_bid:
             return
+        from .notification_utils import notify, notification_event
 
+        buyer = self.winning_bid.bidder
+        amount = self.winning_bid.bid_amount
         try:
-            seller = db.session.get(User, self.seller_id)
-            if not seller:
-                logger.error(f"Failed to find seller with ID {self.seller_id} for payment notification")
-                return
-
-            # Create notification
-            notification = Notification(
-                user_id=seller.id,
-                message=f"Payment received! {self.winning_bid.bidder.username} has paid £{self.winning_bid.bid_amount} for '{self.title}'.",
-                item_url=self.url,
-                item_title=self.title,
-                notification_type=7,
-                created_at=datetime.now()
-            )
-            db.session.add(notification)
-            db.session.commit()
-
-            # Send real-time notification
-            try:
-                from main import socketio
-                socketio.emit('new_notification', {
-                    'id': notification.id,
-                    'message': notification.message,
-                    'item_url': notification.item_url,
-                    'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-                }, room=f'user_{seller.secret_key}')
-                logger.info(f"Sent payment notification to seller {seller.username} (ID: {seller.id})")
-            except Exception as e:
-                logger.error(f"Failed to send real-time payment notification to seller: {e}")
-
-            # Send email notification
-            try:
-                send_notification_email(seller, notification)
-                logger.info(f"Sent payment email to seller {seller.username} (ID: {seller.id})")
-            except Exception as e:
-                logger.error(f"Failed to send payment email to seller: {e}")
-        except Exception as e:
-            logger.error(f"Error in notify_payment for seller: {e}")
-
-        # Notify the buyer
-        self.notify_payment_buyer()
-
-    def notify_payment_buyer(self):
-        if not self.winning_bid:
-            return
-            
-        buyer = db.session.get(User, self.winning_bid.bidder_id)
-        notification = Notification(
-            user_id=buyer.id,
-            message=f"Payment successful! You have paid £{self.winning_bid.bid_amount} for '{self.title}'.",
-            item_url=self.url,
-            item_title=self.title,
-            notification_type=8,
-            created_at=datetime.now()
-        )
-        db.session.add(notification)
-        db.session.commit()
-
-        # Send real-time notification
-        try:
-            from main import socketio
-            socketio.emit('new_notification', {
-                'id': notification.id,
-                'message': notification.message,
-                'item_url': notification.item_url,
-                'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-            }, room=f'user_{buyer.secret_key}')
+            notify([
+                notification_event(
+                    self.seller_id, 7,
+                    f"Payment received! {buyer.username} has paid £{amount} for '{self.title}'.", self
+                ),
+                notification_event(buyer, 8, f"Payment successful! You have paid £{amount} for '{self.title}'.", self)
+            ])
+            logger.info(f"Sent payment notifications for item {self.item_id}")
         except Exception as e:
-            logger.error(f"Failed to send buyer payment notification: {e}")
-
-        # Send email
-        send_notification_email(buyer, notification)
+            logger.error(f"Error in notify_payment: {e}")
 
     # Count the number of users watching an auction
     def watcher_count(self):
-        return len(self.watchers.all())
+        return db.session.query(func.count()).select_from(user_watched_items)\
+            .filter(user_watched_items.c.item_id == self.item_id).scalar()
 
 class Image(db.Model):
     __tablename__ = 'images'
@@ -456,6 +255,8 @@ class Image(db.Model):
     upload_date = db.Column(db.DateTime, default=datetime.now())
     item = db.relationship('Item', back_populates='images')
 
+    __table_args__ = (db.Index('ix_images_item', 'item_id'),)
+
 # Bid Model
 class Bid(db.Model):
     __tablename__ = 'bids'
@@ -470,9 +271,87 @@ class Bid(db.Model):
     bid_amount = db.Column(db.Numeric(10, 2), nullable=False)
     bid_time = db.Column(db.DateTime, default=datetime.now())
 
+    # The highest bid of an item, and the items a user has bid on
+    __table_args__ = (
+        db.Index('ix_bids_item_amount', 'item_id', 'bid_amount'),
+        db.Index('ix_bids_bidder_item', 'bidder_id', 'item_id')
+    )
+
     def __repr__(self):
         return f"<Bid {self.bid_id} on Item {self.item_id}>"
 
+
+# Item columns holding the highest bid summary
+BID_SUMMARY_FIELDS = ['current_bid_amount', 'current_bid_id', 'current_bidder_id', 'bid_count']
+
+def bid_summary_update():
+    """UPDATE statement recalculating the bid summary of items from the bids table."""
+    items = Item.__table__
+    bids = Bid.__table__
+
+    def highest(column):
+        # Ties go to the earliest bid
+        return select(column).where(bids.c.item_id == items.c.item_id)\
+            .order_by(bids.c.bid_amount.desc(), bids.c.bid_id.asc()).limit(1).scalar_subquery()
+
+    return items.update().values(
+        bid_count=select(func.count(bids.c.bid_id)).where(bids.c.item_id == items.c.item_id).scalar_subquery(),
+        current_bid_amount=highest(bids.c.bid_amount),
+        current_bid_id=highest(bids.c.bid_id),
+        current_bidder_id=highest(bids.c.bidder_id)
+    )
+
+def mark_bid_summary_changed(bid):
+    """Remember the bid's item so its loaded summary is refreshed once the flush has finished."""
+    session = object_session(bid)
+    if session is not None:
+        session.info.setdefault('bid_items', set()).add(bid.item_id)
+
+@db.event.listens_for(Bid, 'after_insert')
+def update_bid_summary(mapper, connection, bid):
+    """Update the item's highest bid summary within the transaction inserting the bid."""
+    items = Item.__table__
+    # SET expressions all see the old row, so each column is compared against the previous highest bid
+    outbids = or_(items.c.current_bid_amount.is_(None), items.c.current_bid_amount < bid.bid_amount)
+    connection.execute(
+        items.update()
+        .where(items.c.item_id == bid.item_id)
+        .values(
+            bid_count=items.c.bid_count + 1,
+            current_bid_amount=case((outbids, bid.bid_amount), else_=items.c.current_bid_amount),
+            current_bid_id=case((outbids, bid.bid_id), else_=items.c.current_bid_id),
+            current_bidder_id=case((outbids, bid.bidder_id), else_=items.c.current_bidder_id)
+        )
+    )
+    mark_bid_summary_changed(bid)
+
+@db.event.listens_for(Bid, 'after_delete')
+def recalculate_bid_summary(mapper, connection, bid):
+    """Recalculate the item's summary when one of its bids is deleted."""
+    connection.execute(bid_summary_update().where(Item.__table__.c.item_id == bid.item_id))
+    mark_bid_summary_changed(bid)
+
+@db.event.listens_for(db.session, 'after_flush_postexec')
+def expire_bid_summaries(session, flush_context):
+    """Expire the bid summary of items whose bids changed during the flush."""
+    for item_id in session.info.pop('bid_items', ()):
+        item = session.identity_map.get(identity_key(Item, item_id))
+        if item is not None:
+            session.expire(item, BID_SUMMARY_FIELDS)
+
+@db.event.listens_for(db.session, 'do_orm_execute')
+def recalculate_after_bulk_delete(state):
+    """Recalculate every summary after a bulk delete of bids, which skips the mapper events."""
+    if not state.is_delete or state.bind_mapper is not inspect(Bid):
+        return None
+    result = state.invoke_statement()
+    # Bids are never bulk deleted by the app itself, so recalculating every item is acceptable
+    state.session.execute(bid_summary_update())
+    for instance in list(state.session.identity_map.values()):
+        if isinstance(instance, Item):
+            state.session.expire(instance, BID_SUMMARY_FIELDS)
+    return result
+
 # Authentication Request Model
 class AuthenticationRequest(db.Model):
     __tablename__ = 'authentication_requests'
@@ -499,6 +378,12 @@ class AuthenticationRequest(db.Model):
     # Relationship to messages
     messages = db.relationship('Message', backref='authentication_request', lazy=True)
 
+    # Requests of an item, and the pending requests shown to managers
+    __table_args__ = (
+        db.Index('ix_authentication_requests_item_status', 'item_id', 'status'),
+        db.Index('ix_authentication_requests_status', 'status')
+    )
+
     def __repr__(self):
         return f"<AuthenticationRequest {self.request_id} for Item {self.item_id}>"
 
@@ -517,6 +402,13 @@ class ExpertAssignment(db.Model):
         default=1
     )
 
+    # An expert's assignments by status, the assignments of a request, and workload counts by status
+    __table_args__ = (
+        db.Index('ix_expert_assignments_expert_status', 'expert_id', 'status'),
+        db.Index('ix_expert_assignments_request', 'request_id', 'status'),
+        db.Index('ix_expert_assignments_status_expert', 'status', 'expert_id')
+    )
+
     def __repr__(self):
         return f"<ExpertAssignment {self.assignment_id} for Request {self.request_id}>"
 
@@ -531,6 +423,11 @@ class ExpertAvailability(db.Model):
     end_time = db.Column(db.Time, nullable=False)
     status = db.Column(db.Boolean, nullable=False, default=False)
 
+    __table_args__ = (
+        db.Index('uq_expert_availability_expert_day', 'expert_id', 'day', unique=True),
+        db.Index('ix_expert_availability_day', 'day')
+    )
+
     def __repr__(self):
         return f"<ExpertAvailability {self.availability_id} for Expert {self.expert_id} on {self.day}>"
 
@@ -548,6 +445,8 @@ class Message(db.Model):
     # Relationship to message images
     images = db.relationship('MessageImage', backref='message', lazy='joined')
 
+    __table_args__ = (db.Index('ix_messages_request_sent', 'authentication_request_id', 'sent_at'),)
+
     # Helper method to get image URLs for this message
     def get_image_urls(self, expiry=3600):
         """Get all image URLs for this message"""
@@ -565,6 +464,8 @@ class MessageImage(db.Model):
     # Message attachments are private so we store the key not the URL
     image_key = db.Column(db.String(256), nullable=False)
 
+    __table_args__ = (db.Index('ix_message_images_message', 'message_id'),)
+
     # Get the URL for the image - only needed here because message attachments are private
     def get_url(self, expiry=3600):
         s3_client = init_s3()
@@ -592,9 +493,37 @@ class Notification(db.Model):
     # 5 = Auction Ended (Sold), 6 = Auction Ended (Unsold)
     notification_type = db.Column(db.Integer, nullable=True, default=0)
 
+    __table_args__ = (db.Index('ix_notifications_user_created', 'user_id', 'created_at'),)
+
     def __repr__(self):
         return f"<Notification {self.id} for user {self.user_id}>"
 
+# Outgoing Email Model, queued by requests and sent in batches by the scheduler
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+
+    # Delivery statuses
+    PENDING = 0
+    SENT = 1
+    FAILED = 2
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.Integer, nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.now)
+    sent_at = db.Column(db.DateTime)
+
+    # The sender only reads pending emails that are due
+    __table_args__ = (db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),)
+
+    def __repr__(self):
+        return f"<EmailOutbox {self.id} to {self.recipient}>"
+
 # Manager Config Model
 class ManagerConfig(db.Model):
     __tablename__ = 'manager_config'
@@ -612,6 +541,23 @@ class ManagerConfig(db.Model):
     def __repr__(self):
         return f"<ManagerConfig {self.config_key}>"
 
+# Daily Revenue Model, a rollup of completed auctions by the day they ended
+class RevenueDaily(db.Model):
+    __tablename__ = 'revenue_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    # Sum of the highest bids of completed auctions, and of those that have been paid
+    projected = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    paid = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    # Commission on paid auctions without and with an approved authentication
+    base_commission = db.Column(db.Numeric(12, 4), nullable=False, default=0)
+    auth_commission = db.Column(db.Numeric(12, 4), nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    paid_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<RevenueDaily {self.day}>"
+
 # Item Category Model
 class Category(db.Model):
     __tablename__ = 'categories'
@@ -641,5 +587,7 @@ class ExpertCategory(db.Model):
                                backref=db.backref('expert_categories', lazy=True),
                                foreign_keys=[category_id])
 
+    __table_args__ = (db.Index('ix_expert_categories_expert', 'expert_id'),)
+
     def __repr__(self):
         return f"<ExpertCategory {self.id} for Expert {self.expert_id} in Category {self.category_id}>"
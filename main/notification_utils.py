@@ -0,0 +1,120 @@
+"""Create notifications in batches and deliver them over pluggable channels."""
+
+import logging
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert
+from .models import db, User, Notification
+from .email_utils import email_content, queue_emails
+from .emit_utils import emitter
+
+logger = logging.getLogger(__name__)
+
+def notification_event(user, notification_type, message, item=None, email=True):
+    """Build a (user, type, payload) event for notify().
+
+    The user can be a User or a user id, the item is used for the link shown with the notification.
+    """
+    payload = {'message': message, 'email': email}
+    if item is not None:
+        payload['item_url'] = item.url
+        payload['item_title'] = item.title
+    return user, notification_type, payload
+
+def notify(events, background=None):
+    """Save a batch of (user, type, payload) events as notifications and deliver them.
+
+    Users are loaded in one query and the notifications saved with one insert. This commits the
+    session: any changes the caller has pending are committed with the notifications, so call it
+    only once they are ready to be saved. Delivery runs after the commit, in a background task
+    unless configured otherwise. Returns the ids of the new notifications.
+    """
+    events = [(getattr(user, 'id', user), notification_type, payload)
+              for user, notification_type, payload in events]
+
+    users = {
+        user_id: {'id': user_id, 'email': email, 'secret_key': secret_key}
+        for user_id, email, secret_key in db.session.query(User.id, User.email, User.secret_key)
+        .filter(User.id.in_({user_id for user_id, _, _ in events})).all()
+    } if events else {}
+    missing = {user_id for user_id, _, _ in events if user_id not in users}
+    if missing:
+        logger.error(f"Skipping notifications for unknown users: {sorted(missing)}")
+    events = [event for event in events if event[0] in users]
+
+    now = datetime.now()
+    rows = [{
+        'user_id': user_id,
+        'message': payload['message'],
+        'item_url': payload.get('item_url'),
+        'item_title': payload.get('item_title'),
+        'notification_type': notification_type,
+        'is_read': False,
+        'created_at': now
+    } for user_id, notification_type, payload in events]
+
+    try:
+        ids = db.session.scalars(
+            insert(Notification).returning(Notification.id, sort_by_parameter_order=True), rows
+        ).all() if rows else []
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    deliveries = [{
+        'notification': dict(row, id=notification_id),
+        'user': users[row['user_id']],
+        'email': payload.get('email', True)
+    } for notification_id, row, (_, _, payload) in zip(ids, rows, events)]
+    if deliveries:
+        dispatch(deliveries, background)
+    return ids
+
+def dispatch(deliveries, background=None):
+    """Hand saved notifications to every channel, in a background task if required."""
+    if background is None:
+        background = current_app.config.get('DELIVER_NOTIFICATIONS_ASYNC', True)
+    if background:
+        from main import socketio
+        socketio.start_background_task(deliver, current_app._get_current_object(), deliveries)
+    else:
+        deliver(current_app, deliveries)
+
+def deliver(app, deliveries):
+    """Run each channel over the deliveries, a failing channel does not stop the others."""
+    with app.app_context():
+        for channel in CHANNELS:
+            try:
+                channel(deliveries)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Notification channel {channel.__name__} failed: {e}")
+
+def socket_channel(deliveries):
+    """Push each notification to the user's socket room."""
+    for delivery in deliveries:
+        notification = delivery['notification']
+        emitter.emit('new_notification', {
+            'id': notification['id'],
+            'message': notification['message'],
+            'item_url': notification['item_url'],
+            'created_at': notification['created_at'].strftime('%Y-%m-%d %H:%M')
+        }, room=f"user_{delivery['user']['secret_key']}")
+
+def email_channel(deliveries):
+    """Queue an email for each notification that asks for one."""
+    emails = []
+    for delivery in deliveries:
+        if not delivery['email']:
+            continue
+        notification = delivery['notification']
+        subject, body = email_content(notification['notification_type'], notification['message'],
+                                      notification['item_title'], notification['item_url'])
+        emails.append((delivery['user']['email'], subject, body))
+    queue_emails(emails)
+    db.session.commit()
+
+
+# Channels each batch of notifications is delivered over, in order
+CHANNELS = [socket_channel, email_channel]
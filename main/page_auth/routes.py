@@ -12,6 +12,7 @@ from . import auth_page
 from .forms import LoginForm, RegisterForm, UpdateUsernameForm, UpdateEmailForm, UpdatePasswordForm
 from ..models import db, User
 from ..limiter_utils import limiter
+from ..cache_utils import mark_stats_changed
 
 # SocketIO notification rooms
 @socketio.on('join_user')
@@ -111,6 +112,7 @@ def register():
             user.set_password(password)
 
             db.session.add(user)
+            mark_stats_changed()
             db.session.commit()
 
             # Initialise welcome notificaition to a new user
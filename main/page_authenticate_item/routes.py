@@ -8,9 +8,12 @@ from werkzeug.utils import secure_filename
 from datetime import datetime
 from sqlalchemy.orm import joinedload
 from . import authenticate_item_page
-from ..models import db, Item, AuthenticationRequest, Message, Notification, MessageImage
-from ..email_utils import send_notification_email
+from ..models import db, Item, AuthenticationRequest, Message, MessageImage
+from ..notification_utils import notification_event, notify
 from ..s3_utils import upload_s3
+from ..presence_utils import presence
+from ..chat_access_utils import chat_access, mark_chat_access_changed
+from ..emit_utils import emitter
 
 MAX_SIZE = 1024 * 1024
 MAX_IMAGES = 5
@@ -28,27 +31,22 @@ def on_join(data):
     if not current_user.is_authenticated:
         return
     room = data.get('auth_url')
-    authentication = AuthenticationRequest.query.filter_by(url=room).first()
 
     # Check user is allowed to join this room
-    expert = authentication.expert_assignments[-1] if authentication.expert_assignments else None
-    is_creator = authentication.requester_id == current_user.id
-    is_expert = expert and expert.expert_id == current_user.id and expert.status != 3
-    is_admin = current_user.role == 3
-
-    if not is_creator and not is_expert and not is_admin:
+    if not room or not chat_access.allowed(room, current_user):
         return
 
-    if room:
-        join_room(room)
+    join_room(room)
+    presence.join(room, request.sid)
 
 
-@socketio.on('leave')
+@socketio.on('leave_chat')
 def on_leave(data):
     """User leaves a chat room."""
     room = data.get('auth_url')
     if room:
         leave_room(room)
+        presence.leave(room, request.sid)
 
 
 @authenticate_item_page.route('/<url>')
@@ -104,36 +102,14 @@ def accept(url):
 
     authentication.status = 2
     authentication.expert_assignments[-1].status = 2
+    mark_chat_access_changed(authentication.request_id)
 
-    # Send notification to requester
-    notification = Notification(
-        user_id=authentication.requester_id,
-        message=f'Your item has been authenticated!',
-        item_url=authentication.item.url,
-        item_title=authentication.item.title,
-        notification_type=4,
-        created_at=datetime.now()
-    )
-    db.session.add(notification)
-    db.session.commit()
+    # Notify the requester, committing the decision with the notification
+    notify([notification_event(
+        authentication.requester_id, 4, 'Your item has been authenticated!', authentication.item
+    )])
 
-    # Send real-time notifications
-    try:
-        socketio.emit('new_notification', {
-            'message': notification.message,
-            'item_url': notification.item_url,
-            'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-        }, room=f'user_{authentication.requester.secret_key}')
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
-
-    # Send email
-    send_notification_email(authentication.requester, notification)
-
-    try:
-        socketio.emit('force_reload', {'status': 'Authentication approved'}, room=url)
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
+    emitter.emit('force_reload', {'status': 'Authentication approved'}, room=url)
     return jsonify({'success': 'Authentication request accepted.'})
 
 
@@ -155,36 +131,14 @@ def reject(url):
 
     authentication.status = 3
     authentication.expert_assignments[-1].status = 2
+    mark_chat_access_changed(authentication.request_id)
 
-    # Send notification to requester
-    notification = Notification(
-        user_id=authentication.requester_id,
-        message=f'Your item authentication has been declined.',
-        item_url=authentication.item.url,
-        item_title=authentication.item.title,
-        notification_type=4,
-        created_at=datetime.now()
-    )
-    db.session.add(notification)
-    db.session.commit()
+    # Notify the requester, committing the decision with the notification
+    notify([notification_event(
+        authentication.requester_id, 4, 'Your item authentication has been declined.', authentication.item
+    )])
 
-    # Send real-time notifications
-    try:
-        socketio.emit('new_notification', {
-            'message': notification.message,
-            'item_url': notification.item_url,
-            'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-        }, room=f'user_{authentication.requester.secret_key}')
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
-
-    # Send email
-    send_notification_email(authentication.requester, notification)
-
-    try:
-        socketio.emit('force_reload', {'status': 'Authentication declined'}, room=url)
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
+    emitter.emit('force_reload', {'status': 'Authentication declined'}, room=url)
     return jsonify({'success': 'Authentication request rejected.'})
 
 
@@ -205,6 +159,7 @@ def reassign(url):
         return jsonify({'error': 'Auction has ended.'}), 400
 
     authentication.expert_assignments[-1].status = 3
+    mark_chat_access_changed(authentication.request_id)
     db.session.commit()
 
     return jsonify({'success': 'Authentication request reassignment scheduled.'})
@@ -281,17 +236,14 @@ def new_message(url):
     db.session.commit()
 
     # Send real-time message
-    try:
-        socketio.emit('new_message', {
-            'message': message.message_text,
-            'sender': current_user.username,
-            'sender_id': str(current_user.id),
-            'sender_role': str(current_user.role),
-            'images': image_urls,
-            'sent_at': message.sent_at.strftime('%H:%M - %d/%m/%Y')
-        }, room=url)
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
+    emitter.emit('new_message', {
+        'message': message.message_text,
+        'sender': current_user.username,
+        'sender_id': str(current_user.id),
+        'sender_role': str(current_user.role),
+        'images': image_urls,
+        'sent_at': message.sent_at.strftime('%H:%M - %d/%m/%Y')
+    }, room=url)
 
     # Send notification to recipient
     if is_creator:
@@ -300,26 +252,9 @@ def new_message(url):
         recipient = authentication.requester
 
     if recipient:
-        notification = Notification(
-            user_id=recipient.id,
-            message=f'You have received a new message regarding an item authentication request.',
-            item_url=authentication.item.url,
-            item_title=authentication.item.title,
-            notification_type=0,
-            created_at=datetime.now()
-        )
-        db.session.add(notification)
-        db.session.commit()
-
-        # Send real-time notifications
-        try:
-            socketio.emit('new_notification', {
-                'id': notification.id,
-                'message': notification.message,
-                'item_url': notification.item_url,
-                'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-            }, room=f'user_{recipient.secret_key}')
-        except Exception as e:
-            print(f'SocketIO Error: {e}')
+        notify([notification_event(
+            recipient, 0, 'You have received a new message regarding an item authentication request.',
+            authentication.item, email=False
+        )])
 
     return jsonify({'success': 'Your message has been sent.'})
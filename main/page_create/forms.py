@@ -8,6 +8,7 @@ from wtforms.fields import DateTimeLocalField, MultipleFileField
 from wtforms.validators import DataRequired, Length, NumberRange, ValidationError, Optional
 from datetime import datetime, timedelta
 from ..models import ManagerConfig, Category
+from ..config_utils import get_config
 
 
 class CreateAuctionForm(FlaskForm):
@@ -76,8 +77,8 @@ class CreateAuctionForm(FlaskForm):
         now = datetime.now()
 
         try:
-            days = ManagerConfig.query.filter_by(config_key='max_auction_duration').first()
-            maximum_duration = timedelta(days=int(days.config_value))
+            days = get_config(ManagerConfig.MAX_DURATION_KEY)
+            maximum_duration = timedelta(days=int(days))
         except:
             maximum_duration = timedelta(days=5)
 
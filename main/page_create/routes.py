@@ -8,6 +8,8 @@ from . import create_page
 from .forms import CreateAuctionForm
 from ..s3_utils import upload_s3
 from ..models import db, Item, AuthenticationRequest, ManagerConfig, Image
+from ..config_utils import get_config
+from ..cache_utils import mark_stats_changed
 
 
 @create_page.route('/', methods=['GET', 'POST'])
@@ -19,18 +21,13 @@ def index():
         return redirect(url_for('home_page.index'))
 
     try:
-        base_fee = float(
-            ManagerConfig.query.filter_by(config_key='base_platform_fee').first().config_value
-        )
-
-    except (ValueError, AttributeError):
+        base_fee = float(get_config(ManagerConfig.BASE_FEE_KEY))
+    except ValueError:
         base_fee = 1.00
 
     try:
-        authentication_fee = float(
-            ManagerConfig.query.filter_by(config_key='authenticated_platform_fee').first().config_value
-        )
-    except (ValueError, AttributeError):
+        authentication_fee = float(get_config(ManagerConfig.AUTHENTICATED_FEE_KEY))
+    except ValueError:
         authentication_fee = 5.00
 
     form = CreateAuctionForm()
@@ -69,6 +66,7 @@ def index():
                 img = Image(item_id=item.item_id, url=image_url)
                 db.session.add(img)
 
+        mark_stats_changed()
         db.session.commit()
 
         if form.authenticate_item.data:
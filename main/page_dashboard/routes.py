@@ -1,26 +1,38 @@
 """Dashboard related routes."""
 
-from main import socketio
 from flask import render_template, jsonify, request
 from flask_login import login_required, current_user
 from datetime import date, datetime, timedelta
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, insert
+from sqlalchemy.orm import joinedload, selectinload
+from functools import partial
 from random import choice
 from . import dashboard_page
-from ..models import ExpertAvailability, db, User, AuthenticationRequest, ExpertAssignment, Item, ManagerConfig, Bid, Notification, Message, Category, ExpertCategory
-from ..email_utils import send_notification_email
-
-
-def get_expert_availability(expert):
-    # Returns a string indicating the expert's availability for today.
-    today = date.today()
-    avail = None
-    if expert.expert_availabilities:
-        for a in expert.expert_availabilities:
-            if a.day == today:
-                avail = a
-                break
-    now = datetime.now().time()
+from ..models import (
+    ExpertAvailability, db, user_watched_items, User, AuthenticationRequest, ExpertAssignment, Item, ManagerConfig, Bid,
+    Message, Category, ExpertCategory, RevenueDaily, logger
+)
+from ..cache_utils import stats_cache
+from ..broadcast_utils import bid_broadcaster
+from ..availability_utils import AvailabilityIndex
+from ..assignment_utils import (
+    ExpertScorer, BATCH_ASSIGNMENT_LIMIT, MAX_BATCH_ASSIGNMENTS, best_experts, solve_assignments
+)
+from ..notification_utils import notification_event, notify
+from ..config_utils import get_config, set_config
+from ..chat_access_utils import mark_chat_access_changed
+from ..emit_utils import emitter
+from ..auction_utils import finalisation_metrics
+
+
+def get_expert_availability(expert, availability=None, now=None):
+    # Returns a string indicating the expert's availability for today, from the index if given.
+    now = now or datetime.now()
+    today = now.date()
+    if availability is None:
+        availability = AvailabilityIndex(today, today, [expert.id])
+    avail = availability.record(expert.id, today)
+    now = now.time()
     if avail:
         if avail.status:  # Expert is marked available in the record
             if avail.start_time <= now < avail.end_time:
@@ -44,31 +56,11 @@ def get_expertise(expert, item):
                 return 'Expert'
     return 'No Expertise'
 
-def is_expert_available_before_auction_end(expert, auction_end, now=datetime.now()):
+def is_expert_available_before_auction_end(expert, auction_end, now=None):
     # Check if the expert has availability up to 3 hours before the auction end
-    now_date = now.date()
-    auction_end_date = auction_end.date()
-    threshold_time = (auction_end - timedelta(hours=3)).time()
-    
-    # Get all availability records between now and auction end
-    avail_records = db.session.query(ExpertAvailability).filter(
-        ExpertAvailability.expert_id == expert.id,
-        ExpertAvailability.day >= now_date,
-        ExpertAvailability.day <= auction_end_date,
-        ExpertAvailability.status == True
-    ).all()
-    
-    for record in avail_records:
-        if not record.status:
-            continue
-        # If availability is before auction end day, it's valid
-        if record.day < auction_end_date:
-            return True
-        # If on auction end day, ensure it starts before threshold
-        elif record.day == auction_end_date and record.start_time < threshold_time:
-            return True
-            
-    return False
+    now = now or datetime.now()
+    availability = AvailabilityIndex(now.date(), auction_end.date(), [expert.id])
+    return availability.available_before(expert.id, auction_end, now)
 
 def calculate_expert_suitability(expert, request, all_experts_assignments, now):
     # Calculate an expert's suitability score for a request.
@@ -129,36 +121,10 @@ def handle_manager(now):
     """Handle the dashboard for a manager."""
     manager = {}
 
-    # Manager configuration
-    manager['base_fee'] = ManagerConfig.query.filter_by(config_key='base_platform_fee').first()
-    manager['authenticated_fee'] = ManagerConfig.query.filter_by(config_key='authenticated_platform_fee').first()
-    manager['max_duration'] = ManagerConfig.query.filter_by(config_key='max_auction_duration').first()
-
-    if not manager['base_fee']:
-        base_fee = ManagerConfig(config_key='base_platform_fee', config_value='1.00',
-                                 description='Base platform fee percentage for standard items')
-        db.session.add(base_fee)
-        manager['base_fee'] = base_fee.config_value
-    else:
-        manager['base_fee'] = float(manager['base_fee'].config_value)
-
-    if not manager['authenticated_fee']:
-        authenticated_fee = ManagerConfig(config_key='authenticated_platform_fee',
-                                          config_value='5.00', description='Platform fee percentage for authenticated items')
-        db.session.add(authenticated_fee)
-        manager['authenticated_fee'] = authenticated_fee.config_value
-    else:
-        manager['authenticated_fee'] = float(manager['authenticated_fee'].config_value)
-
-    if not manager['max_duration']:
-        max_duration = ManagerConfig(config_key='max_auction_duration', config_value='5',
-                                     description='Maximum auction duration in days')
-        db.session.add(max_duration)
-        manager['max_duration'] = max_duration.config_value
-    else:
-        manager['max_duration'] = int(manager['max_duration'].config_value)
-
-    db.session.commit()
+    # Manager configuration, cached so viewing the dashboard doesn't touch the table
+    manager['base_fee'] = float(get_config(ManagerConfig.BASE_FEE_KEY))
+    manager['authenticated_fee'] = float(get_config(ManagerConfig.AUTHENTICATED_FEE_KEY))
+    manager['max_duration'] = int(get_config(ManagerConfig.MAX_DURATION_KEY))
 
     # Get all user roles except managers ordered by role and username
     manager['users'] = db.session.query(User).filter(
@@ -167,10 +133,14 @@ def handle_manager(now):
     # Pending authentication requests
     manager_authentications(manager, now)
 
-    # Statistics calculations
-    manager_stats(manager, now)
+    # Statistics calculations, cached until an auction is finalised or paid
+    manager.update(stats_cache.get_or_compute('manager_stats', lambda: manager_stats({}, now)))
+    manager['stats_cache'] = stats_cache.metrics()
 
-    return render_template('dashboard_manager.html', manager=manager, now=now, get_expert_availability=get_expert_availability, get_expertise=get_expertise)
+    # Availability shown for each eligible expert comes from the index loaded to score them
+    expert_availability = partial(get_expert_availability, availability=manager.pop('availability'), now=now)
+    return render_template('dashboard_manager.html', manager=manager, now=now,
+                           get_expert_availability=expert_availability, get_expertise=get_expertise)
 
 def manager_authentications(manager, now):
     """Handle pending authentication requests for a manager."""
@@ -181,83 +151,46 @@ def manager_authentications(manager, now):
                 ~AuthenticationRequest.expert_assignments.any(),
                 ~AuthenticationRequest.expert_assignments.any(ExpertAssignment.status != 3)
             )
-        )).all()
+        )).options(joinedload(AuthenticationRequest.item)).all()
 
     requests = []
-    all_experts_assignments = dict(db.session.query(
-        ExpertAssignment.expert_id, func.count(ExpertAssignment.request_id)
-    ).filter(ExpertAssignment.status.in_([1, 2])).group_by(ExpertAssignment.expert_id).all())
+    # Experts and their availability are loaded once and scored against every request
+    scorer = ExpertScorer(now, [req.request_id for req in pending_requests])
+    manager['availability'] = scorer.availability
 
     for req in pending_requests:
-        eligible_experts = User.query\
-            .filter(and_(
-                User.role == 2,
-                User.id != req.requester_id,
-                ~User.expert_assignments.any(
-                    ExpertAssignment.request_id == req.request_id
-                )
-            )).order_by(User.username.asc()).all()
         # Calculate AI expert recommendation for eligible experts
-        if eligible_experts:
-            scores = [(expert, calculate_expert_suitability(expert, req, all_experts_assignments, now))
-                      for expert in eligible_experts]
-            max_score = max(score for _, score in scores) if scores else 0
-            best_experts = [expert for expert, score in scores if score == max_score and score > 0]
-            # Pick randomly in case of tie
-            recommended_expert = choice(best_experts) if best_experts else None
-        else:
-            recommended_expert = None
+        scores = scorer.scores(req)
+        eligible_experts = [expert for expert, _ in scores]
+        best = best_experts(scores)
+        # Pick randomly in case of tie
+        recommended_expert = choice(best) if best else None
         requests.append((req, eligible_experts, recommended_expert))
     manager['requests'] = requests
 
 def manager_stats(manager, now):
     """Compute manager statistics."""
+    # Lifetime totals from the daily revenue rollup, kept up to date as auctions are finalised and paid
+    totals = db.session.query(
+        func.sum(RevenueDaily.projected),
+        func.sum(RevenueDaily.paid),
+        func.sum(RevenueDaily.base_commission),
+        func.sum(RevenueDaily.auth_commission),
+        func.sum(RevenueDaily.completed_count),
+        func.sum(RevenueDaily.paid_count)
+    ).one()
+    projected_revenue, paid_revenue, unauthenticated_commission, authenticated_commission, completed, paid = totals
+
     # Projected Revenue (sum of highest bids for all completed auctions, paid and unpaid)
-    completed_auctions = db.session.query(Item.item_id, func.max(Bid.bid_amount).label('highest_bid'))\
-        .join(Bid, Item.item_id == Bid.item_id)\
-        .filter(Item.auction_end < now)\
-        .group_by(Item.item_id)\
-        .subquery()
-    projected_revenue = db.session.query(func.sum(completed_auctions.c.highest_bid)).scalar() or 0.0
-    manager['projected_revenue'] = projected_revenue
+    manager['projected_revenue'] = projected_revenue or 0.0
 
     # Paid Revenue (sum of highest bids for paid auctions only, status == 3)
-    paid_auctions = db.session.query(Item.item_id, func.max(Bid.bid_amount).label('highest_bid'))\
-        .join(Bid, Item.item_id == Bid.item_id)\
-        .filter(Item.auction_end < now, Item.status == 3)\
-        .group_by(Item.item_id)\
-        .subquery()
-    paid_revenue = db.session.query(func.sum(paid_auctions.c.highest_bid)).scalar() or 0.0
+    paid_revenue = float(paid_revenue or 0.0)
     manager['paid_revenue'] = paid_revenue
 
-    # Get all paid authenticated items
-    authenticated_items = db.session.query(paid_auctions.c.item_id)\
-        .select_from(paid_auctions)\
-        .join(AuthenticationRequest, AuthenticationRequest.item_id == paid_auctions.c.item_id)\
-        .filter(AuthenticationRequest.status == 2)\
-        .subquery()
-
-    # Get authenticated item commission
-    authenticated_commission = db.session.query(func.sum(paid_auctions.c.highest_bid * Item.auth_fee / 100))\
-        .select_from(paid_auctions)\
-        .join(Item, Item.item_id == paid_auctions.c.item_id)\
-        .filter(Item.item_id.in_(
-            db.session.query(authenticated_items.c.item_id)
-        ))\
-        .scalar() or 0.0
-
-    # Get unauthenticated item commission
-    unauthenticated_commission = db.session.query(func.sum(paid_auctions.c.highest_bid * Item.base_fee / 100))\
-        .select_from(paid_auctions)\
-        .join(Item, Item.item_id == paid_auctions.c.item_id)\
-        .filter(Item.item_id.notin_(
-            db.session.query(authenticated_items.c.item_id)
-        ))\
-        .scalar() or 0.0
-
-    paid_revenue = float(paid_revenue)
-    authenticated_commission = float(authenticated_commission)
-    unauthenticated_commission = float(unauthenticated_commission)
+    # Commission on paid items, at the authenticated fee for items with an approved authentication
+    authenticated_commission = float(authenticated_commission or 0.0)
+    unauthenticated_commission = float(unauthenticated_commission or 0.0)
 
     commission_income = authenticated_commission + unauthenticated_commission
     manager['commission_income'] = commission_income
@@ -270,52 +203,21 @@ def manager_stats(manager, now):
     manager['user_count'] = User.query.count()
 
     # Paid vs Total Completed Auctions
-    manager['paid_auctions_count'] = Item.query.filter(Item.auction_end < now, Item.status == 3).count()
-    manager['total_completed_auctions'] = Item.query.filter(Item.auction_end < now).count()
+    manager['paid_auctions_count'] = paid or 0
+    manager['total_completed_auctions'] = completed or 0
 
     # Revenue Data for Chart (1 week, 1 month, 6 months, both projected and paid)
-    manager['revenue_data'] = {
-        'week': {'projected': {'labels': [], 'values': []}, 'paid': {'labels': [], 'values': []}},
-        'month': {'projected': {'labels': [], 'values': []}, 'paid': {'labels': [], 'values': []}},
-        'six_months': {'projected': {'labels': [], 'values': []}, 'paid': {'labels': [], 'values': []}}
-    }
+    manager['revenue_data'] = revenue_chart_data(now)
+    return manager
+
+def revenue_buckets(now):
+    """The (chart, label, start, end) buckets of the revenue charts in display order."""
+    buckets = []
 
     # 1 Week (daily revenue for last 7 days)
     for i in range(6, -1, -1):
         start_date = (now - timedelta(days=i)).replace(hour=0, minute=0, second=0, microsecond=0)
-        end_date = start_date + timedelta(days=1)
-
-        # Projected (all completed auctions)
-        daily_projected_auctions = db.session.query(Item.item_id, func.max(Bid.bid_amount).label('highest_bid'))\
-            .join(Bid, Item.item_id == Bid.item_id)\
-            .filter(and_(
-                Item.auction_end >= start_date,
-                Item.auction_end < end_date,
-                Item.auction_end < now
-            ))\
-            .group_by(Item.item_id)\
-            .subquery()
-        daily_projected_revenue = db.session.query(func.sum(daily_projected_auctions.c.highest_bid)).scalar() or 0.0
-        daily_projected_revenue = float(daily_projected_revenue)
-
-        # Paid (status == 3)
-        daily_paid_auctions = db.session.query(Item.item_id, func.max(Bid.bid_amount).label('highest_bid'))\
-            .join(Bid, Item.item_id == Bid.item_id)\
-            .filter(and_(
-                Item.auction_end >= start_date,
-                Item.auction_end < end_date,
-                Item.auction_end < now,
-                Item.status == 3
-            ))\
-            .group_by(Item.item_id)\
-            .subquery()
-        daily_paid_revenue = db.session.query(func.sum(daily_paid_auctions.c.highest_bid)).scalar() or 0.0
-        daily_paid_revenue = float(daily_paid_revenue)
-
-        manager['revenue_data']['week']['projected']['values'].append(daily_projected_revenue)
-        manager['revenue_data']['week']['paid']['values'].append(daily_paid_revenue)
-        manager['revenue_data']['week']['projected']['labels'].append(start_date.strftime('%a'))
-        manager['revenue_data']['week']['paid']['labels'].append(start_date.strftime('%a'))
+        buckets.append(('week', start_date.strftime('%a'), start_date, start_date + timedelta(days=1)))
 
     # 1 Month (weekly revenue for last 4 weeks)
     # Get Monday of current week
@@ -325,77 +227,39 @@ def manager_stats(manager, now):
     for i in range(4):
         start_date = current_week_start - timedelta(days=7 * (3 - i))
         end_date = start_date + timedelta(days=7)
-        
-        # Projected (all completed auctions)
-        weekly_projected_auctions = db.session.query(Item.item_id, func.max(Bid.bid_amount).label('highest_bid'))\
-            .join(Bid, Item.item_id == Bid.item_id)\
-            .filter(and_(
-                Item.auction_end >= start_date,
-                Item.auction_end < end_date,
-                Item.auction_end < now
-            ))\
-            .group_by(Item.item_id)\
-            .subquery()
-        weekly_projected_revenue = db.session.query(func.sum(weekly_projected_auctions.c.highest_bid)).scalar() or 0.0
-        weekly_projected_revenue = float(weekly_projected_revenue)
-
-        # Paid (status == 3)
-        weekly_paid_auctions = db.session.query(Item.item_id, func.max(Bid.bid_amount).label('highest_bid'))\
-            .join(Bid, Item.item_id == Bid.item_id)\
-            .filter(and_(
-                Item.auction_end >= start_date,
-                Item.auction_end < end_date,
-                Item.auction_end < now,
-                Item.status == 3
-            ))\
-            .group_by(Item.item_id)\
-            .subquery()
-        weekly_paid_revenue = db.session.query(func.sum(weekly_paid_auctions.c.highest_bid)).scalar() or 0.0
-        weekly_paid_revenue = float(weekly_paid_revenue)
-
-        manager['revenue_data']['month']['projected']['values'].append(weekly_projected_revenue)
-        manager['revenue_data']['month']['paid']['values'].append(weekly_paid_revenue)
-
         week_label = f"{start_date.strftime('%d %b')} - {(end_date - timedelta(days=1)).strftime('%d %b')}"
-        manager['revenue_data']['month']['projected']['labels'].append(week_label)
-        manager['revenue_data']['month']['paid']['labels'].append(week_label)
+        buckets.append(('month', week_label, start_date, end_date))
 
     # 6 Months (monthly revenue for last 6 months)
     for i in range(5, -1, -1):
         start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0) - timedelta(days=i * 30)
-        end_date = start_date + timedelta(days=30)
-
-        # Projected (all completed auctions)
-        monthly_projected_auctions = db.session.query(Item.item_id, func.max(Bid.bid_amount).label('highest_bid'))\
-            .join(Bid, Item.item_id == Bid.item_id)\
-            .filter(and_(
-                Item.auction_end >= start_date,
-                Item.auction_end < end_date,
-                Item.auction_end < now
-            ))\
-            .group_by(Item.item_id)\
-            .subquery()
-        monthly_projected_revenue = db.session.query(func.sum(monthly_projected_auctions.c.highest_bid)).scalar() or 0.0
-        monthly_projected_revenue = float(monthly_projected_revenue)
-
-        # Paid (status == 3)
-        monthly_paid_auctions = db.session.query(Item.item_id, func.max(Bid.bid_amount).label('highest_bid'))\
-            .join(Bid, Item.item_id == Bid.item_id)\
-            .filter(and_(
-                Item.auction_end >= start_date,
-                Item.auction_end < end_date,
-                Item.auction_end < now,
-                Item.status == 3
-            ))\
-            .group_by(Item.item_id)\
-            .subquery()
-        monthly_paid_revenue = db.session.query(func.sum(monthly_paid_auctions.c.highest_bid)).scalar() or 0.0
-        monthly_paid_revenue = float(monthly_paid_revenue)
-
-        manager['revenue_data']['six_months']['projected']['values'].append(monthly_projected_revenue)
-        manager['revenue_data']['six_months']['paid']['values'].append(monthly_paid_revenue)
-        manager['revenue_data']['six_months']['projected']['labels'].append(start_date.strftime('%b'))
-        manager['revenue_data']['six_months']['paid']['labels'].append(start_date.strftime('%b'))
+        buckets.append(('six_months', start_date.strftime('%b'), start_date, start_date + timedelta(days=30)))
+
+    return buckets
+
+def revenue_chart_data(now):
+    """Projected and paid revenue of every chart bucket, from the daily revenue rollup."""
+    buckets = revenue_buckets(now)
+    daily = db.session.query(RevenueDaily.day, RevenueDaily.projected, RevenueDaily.paid).filter(
+        RevenueDaily.day >= min(start for _, _, start, _ in buckets).date(),
+        RevenueDaily.day <= now.date()
+    ).all()
+
+    revenue_data = {
+        chart: {'projected': {'labels': [], 'values': []}, 'paid': {'labels': [], 'values': []}}
+        for chart in ('week', 'month', 'six_months')
+    }
+    for chart, label, start, end in buckets:
+        # Buckets start and end at midnight so each one covers whole days, empty buckets total 0
+        in_bucket = [(projected, paid) for row_day, projected, paid in daily if start.date() <= row_day < end.date()]
+        totals = {
+            'projected': float(sum(projected or 0 for projected, _ in in_bucket)),
+            'paid': float(sum(paid or 0 for _, paid in in_bucket))
+        }
+        for series, total in totals.items():
+            revenue_data[chart][series]['labels'].append(label)
+            revenue_data[chart][series]['values'].append(total)
+    return revenue_data
 
 def handle_expert(now):
     """Handle the dashboard for an expert."""
@@ -424,25 +288,20 @@ def handle_expert(now):
 
 
 def handle_user(now):
-    """Handle the dashboard for a user."""
-    user = {}
-
-    # Get incomplete auctions sorted by auction_end ascending
-    incomplete_auctions = Item.query.filter_by(seller_id=current_user.id)\
-        .filter(Item.auction_end > now)\
+    """Handle the dashboard for a user.
+
+    The page takes the same few queries however many auctions the user has: one per list of
+    items, and one each for the watcher counts and the user's own bids. Prices and bid counts
+    come from the items' bid summary columns.
+    """
+    # Auctions the user is selling, running ones by soonest end then ended ones by latest end
+    auctions = Item.query.filter_by(seller_id=current_user.id)\
+        .options(selectinload(Item.authentication_requests))\
         .order_by(Item.auction_end.asc())\
         .all()
+    incomplete_auctions = [item for item in auctions if item.auction_end > now]
+    completed_auctions = [item for item in reversed(auctions) if item.auction_end <= now]
 
-    # Get completed auctions sorted by auction_end descending
-    completed_auctions = Item.query.filter_by(seller_id=current_user.id)\
-        .filter(Item.auction_end <= now)\
-        .order_by(Item.auction_end.desc())\
-        .all()
-
-    # Combine the results
-    user['auctions'] = incomplete_auctions + completed_auctions
-
-    # Get auctions the user has participated in (via bidding, winning or paying)
     # Bidding: any open auction (status == 1) where the user has at least one bid.
     bidding_items = (
         Item.query.join(Bid, Item.item_id == Bid.item_id)
@@ -452,33 +311,59 @@ def handle_user(now):
         .all()
     )
 
-    # Won: auctions that are finalized (status == 2) where the user is the winner.
-    won_items = (
-        Item.query.filter(Item.status == 2, Item.winning_bid.has(bidder_id=current_user.id))
+    # Won (status == 2) and paid (status == 3) auctions where the user is the winner.
+    finished_items = (
+        Item.query.filter(Item.status.in_([2, 3]), Item.winning_bid.has(bidder_id=current_user.id))
         .order_by(Item.auction_end.asc())
         .all()
     )
-    # Paid: auctions where the item is paid for (status == 3) and the user is the winner.
-    paid_items = (
-        Item.query.filter(Item.status == 3, Item.winning_bid.has(bidder_id=current_user.id))
-        .order_by(Item.auction_end.asc())
+
+    watched_items = Item.query.join(user_watched_items, user_watched_items.c.item_id == Item.item_id)\
+        .filter(user_watched_items.c.user_id == current_user.id)\
         .all()
-    )
 
-    user['participated_auctions'] = {
-        'bidding': bidding_items,
-        'won': won_items,
-        'paid': paid_items
-    }
+    item_ids = {item.item_id for item in auctions + bidding_items + finished_items + watched_items}
+    watcher_counts = dict(
+        db.session.query(user_watched_items.c.item_id, func.count())
+        .filter(user_watched_items.c.item_id.in_(item_ids))
+        .group_by(user_watched_items.c.item_id)
+        .all()
+    ) if item_ids else {}
+    # The user's highest bid on each auction they're bidding on
+    user_bids = dict(
+        db.session.query(Bid.item_id, func.max(Bid.bid_amount))
+        .filter(Bid.bidder_id == current_user.id, Bid.item_id.in_([item.item_id for item in bidding_items]))
+        .group_by(Bid.item_id)
+        .all()
+    ) if bidding_items else {}
 
     user_data = {
-        'auctions': user['auctions'],
-        'watched_items': current_user.watched_items.all() if hasattr(current_user, 'watched_items') else [],
-        'participated_auctions': user['participated_auctions']
+        'auctions': incomplete_auctions + completed_auctions,
+        'watched_items': watched_items,
+        'participated_auctions': {
+            'bidding': bidding_items,
+            'won': [item for item in finished_items if item.status == 2],
+            'paid': [item for item in finished_items if item.status == 3]
+        },
+        'watcher_counts': watcher_counts,
+        'user_bids': user_bids
     }
 
     return render_template('dashboard_user.html', user=user_data, now=now)
 
+@dashboard_page.route('/api/metrics', methods=['GET'])
+@login_required
+def metrics():
+    """Counters of this worker's statistics cache, bid update frames, WebSocket event queue and finalisation."""
+    if current_user.role != 3:
+        return jsonify({'error': 'Unauthorised'}), 403
+    return jsonify({
+        'stats_cache': stats_cache.metrics(),
+        'bid_broadcasts': bid_broadcaster.metrics(),
+        'emits': emitter.metrics(),
+        'finalisation': finalisation_metrics()
+    }), 200
+
 @dashboard_page.route('/api/users/<user_id>/role', methods=['PATCH'])
 @login_required
 def update_user_role(user_id):
@@ -528,27 +413,10 @@ def update_user_role(user_id):
     user.role = new_role
     user.updated_at = time
 
-    # Send notification to user whose role was changed
-    notification = Notification(
-        user_id=user.id,
-        message=f'Your role has been updated from {role_strings[old_role - 1]} to {role_strings[new_role - 1]}.',
-        notification_type=0,
-        created_at=time
-    )
-    db.session.add(notification)
-    db.session.commit()
-
-    # Send real-time notification
-    try:
-        socketio.emit('new_notification', {
-            'message': notification.message,
-            'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-        }, room=f'user_{user.secret_key}')
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
-
-    # Send email
-    send_notification_email(user, notification)
+    # Notify the user whose role was changed, committing the change with the notification
+    notify([notification_event(
+        user, 0, f'Your role has been updated from {role_strings[old_role - 1]} to {role_strings[new_role - 1]}.'
+    )])
 
     return jsonify({
         'message': 'Role updated successfully',
@@ -613,6 +481,7 @@ def assign_expert(request_id):
         expert_id=expert
     )
     db.session.add(assignment)
+    mark_chat_access_changed(authentication_request.request_id)
 
     # Create new message in the chat
     message = Message(
@@ -623,62 +492,21 @@ def assign_expert(request_id):
     )
     db.session.add(message)
 
-    # Send notification to expert and requester
-    notification_expert = Notification(
-        user_id=expert,
-        message=f'You have been assigned to authenticate an item.',
-        item_url=item.url,
-        item_title=item.title,
-        notification_type=4,
-        created_at=datetime.now()
-    )
-    db.session.add(notification_expert)
-
-    notification_requester = Notification(
-        user_id=authentication_request.requester_id,
-        message=f'An expert has been assigned to authenticate your item.',
-        item_url=item.url,
-        item_title=item.title,
-        notification_type=4,
-        created_at=datetime.now()
-    )
-    db.session.add(notification_requester)
-    db.session.commit()
-
-    # Send real-time notifications
-    try:
-        socketio.emit('new_notification', {
-            'message': notification_expert.message,
-            'item_url': notification_expert.item_url,
-            'created_at': notification_expert.created_at.strftime('%Y-%m-%d %H:%M')
-        }, room=f'user_{user.secret_key}')
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
-
-    try:
-        socketio.emit('new_notification', {
-            'message': notification_requester.message,
-            'item_url': notification_requester.item_url,
-            'created_at': notification_requester.created_at.strftime('%Y-%m-%d %H:%M')
-        }, room=f'user_{authentication_request.requester.secret_key}')
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
-
-    try:
-        socketio.emit('new_message', {
-            'message': 'Hi, I have been assigned to authenticate this item. To expedite the process, please provide any relevant information or documentation.',
-            'sender': user.username,
-            'sender_id': str(expert),
-            'sender_role': str(2),
-            'images': None,
-            'sent_at': message.sent_at.strftime('%H:%M - %d/%m/%Y')
-        }, room=authentication_request.url)
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
-
-    # Send emails
-    send_notification_email(user, notification_expert)
-    send_notification_email(authentication_request.requester, notification_requester)
+    # Notify the expert and requester, committing the assignment with the notifications
+    notify([
+        notification_event(user, 4, 'You have been assigned to authenticate an item.', item),
+        notification_event(authentication_request.requester_id, 4,
+                           'An expert has been assigned to authenticate your item.', item)
+    ])
+
+    emitter.emit('new_message', {
+        'message': 'Hi, I have been assigned to authenticate this item. To expedite the process, please provide any relevant information or documentation.',
+        'sender': user.username,
+        'sender_id': str(expert),
+        'sender_role': str(2),
+        'images': None,
+        'sent_at': message.sent_at.strftime('%H:%M - %d/%m/%Y')
+    }, room=authentication_request.url)
 
     return jsonify({
         'message': 'Assignment successful',
@@ -704,42 +532,25 @@ def auto_assign_expert(request_id):
             and_(ExpertAssignment.request_id == request_id, ExpertAssignment.status != 3)).first():
         return jsonify({'error': 'Request already assigned'}), 400
 
-    # Get eligible experts
-    eligible_experts = User.query\
-        .filter(and_(
-            User.role == 2,
-            User.id != auth_request.requester_id,
-            ~User.expert_assignments.any(ExpertAssignment.request_id == request_id)
-        )).all()
-    if not eligible_experts:
-        return jsonify({'error': 'No available experts'}), 400
-
-    # Calculate suitability scores
+    # Calculate suitability scores of the eligible experts, weighing their pending assignments
     now = datetime.now()
-
-    # Get number of pending assignments for each expert
-    all_experts_assignments = dict(db.session.query(
-        ExpertAssignment.expert_id, func.count(ExpertAssignment.request_id)
-    ).filter(ExpertAssignment.status == 1).group_by(ExpertAssignment.expert_id).all())
-
-    scores = [(expert, calculate_expert_suitability(expert, auth_request, all_experts_assignments, now))
-              for expert in eligible_experts]
-    max_score = max(score for _, score in scores)
-    best_experts = [expert for expert, score in scores if score == max_score and score > 0]
-    if not best_experts:
+    scorer = ExpertScorer(now, [auth_request.request_id], workload_statuses=(1,))
+    best = best_experts(scorer.scores(auth_request))
+    if not best:
         return jsonify({'error': 'No available experts'}), 400
     
-    best_expert_ids = set(expert.id for expert in best_experts)
+    best_expert_ids = set(expert.id for expert in best)
 
     # Preferentially pick the expert displayed in the recommendation
     if request.is_json and request.json.get('recommendation') and request.json.get('recommendation') in best_expert_ids:
         recommended_expert = User.query.filter_by(id=request.json['recommendation']).first()
     else:
-        recommended_expert = choice(best_experts)
+        recommended_expert = choice(best)
 
     # Assign the expert
     assignment = ExpertAssignment(request_id=request_id, expert_id=recommended_expert.id)
     db.session.add(assignment)
+    mark_chat_access_changed(auth_request.request_id)
 
     # Create message
     message = Message(
@@ -750,59 +561,22 @@ def auto_assign_expert(request_id):
     )
     db.session.add(message)
 
-    # Send notifications
-    notification_expert = Notification(
-        user_id=recommended_expert.id,
-        message=f'You have been assigned to authenticate {auth_request.item.title}.',
-        item_url=auth_request.item.url,
-        item_title=auth_request.item.title,
-        notification_type=4,
-        created_at=now
-    )
-    notification_requester = Notification(
-        user_id=auth_request.requester_id,
-        message=f'An expert has been assigned to authenticate your item: {auth_request.item.title}.',
-        item_url=auth_request.item.url,
-        item_title=auth_request.item.title,
-        notification_type=4,
-        created_at=now
-    )
-    db.session.add_all([notification_expert, notification_requester])
-    db.session.commit()
-
-    # Send real-time notifications and emails
-    try:
-        socketio.emit('new_notification', {
-            'message': notification_expert.message,
-            'item_url': notification_expert.item_url,
-            'created_at': notification_expert.created_at.strftime('%Y-%m-%d %H:%M')
-        }, room=f'user_{recommended_expert.secret_key}')
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
-
-    try:
-        socketio.emit('new_notification', {
-            'message': notification_requester.message,
-            'item_url': notification_requester.item_url,
-            'created_at': notification_requester.created_at.strftime('%Y-%m-%d %H:%M')
-        }, room=f'user_{auth_request.requester.secret_key}')
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
-
-    try:
-        socketio.emit('new_message', {
-            'message': message.message_text,
-            'sender': recommended_expert.username,
-            'sender_id': str(recommended_expert.id),
-            'sender_role': str(2),
-            'images': None,
-            'sent_at': message.sent_at.strftime('%H:%M - %d/%m/%Y')
-        }, room=auth_request.url)
-    except Exception as e:
-        print(f'SocketIO Error: {e}')
-
-    send_notification_email(recommended_expert, notification_expert)
-    send_notification_email(auth_request.requester, notification_requester)
+    # Notify the expert and requester, committing the assignment with the notifications
+    item = auth_request.item
+    notify([
+        notification_event(recommended_expert, 4, f'You have been assigned to authenticate {item.title}.', item),
+        notification_event(auth_request.requester_id, 4,
+                           f'An expert has been assigned to authenticate your item: {item.title}.', item)
+    ])
+
+    emitter.emit('new_message', {
+        'message': message.message_text,
+        'sender': recommended_expert.username,
+        'sender_id': str(recommended_expert.id),
+        'sender_role': str(2),
+        'images': None,
+        'sent_at': message.sent_at.strftime('%H:%M - %d/%m/%Y')
+    }, room=auth_request.url)
 
     return jsonify({
         'message': 'Expert auto-assigned successfully',
@@ -824,118 +598,70 @@ def bulk_auto_assign_experts():
     if not isinstance(request_ids, list):
         return jsonify({'error': 'Request IDs must be a list'}), 400
 
-    now = datetime.now()
+    max_per_expert = request.json.get('max_per_expert', MAX_BATCH_ASSIGNMENTS)
+    if not isinstance(max_per_expert, int) or isinstance(max_per_expert, bool) or \
+            not 1 <= max_per_expert <= BATCH_ASSIGNMENT_LIMIT:
+        return jsonify({'error': f'Maximum per expert must be between 1 and {BATCH_ASSIGNMENT_LIMIT}'}), 400
 
-    # Get number of pending assignments for each expert
-    all_experts_assignments = dict(db.session.query(
-        ExpertAssignment.expert_id, func.count(ExpertAssignment.request_id)
-    ).filter(ExpertAssignment.status == 1).group_by(ExpertAssignment.expert_id).all())
-
-    assignments_made = []
-    for request_id in request_ids:
-        auth_request = db.session.query(AuthenticationRequest).filter_by(request_id=request_id).first()
-        if not auth_request or auth_request.status != 1 or ExpertAssignment.query.filter(
-                and_(ExpertAssignment.request_id == request_id, ExpertAssignment.status != 3)).first():
-            continue
-
-        eligible_experts = User.query\
-            .filter(and_(
-                User.role == 2,
-                User.id != auth_request.requester_id,
-                ~User.expert_assignments.any(ExpertAssignment.request_id == request_id)
-            )).all()
-        if not eligible_experts:
-            continue
-
-        scores = [(expert, calculate_expert_suitability(expert, auth_request, all_experts_assignments, now))
-                  for expert in eligible_experts]
-        max_score = max(score for _, score in scores)
-        best_experts = [expert for expert, score in scores if score == max_score and score > 0]
-        if not best_experts:
-            continue
-        recommended_expert = choice(best_experts)
-
-        assignment = ExpertAssignment(request_id=request_id, expert_id=recommended_expert.id)
-        db.session.add(assignment)
-
-        message = Message(
-            authentication_request_id=request_id,
-            sender_id=recommended_expert.id,
-            message_text='Hi, I have been assigned to authenticate this item. To expedite the process, please provide any relevant information or documentation.',
-            sent_at=now
-        )
-        db.session.add(message)
-
-        notification_expert = Notification(
-            user_id=recommended_expert.id,
-            message=f'You have been assigned to authenticate {auth_request.item.title}.',
-            item_url=auth_request.item.url,
-            item_title=auth_request.item.title,
-            notification_type=4,
-            created_at=now
-        )
-        notification_requester = Notification(
-            user_id=auth_request.requester_id,
-            message=f'An expert has been assigned to authenticate your item: {auth_request.item.title}.',
-            item_url=auth_request.item.url,
-            item_title=auth_request.item.title,
-            notification_type=4,
-            created_at=now
-        )
-        db.session.add_all([notification_expert, notification_requester])
-
-        # Update workload
-        all_experts_assignments[recommended_expert.id] = all_experts_assignments.get(recommended_expert.id, 0) + 1
-        assignments_made.append({'request_id': request_id, 'expert_id': recommended_expert.id})
+    now = datetime.now()
 
-    db.session.commit()
+    # Pending requests without an active assignment
+    auth_requests = AuthenticationRequest.query.filter(
+        AuthenticationRequest.request_id.in_(request_ids),
+        AuthenticationRequest.status == 1,
+        ~AuthenticationRequest.expert_assignments.any(ExpertAssignment.status != 3)
+    ).options(joinedload(AuthenticationRequest.item)).order_by(AuthenticationRequest.request_id).all()
+
+    # Solve the whole batch at once, spreading it over the experts rather than piling onto the best one
+    scorer = ExpertScorer(now, [req.request_id for req in auth_requests], workload_statuses=(1,))
+    matches = solve_assignments(scorer, auth_requests, max_per_expert)
+
+    message_text = ('Hi, I have been assigned to authenticate this item. To expedite the process, '
+                    'please provide any relevant information or documentation.')
+    assignments_made = [{'request_id': req.request_id, 'expert_id': expert.id} for req, expert, _ in matches]
+    events = []
+    for req, expert, _ in matches:
+        events.append(notification_event(
+            expert, 4, f'You have been assigned to authenticate {req.item.title}.', req.item
+        ))
+        events.append(notification_event(
+            req.requester_id, 4, f'An expert has been assigned to authenticate your item: {req.item.title}.', req.item
+        ))
 
-    # Send notifications
-    for assignment in assignments_made:
-        expert = db.session.get(User, assignment['expert_id'])
-        auth_request = db.session.get(AuthenticationRequest, assignment['request_id'])
-        
-        try:
-            socketio.emit('new_notification', {
-                'message': f'You have been assigned to authenticate {auth_request.item.title}',
-                'item_url': auth_request.item.url,
-                'created_at': now.strftime('%Y-%m-%d %H:%M')
-            }, room=f'user_{expert.secret_key}')
-        except Exception as e:
-            print(f'SocketIO Error: {e}')
-
-        try:
-            socketio.emit('new_notification', {
-                'message': f'An expert has been assigned to authenticate your item: {auth_request.item.title}',
-                'item_url': auth_request.item.url,
-                'created_at': now.strftime('%Y-%m-%d %H:%M')
-            }, room=f'user_{auth_request.requester.secret_key}')
-        except Exception as e:
-            print(f'SocketIO Error: {e}')
-
-        try:
-            socketio.emit('new_message', {
-                'message': 'Hi, I have been assigned to authenticate this item. To expedite the process, please provide any relevant information or documentation.',
-                'sender': expert.username,
-                'sender_id': str(expert.id),
-                'sender_role': str(2),
-                'images': None,
-                'sent_at': now.strftime('%H:%M - %d/%m/%Y')
-            }, room=auth_request.url)
-        except Exception as e:
-            print(f'SocketIO Error: {e}')
-
-        send_notification_email(expert, Notification(
-            user_id=expert.id, message=f'You have been assigned to authenticate {auth_request.item.title}.',
-            item_url=auth_request.item.url, item_title=auth_request.item.title, notification_type=4, created_at=now))
-
-        send_notification_email(auth_request.requester, Notification(
-            user_id=auth_request.requester_id, message=f'An expert has been assigned to authenticate your item: {auth_request.item.title}.',
-            item_url=auth_request.item.url, item_title=auth_request.item.title, notification_type=4, created_at=now))
+    try:
+        if matches:
+            db.session.execute(insert(ExpertAssignment), [
+                {'request_id': req.request_id, 'expert_id': expert.id, 'status': 1, 'assigned_date': now}
+                for req, expert, _ in matches
+            ])
+            db.session.execute(insert(Message), [
+                {'authentication_request_id': req.request_id, 'sender_id': expert.id,
+                 'message_text': message_text, 'sent_at': now}
+                for req, expert, _ in matches
+            ])
+            mark_chat_access_changed(*(req.request_id for req, _, _ in matches))
+        # Saves the notifications and commits the assignments with them
+        notify(events)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Bulk auto-assignment failed: {str(e)}")
+        return jsonify({'error': 'Bulk auto-assignment failed'}), 500
+
+    # Post the expert's first message in each request's chat
+    for req, expert, _ in matches:
+        emitter.emit('new_message', {
+            'message': message_text,
+            'sender': expert.username,
+            'sender_id': str(expert.id),
+            'sender_role': str(2),
+            'images': None,
+            'sent_at': now.strftime('%H:%M - %d/%m/%Y')
+        }, room=req.url)
 
     return jsonify({
         'message': 'Bulk auto-assignment successful',
-        'assignments': assignments_made
+        'assignments': assignments_made,
+        'total_suitability': round(sum(score for _, _, score in matches), 4)
     }), 200
 
 @dashboard_page.route('/api/update-base', methods=['PUT'])
@@ -957,16 +683,7 @@ def update_base():
     elif new_fee > 100:
         return jsonify({'error': 'Fee cannot be over 100'}), 400
 
-    base = ManagerConfig.query.filter_by(config_key='base_platform_fee').first()
-    if not base:
-        base = ManagerConfig(
-            config_key='base_platform_fee',
-            description='Base platform fee percentage for standard items'
-        )
-        db.session.add(base)
-
-    base.config_value = str(new_fee)
-    db.session.commit()
+    base = set_config(ManagerConfig.BASE_FEE_KEY, new_fee)
 
     return jsonify({
         'message': 'Change successful',
@@ -993,16 +710,7 @@ def update_auth():
     elif new_fee > 100:
         return jsonify({'error': 'Fee cannot be over 100'}), 400
 
-    auth = ManagerConfig.query.filter_by(config_key='authenticated_platform_fee').first()
-    if not auth:
-        auth = ManagerConfig(
-            config_key='authenticated_platform_fee',
-            description='Platform fee percentage for authenticated items'
-        )
-        db.session.add(auth)
-
-    auth.config_value = str(new_fee)
-    db.session.commit()
+    auth = set_config(ManagerConfig.AUTHENTICATED_FEE_KEY, new_fee)
 
     return jsonify({
         'message': 'Change successful',
@@ -1029,16 +737,7 @@ def update_dur():
     elif new_dur > 365:
         return jsonify({'error': 'Duration cannot be over 1 year'}), 400
 
-    dur = ManagerConfig.query.filter_by(config_key='max_auction_duration').first()
-    if not dur:
-        dur = ManagerConfig(
-            config_key='max_auction_duration',
-            description='Maximum auction duration in days'
-        )
-        db.session.add(dur)
-
-    dur.config_value = str(new_dur)
-    db.session.commit()
+    dur = set_config(ManagerConfig.MAX_DURATION_KEY, new_dur)
 
     return jsonify({
         'message': 'Change successful',
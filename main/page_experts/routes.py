@@ -1,9 +1,16 @@
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from flask import render_template, redirect, url_for, flash, request
 from flask_login import current_user, login_required
 from ..models import ExpertAvailability, db
+from ..availability_utils import upsert_availability
 from . import expert_page
 
+# Hours an expert can be available between
+EARLIEST_START = time(8, 0)
+LATEST_END = time(20, 0)
+# Most weeks a weekly schedule can be saved for at once
+MAX_REPEAT_WEEKS = 26
+
 @expert_page.route('/availability', methods=['GET', 'POST'])
 @login_required
 def update_availability():
@@ -31,6 +38,14 @@ def update_availability():
         week_start = current_week_start
 
     if request.method == 'POST':
+        # Weeks the submitted schedule is saved for, this one and the following ones
+        repeat_weeks = request.form.get('repeat_weeks', 1, type=int)
+        if not 1 <= repeat_weeks <= MAX_REPEAT_WEEKS:
+            flash(f"A schedule can be repeated for at most {MAX_REPEAT_WEEKS} weeks.", "error")
+            repeat_weeks = 1
+
+        # Days with times, and days where only the status changes
+        timed_rows, status_rows = [], []
         for i in range(7):
             current_day = week_start + timedelta(days=i)
             start_time_str = request.form.get(f'day_{i}_start')
@@ -38,11 +53,6 @@ def update_availability():
             status_value = request.form.get(f'day_{i}_status')
             status = True if status_value == 'available' else False
 
-            # Retrieve the availability entry for the day if it exists
-            availability = ExpertAvailability.query.filter_by(
-                expert_id=current_user.id, day=current_day
-            ).first()
-
             # If times are provided, update or create the record with these times and status
             if start_time_str and end_time_str:
                 try:
@@ -52,40 +62,32 @@ def update_availability():
                     flash(f"Invalid time format for {current_day}.", "error")
                     continue
                 # Validate times between 08:00 and 20:00
-                if not (start_time >= datetime.strptime("08:00", "%H:%M").time()
-                        and end_time <= datetime.strptime("20:00", "%H:%M").time()):
+                if not (start_time >= EARLIEST_START and end_time <= LATEST_END):
                     flash(f"Availability for {current_day} must be between 08:00 and 20:00.", "error")
                     continue
-                if not availability:
-                    availability = ExpertAvailability(
-                        expert_id=current_user.id,
-                        day=current_day,
-                        start_time=start_time,
-                        end_time=end_time,
-                        status=status
-                    )
-                    db.session.add(availability)
-                else:
-                    availability.start_time = start_time
-                    availability.end_time = end_time
-                    availability.status = status
+                rows = timed_rows
             else:
                 # If times are not provided (likely because they're disabled), update only status
-                if availability:
-                    availability.status = status
-                else:
-                    default_start = datetime.strptime("08:00", "%H:%M").time()
-                    default_end = datetime.strptime("20:00", "%H:%M").time()
-                    availability = ExpertAvailability(
-                        expert_id=current_user.id,
-                        day=current_day,
-                        start_time=default_start,
-                        end_time=default_end,
-                        status=status
-                    )
-                    db.session.add(availability)
+                start_time, end_time = EARLIEST_START, LATEST_END
+                rows = status_rows
+
+            # Days without a submitted status, such as past ones, aren't repeated
+            for week in range(repeat_weeks if status_value else 1):
+                rows.append({
+                    'expert_id': current_user.id,
+                    'day': current_day + timedelta(weeks=week),
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'status': status
+                })
+
+        upsert_availability(timed_rows)
+        upsert_availability(status_rows, update=('status',))
         db.session.commit()
-        flash("Availability updated successfully.", "success")
+        if repeat_weeks > 1:
+            flash(f"Availability updated successfully for {repeat_weeks} weeks.", "success")
+        else:
+            flash("Availability updated successfully.", "success")
         # Redirect back to the same week view
         return redirect(url_for('expert_page.update_availability', week_start=week_start.strftime('%Y-%m-%d')))
 
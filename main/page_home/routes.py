@@ -1,22 +1,186 @@
-from flask import render_template, jsonify
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+from flask import render_template, jsonify, request
+from sqlalchemy import and_, or_, func, false
+from sqlalchemy.orm import joinedload, selectinload
 from . import home_page
-from ..models import Item, Category
+from ..models import Item, Category, AuthenticationRequest
+from ..search_utils import search_items
+
+# Number of auction cards rendered per page of the home listing
+PAGE_SIZE = 24
+
+# The highest bid, or the minimum price if there are no bids, as Item.current_price()
+CURRENT_PRICE = func.coalesce(Item.current_bid_amount, Item.minimum_price)
+
+# Sort orders of the listing as (expression, descending, cursor value parser) keys, ties go to the oldest item
+DEFAULT_SORT = 'ending-soonest'
+LISTING_SORTS = {
+    'ending-soonest': ((Item.auction_completed, False, bool), (Item.auction_end, False, datetime.fromisoformat)),
+    'ending-latest': ((Item.auction_end, True, datetime.fromisoformat),),
+    'price-low-high': ((CURRENT_PRICE, False, Decimal),),
+    'price-high-low': ((CURRENT_PRICE, True, Decimal),),
+    'title-a-z': ((func.lower(Item.title), False, str),)
+}
+
+def sort_keys(sort):
+    return LISTING_SORTS[sort] + ((Item.item_id, False, int),)
+
+def encode_cursor(sort, values):
+    """Encode the sort and its key values for the last item on a page into an opaque cursor."""
+    key = [sort] + [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(key, default=str).encode()).decode()
+
+def decode_cursor(cursor, sort=DEFAULT_SORT):
+    """Decode a cursor of the sort back into its key values, returns None if it is invalid."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        keys = sort_keys(sort)
+        if not isinstance(key, list) or key[:1] != [sort] or len(key) != len(keys) + 1:
+            return None
+        return tuple(parse(value) for (_, _, parse), value in zip(keys, key[1:]))
+    except (ValueError, TypeError, ArithmeticError, binascii.Error):
+        return None
+
+def equal_to(expression, value):
+    return expression.is_(value) if isinstance(value, bool) else expression == value
+
+def passes(expression, descending, value):
+    """Whether the expression sorts after the value, False sorting before True."""
+    if isinstance(value, bool):
+        return expression.is_(not value) if value == descending else false()
+    return expression < value if descending else expression > value
+
+def after_key(keys, values):
+    """Rows sorting after the key values, those passing one key with every key before it equal."""
+    conditions = []
+    for i, (expression, descending, _) in enumerate(keys):
+        equal = [equal_to(key[0], value) for key, value in zip(keys[:i], values)]
+        conditions.append(and_(*equal, passes(expression, descending, values[i])))
+    return or_(*conditions)
+
+def get_listing_filters(args):
+    """Read the listing filters from the query string."""
+    category_id = args.get('category', type=int)
+    # Statuses: 0 = All, 1 = Live, 2 = Ended
+    status = args.get('status', 0, type=int)
+    if status not in (0, 1, 2):
+        status = 0
+    authenticated = args.get('authenticated', '') in ('1', 'true')
+    return category_id, status, authenticated
+
+def get_listing_sort(args):
+    """Read the listing sort from the query string."""
+    sort = args.get('sort', DEFAULT_SORT)
+    return sort if sort in LISTING_SORTS else DEFAULT_SORT
+
+def get_listing_page(cursor=None, category_id=None, status=0, authenticated=False, limit=None, sort=DEFAULT_SORT):
+    """Return one page of the home listing and the cursor for the next page.
+
+    Items are ordered by the sort's keys then item_id and paged with a keyset, so each page
+    costs the same regardless of how many auctions have been listed. By default that is
+    (auction_completed, auction_end, item_id), which is answered from an index.
+    """
+    limit = limit or PAGE_SIZE
+    now = datetime.now()
+    query = Item.query.options(
+        joinedload(Item.category),
+        selectinload(Item.images),
+        selectinload(Item.authentication_requests)
+    )
+
+    # Filters are applied in SQL rather than hiding cards on the client
+    if category_id:
+        query = query.filter(Item.category_id == category_id)
+    if status == 1:
+        query = query.filter(Item.auction_end > now)
+    elif status == 2:
+        query = query.filter(Item.auction_end <= now)
+    if authenticated:
+        query = query.filter(Item.authentication_requests.any(AuthenticationRequest.status == 2))
+
+    # Continue after the last item of the previous page
+    keys = sort_keys(sort)
+    values = decode_cursor(cursor, sort) if cursor else None
+    if values:
+        query = query.filter(after_key(keys, values))
+
+    # Fetch one extra row to know whether another page exists, with its sort key for the cursor
+    rows = query.add_columns(*[expression for expression, _, _ in keys])\
+        .order_by(*[expression.desc() if descending else expression.asc() for expression, descending, _ in keys])\
+        .limit(limit + 1).all()
+    next_cursor = encode_cursor(sort, rows[limit - 1][1:]) if len(rows) > limit else None
+    return [row[0] for row in rows[:limit]], next_cursor
 
 @home_page.route('/')
 def index():
-    items = Item.query.order_by(Item.auction_completed.asc(), Item.auction_end.asc()).all()
+    category_id, status, authenticated = get_listing_filters(request.args)
+    sort = get_listing_sort(request.args)
+    items, next_cursor = get_listing_page(category_id=category_id, status=status, authenticated=authenticated,
+                                          sort=sort)
     categories = Category.query.order_by(Category.name).all()
     category_names = [category.name.upper() for category in categories if category.name
                       != 'Miscellaneous'] + ['TREASURES']
+    filtered = bool(category_id or status or authenticated)
+
+    return render_template('home.html', items=items, categories=categories, category_names=category_names,
+                           next_cursor=next_cursor, category_id=category_id, status=status,
+                           authenticated=authenticated, filtered=filtered, sort=sort)
+
+@home_page.route('/api/items')
+def list_items():
+    # Infinite scroll endpoint returning the next page of rendered auction cards
+    category_id, status, authenticated = get_listing_filters(request.args)
+    sort = get_listing_sort(request.args)
+    cursor = request.args.get('cursor')
+    if cursor and decode_cursor(cursor, sort) is None:
+        return jsonify({'error': 'Invalid cursor'}), 400
 
-    return render_template('home.html', items=items, categories=categories, category_names=category_names)
+    items, next_cursor = get_listing_page(cursor=cursor, category_id=category_id, status=status,
+                                          authenticated=authenticated, sort=sort)
+    return jsonify({
+        'html': render_template('auction_cards.html', items=items),
+        'count': len(items),
+        'next_cursor': next_cursor
+    })
 
 @home_page.route('/api/search')
-def search_items():
-    # This route isnt neccesary for client-side search but it's included in case we implement server-side search
-    items = Item.query.order_by(Item.auction_end.asc()).all()
-    return jsonify([{
-        'item_id': item.item_id,
-        'title': item.title,
-        'url': item.url
-    } for item in items])
+def search():
+    # Server-side full-text search with facets, used by the home page search bar
+    category_id, status, authenticated = get_listing_filters(request.args)
+    results = search_items(
+        query=request.args.get('q', ''),
+        category_id=category_id,
+        status=status,
+        authenticated=authenticated,
+        min_price=request.args.get('min_price', type=float),
+        max_price=request.args.get('max_price', type=float),
+        ending_soon=request.args.get('ending_soon', '') in ('1', 'true'),
+        page=request.args.get('page', 1, type=int),
+        per_page=request.args.get('per_page', PAGE_SIZE, type=int)
+    )
+
+    items = results['items']
+    response = {
+        'results': [{
+            'item_id': item.item_id,
+            'title': item.title,
+            'url': item.url,
+            'category': item.category.name,
+            'price': float(item.current_price()),
+            'auction_end': item.auction_end.isoformat()
+        } for item in items],
+        'total': results['total'],
+        'page': results['page'],
+        'per_page': results['per_page'],
+        'next_page': results['page'] + 1 if results['page'] * results['per_page'] < results['total'] else None,
+        'facets': results['facets']
+    }
+
+    # The home page renders results with the same cards as the listing
+    if request.args.get('cards') == '1':
+        response['html'] = render_template('auction_cards.html', items=items)
+    return jsonify(response)
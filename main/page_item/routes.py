@@ -9,8 +9,20 @@ from datetime import datetime
 import decimal
 from . import item_page
 from ..models import db, Item, Bid, User, AuthenticationRequest, logger, Notification
-from ..email_utils import send_notification_email
 from ..extensions import csrf
+from .. import bid_utils
+from ..revenue_utils import refresh_revenue_days
+from ..broadcast_utils import bid_broadcaster
+from ..presence_utils import presence
+
+# Response for each reason a bid can be rejected
+BID_REJECTIONS = {
+    bid_utils.NOT_FOUND: ('This auction no longer exists.', 404),
+    bid_utils.OWN_AUCTION: ('You cannot bid on your own auction.', 403),
+    bid_utils.ENDED: ('This auction has ended.', 400),
+    bid_utils.BELOW_MINIMUM: ('Your bid must be at least the minimum price.', 400),
+    bid_utils.TOO_LOW: ('Your bid must be higher than the current bid.', 400)
+}
 
 # SocketIO event handlers
 @socketio.on('join_auction')
@@ -21,6 +33,7 @@ def on_join(data):
     room = data.get('item_url')
     if room:
         join_room(room)
+        presence.join(room, request.sid)
 
 @socketio.on('leave')
 def on_leave(data):
@@ -28,6 +41,12 @@ def on_leave(data):
     room = data.get('item_url')
     if room:
         leave_room(room)
+        presence.leave(room, request.sid)
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    """Remove the user from the viewers of every room they were in."""
+    presence.disconnect(request.sid)
 
 @item_page.route('/<url>')
 def index(url):
@@ -55,19 +74,20 @@ def index(url):
         is_watching = item in current_user.watched_items.all()
 
     bids = item.bids[::-1]
-    suggested_bid = (item.highest_bid().bid_amount + decimal.Decimal('0.01')
-                     if item.highest_bid() else item.minimum_price)
+    suggested_bid = (item.current_bid_amount + decimal.Decimal('0.01')
+                     if item.current_bid_amount is not None else item.minimum_price)
 
     is_auction_over = datetime.now() >= item.auction_end
     is_winner = False
-    if current_user.is_authenticated and item.highest_bid() and item.highest_bid().bidder_id == current_user.id:
+    if current_user.is_authenticated and item.current_bidder_id == current_user.id:
         is_winner = True
     # show_payment is true when auction is over, user is the winner, and the item is not yet paid (status != 3)
     show_payment = is_auction_over and is_winner and (item.status != 3)
 
     return render_template('item.html', item=item, authentication=status, is_allowed=is_allowed,
                            suggested_bid=suggested_bid, bids=bids, show_payment=show_payment,
-                           is_auction_over=is_auction_over, stripe_publishable_key=current_app.config.get('STRIPE_PUBLISHABLE_KEY'), is_watching=is_watching)
+                           is_auction_over=is_auction_over, stripe_publishable_key=current_app.config.get('STRIPE_PUBLISHABLE_KEY'), is_watching=is_watching,
+                           viewers=presence.count(url))
 
 # Update the watch/unwatch routes to use a more reliable method for checking the relationship
 @item_page.route('/<url>/watch', methods=['POST'])
@@ -113,8 +133,7 @@ def unwatch_item(url):
 @item_page.route('/<url>/bid', methods=['POST'])
 @login_required
 def place_bid(url):
-    # Prevent race conditions by locking the item row for update
-    item = Item.query.with_for_update().filter_by(url=url).first_or_404()
+    item = Item.query.filter_by(url=url).first_or_404()
 
     # Prevent the seller from bidding on their own auction.
     if current_user.id == item.seller_id:
@@ -124,65 +143,42 @@ def place_bid(url):
         return jsonify({'error': 'This auction has ended.'}), 400
 
     try:
-        bid_amount = float(request.json.get('bid_amount'))
-        current_highest = item.highest_bid()
+        bid_amount = bid_utils.parse_bid_amount((request.json or {}).get('bid_amount'))
+
+        if bid_amount is None:
+            return jsonify({'error': 'Bid amount must be a number.'}), 400
 
         if not bid_amount:
             return jsonify({'error': 'Please enter a bid amount.'}), 400
 
-        if not isinstance(bid_amount, (int, float)):
-            return jsonify({'error': 'Bid amount must be a number.'}), 400
-
         if bid_amount < 0:
             return jsonify({'error': 'Bid amount must be a positive number.'}), 400
 
-        if bid_amount > 999999.00:
+        if bid_amount > bid_utils.MAX_BID:
             return jsonify({'error': 'Bid amount cannot exceed £999,999.'}), 400
 
-        if current_highest is None:
-            # No bids yet: bid must be at least the minimum price
-            if bid_amount < item.minimum_price:
-                return jsonify({'error': 'Your bid must be at least the minimum price.'}), 400
-        else:
-            # Current bid: new bid must be strictly greater than the current bid
-            if bid_amount <= current_highest.bid_amount:
-                return jsonify({'error': 'Your bid must be higher than the current bid.'}), 400
-
-        if bid_amount < item.minimum_price:
-            return jsonify({'error': 'Your bid must be at least the minimum price.'}), 400
-        
-        # Check for identical recent bids to prevent duplicate bids
-        conflicting_bid = Bid.query.filter(
-            Bid.item_id == item.item_id,
-            Bid.bid_amount >= bid_amount
-        ).first()
-        
-        if conflicting_bid:
-            return jsonify({'error': 'Please try again with a higher bid amount.'}), 409
-
-        new_bid = Bid(
-            item_id=item.item_id,
-            bidder_id=current_user.id,
-            bid_amount=bid_amount,
-            bid_time=datetime.now()
-        )
-        db.session.add(new_bid)
-        db.session.commit()
+        # Validation against the current bid and the insert happen as one atomic update
+        bid, reason = bid_utils.place_bid(item.item_id, current_user.id, bid_amount)
+        if reason:
+            error, status = BID_REJECTIONS[reason]
+            return jsonify({'error': error, 'reason': reason}), status
 
-        # Send bid update to the auction room
+        # Send bid update to the auction room, with other bids accepted within the broadcast window
         try:
-            socketio.emit('bid_update', {
+            bid_broadcaster.publish(url, {
+                'bid_id': bid['bid_id'],
                 'bid_userid': current_user.id,
                 'bid_username': current_user.username,
-                'bid_amount': bid_amount,
-                'bid_time': new_bid.bid_time.strftime('%Y-%m-%d %H:%M')
-            }, room=url)
+                'bid_amount': float(bid_amount),
+                'bid_time': bid['bid_time'].strftime('%Y-%m-%d %H:%M')
+            })
         except Exception as e:
             logger.error(f"Error sending bid update: {str(e)}")
 
         try:
-            if current_highest and current_highest.bidder_id != current_user.id:
-                previous_bidder = db.session.get(User, current_highest.bidder_id)
+            previous_bidder_id = bid['previous_bidder_id']
+            if previous_bidder_id and previous_bidder_id != current_user.id:
+                previous_bidder = db.session.get(User, previous_bidder_id)
                 item.notify_outbid(previous_bidder)
         except Exception as e:
             logger.error(f"Error sending notifications: {str(e)}")
@@ -193,220 +189,6 @@ def place_bid(url):
         print(f"Error placing bid: {str(e)}")
         return jsonify({'error': 'Error placing bid. Please try again.'}), 500
 
-def notify_outbid(self, user):
-    notification = Notification(
-        user_id=user.id,
-        message=f"You have been outbid on '{self.title}'.",
-        item_url=self.url,
-        item_title=self.title,
-        notification_type=1,
-        created_at=datetime.now()
-    )
-    db.session.add(notification)
-    db.session.commit()
-
-    # Send real-time notification
-    try:
-        from app import socketio
-        socketio.emit('new_notification', {
-            'id': notification.id,
-            'message': notification.message,
-            'item_url': notification.item_url,
-            'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-        }, room=f'user_{user.secret_key}')
-    except Exception as e:
-        logger.error(f"Failed to send notification: {e}")
-
-    # Send email
-    send_notification_email(user, notification)
-
-def notify_winner(self):
-    if not self.winning_bid:
-        return
-    
-    winner = db.session.get(User, self.winning_bid.bidder_id)
-    notification = Notification(
-        user_id=winner.id,
-        message=f"Congratulations! You won the auction for '{self.title}' with a bid of £{self.winning_bid.bid_amount}.",
-        item_url=self.url,
-        item_title=self.title,
-        notification_type=2,
-        created_at=datetime.now()
-    )
-    db.session.add(notification)
-    db.session.commit()
-
-    # Send real-time notification
-    from app import socketio
-    socketio.emit('new_notification', {
-        'id': notification.id,
-        'message': notification.message,
-        'item_url': notification.item_url,
-        'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-    }, room=f'user_{winner.secret_key}')
-
-    # Send email
-    send_notification_email(winner, notification)
-
-def notify_losers(self):
-    if not self.winning_bid:
-        return
-
-    # Get unique bidders excluding winner
-    bidders = set()
-    for bid in self.bids:
-        if bid.bidder_id != self.winning_bid.bidder_id:
-            bidders.add(bid.bidder_id)
-
-    for bidder_id in bidders:
-        bidder = db.session.get(User, bidder_id)
-        notification = Notification(
-            user_id=bidder.id,
-            message=f"The auction for '{self.title}' has ended. Unfortunately, you didn't win.",
-            item_url=self.url,
-            item_title=self.title,
-            notification_type=3,
-            created_at=datetime.now()
-        )
-        db.session.add(notification)
-        db.session.commit()
-
-        # Send real-time notification
-        from app import socketio
-        socketio.emit('new_notification', {
-            'id': notification.id,
-            'message': notification.message,
-            'item_url': notification.item_url,
-            'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-        }, room=f'user_{bidder.secret_key}')
-
-def notify_seller(self):
-    if self.winning_bid:
-        message = f"Your auction for '{self.title}' has ended. The item was sold to {self.winning_bid.bidder.username} for £{self.winning_bid.bid_amount}."
-        notification_type = 5
-    else:
-        message = f"Your auction for '{self.title}' has ended without any bids."
-        notification_type = 6
-
-    # Create and save the notification
-    notification = Notification(
-        user_id=self.seller_id,
-        message=message,
-        item_url=self.url,
-        item_title=self.title,
-        notification_type=notification_type,
-        created_at=datetime.now()
-    )
-    db.session.add(notification)
-    db.session.commit()
-
-    # Send real-time notification
-    from app import socketio
-    socketio.emit('new_notification', {
-        'message': notification.message,
-        'item_url': notification.item_url,
-        'id': notification.id,
-        'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
-    }, room=f'user_{self.seller.secret_key}')
-
-    send_notification_email(self.seller, notification)
-
-def check_ended_auctions():
-    # Check for auctions that have ended but don't have a winner yet.
-    finished_items = Item.query.filter(
-        Item.auction_end <= datetime.now(),
-        Item.winning_bid_id.is_(None),
-        Item.auction_completed.is_(False)
-    ).all()
-    for item in finished_items:
-        try:
-            logger.info(f"Finalising auction for item: {item.title}")
-            # finalise_auction() should update item.status to 2 (won)
-            item.finalise_auction()
-            highest_bid = item.highest_bid()
-            item.auction_completed = True
-            db.session.commit()
-
-            # Cancel any pending authentication requests
-            if item.authentication_requests and item.authentication_requests[0].status == 1:
-                item.authentication_requests[0].status = 4
-                # Send notification to the requester
-                notification_user = Notification(
-                    user_id=item.seller_id,
-                    message=f"Your authentication request for '{item.title}' has been cancelled as the auction has ended.",
-                    item_url=item.url,
-                    item_title=item.title,
-                    notification_type=4,
-                    created_at=datetime.now()
-                )
-                db.session.add(notification_user)
-                db.session.commit()
-
-                try:
-                    socketio.emit('new_notification', {
-                        'message': notification_user.message,
-                        'item_url': notification_user.item_url,
-                        'created_at': notification_user.created_at.strftime('%Y-%m-%d %H:%M')
-                    }, room=f'user_{item.seller.secret_key}')
-                except Exception as e:
-                    logger.error(f"Error sending new notification: {str(e)}")
-
-                # Send email
-                send_notification_email(item.seller, notification_user)
-
-                # Update the authentication room
-                try:
-                    socketio.emit('force_reload', {'status': 'Auction ended'}, room=item.authentication_requests[0].url)
-                except Exception as e:
-                    logger.error(f"Error sending force reload: {str(e)}")
-
-                # Send notification to the expert
-                if item.authentication_requests[0].expert_assignments:
-                    item.authentication_requests[0].expert_assignments[-1].status = 4
-
-                    notification_expert = Notification(
-                        user_id=item.authentication_requests[0].expert_assignments[-1].expert_id,
-                        message=f"The authentication request for '{item.title}' has been cancelled as the auction has ended.",
-                        item_url=item.url,
-                        item_title=item.title,
-                        notification_type=4,
-                        created_at=datetime.now()
-                    )
-                    db.session.add(notification_expert)
-                    db.session.commit()
-
-                    try:
-                        socketio.emit('new_notification', {
-                            'message': notification_expert.message,
-                            'item_url': notification_expert.item_url,
-                            'created_at': notification_expert.created_at.strftime('%Y-%m-%d %H:%M')
-                        }, room=f'user_{item.authentication_requests[0].expert_assignments[-1].expert.secret_key}')
-                    except Exception as e:
-                        logger.error(f"Error sending new notification: {str(e)}")
-
-                    # Send email
-                    send_notification_email(
-                        item.authentication_requests[0].expert_assignments[-1].expert, notification_expert)
-
-            # Notify the auction room of the auction ending
-            if highest_bid:
-                try:
-                    socketio.emit('auction_ended', {
-                        'winner': True,
-                        'winning_bidder_id': highest_bid.bidder.id,
-                        'winning_bidder_username': highest_bid.bidder.username,
-                        'winning_bid_amount': float(highest_bid.bid_amount)
-                    }, room=item.url)
-                except Exception as e:
-                    logger.error(f"Error sending auction ended notification: {str(e)}")
-            else:
-                try:
-                    socketio.emit('auction_ended', {'winner': False}, room=item.url)
-                except Exception as e:
-                    logger.error(f"Error sending auction ended notification: {str(e)}")
-        except Exception as e:
-            logger.error(f"Error finalising auction {item.item_id}: {e}")
-
 @item_page.route('/api/notifications/mark-read', methods=['POST'])
 @login_required
 def mark_notifications_read():
@@ -444,10 +226,10 @@ def clear_all_notifications():
 def create_payment_intent(url):
     stripe.api_key = current_app.config.get('STRIPE_SECRET_KEY')
     item = Item.query.filter_by(url=url).first_or_404()
-    amount = int(((item.highest_bid().bid_amount if item.highest_bid() else item.minimum_price) * 100))
+    amount = int(item.current_price() * 100)
 
     is_auction_over = datetime.now() >= item.auction_end
-    is_winner = current_user.is_authenticated and item.highest_bid() and item.highest_bid().bidder_id == current_user.id
+    is_winner = current_user.is_authenticated and item.current_bidder_id == current_user.id
     if not is_auction_over or not is_winner:
         flash("You are not authorised to access the payment page.", "danger")
         return redirect(url_for('item_page.index', url=url))
@@ -492,10 +274,11 @@ def mark_won(url):
     item = Item.query.filter_by(url=url).first_or_404()
     if datetime.now() < item.auction_end:
         return jsonify({'error': 'Auction is still active'}), 400
-    if not item.highest_bid() or item.highest_bid().bidder_id != current_user.id:
+    if not item.current_bidder_id or item.current_bidder_id != current_user.id:
         return jsonify({'error': 'You are not the winning bidder'}), 403
     item.locked = True
     item.status = 3
+    refresh_revenue_days([item.auction_end.date()])
     db.session.commit()
 
     # Notify the seller once the payment is successful
@@ -542,7 +325,7 @@ def create_checkout_session(url):
     item = Item.query.filter_by(url=url).first_or_404()
 
     is_auction_over = datetime.now() >= item.auction_end
-    is_winner = current_user.is_authenticated and item.highest_bid() and item.highest_bid().bidder_id == current_user.id
+    is_winner = current_user.is_authenticated and item.current_bidder_id == current_user.id
     if not is_auction_over or not is_winner:
         flash("You are not authorised to access the payment page.", "danger")
         return redirect(url_for('item_page.index', url=url))
@@ -579,7 +362,7 @@ def create_checkout_session(url):
                     'product_data': {
                         'name': item.title,
                     },
-                    'unit_amount': int(((item.highest_bid().bid_amount if item.highest_bid() else item.minimum_price) * 100)),
+                    'unit_amount': int(item.current_price() * 100),
                 },
                 'quantity': 1,
             }],
@@ -627,6 +410,7 @@ def stripe_webhook():
             if item:
                 item.locked = True
                 item.status = 3
+                refresh_revenue_days([item.auction_end.date()])
                 db.session.commit()
                 # Notify seller about successful payment
                 item.notify_payment()
@@ -1,7 +1,9 @@
 from datetime import date, datetime, timedelta
-from flask import render_template, redirect, url_for, flash
+from flask import render_template, redirect, request, url_for, flash
 from flask_login import current_user, login_required
-from ..models import User, ExpertAvailability, Category
+from sqlalchemy.orm import selectinload
+from ..models import User, Category, ExpertCategory
+from ..availability_utils import AvailabilityIndex
 from . import manager_page
 
 @manager_page.route('/expert-availability')
@@ -27,23 +29,26 @@ def expert_availability():
     current_time = datetime.now().time()
     current_slot = current_time.replace(minute=0, second=0, microsecond=0)
 
-    # Get all experts (users with role 2)
-    experts = User.query.filter_by(role=2).order_by(User.username.asc()).all()
-
-    # For daily view: get each expert's availability for today
-    daily_availability = {}
-    for expert in experts:
-        record = ExpertAvailability.query.filter_by(expert_id=expert.id, day=today).first()
-        daily_availability[expert.id] = record
+    # Get all experts (users with role 2), only those in the category if one is selected
+    selected_category = request.args.get('category', type=int)
+    experts = User.query.filter_by(role=2)
+    if selected_category:
+        experts = experts.filter(User.expert_categories.any(ExpertCategory.category_id == selected_category))
+    experts = experts.options(selectinload(User.expert_categories)).order_by(User.username.asc()).all()
 
     # For weekly view: list of days from today to today+6 days
     days = [today + timedelta(days=i) for i in range(7)]
+
+    # Every listed expert's availability for the week, loaded at once
+    expert_ids = [expert.id for expert in experts] if selected_category else None
+    availability = AvailabilityIndex(days[0], days[-1], expert_ids)
+
+    # For daily view: get each expert's availability for today
+    daily_availability = {expert.id: availability.record(expert.id, today) for expert in experts}
+
     weekly_availability = {}
     for expert in experts:
-        weekly_availability[expert.id] = {}
-        for d in days:
-            rec = ExpertAvailability.query.filter_by(expert_id=expert.id, day=d).first()
-            weekly_availability[expert.id][d] = rec.status if rec else False
+        weekly_availability[expert.id] = {d: availability.available_on(expert.id, d) for d in days}
 
     categories = Category.query.all()
 
@@ -58,5 +63,6 @@ def expert_availability():
         current_time=current_time,
         current_slot=current_slot,
         timedelta=timedelta,
-        categories=categories
+        categories=categories,
+        selected_category=selected_category
     )
@@ -0,0 +1,247 @@
+"""Track who is in each Socket.IO room and tell the room how many are viewing it.
+
+Counts are kept in process, or in Redis when Socket.IO events are shared through it so every
+worker sees the same viewers. Changes are announced to the room as viewer_count events at most
+once per interval, a burst of joins and leaves ends in one announcement of the final count.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from .emit_utils import emitter
+
+logger = logging.getLogger(__name__)
+
+# Seconds between viewer_count events to one room
+DEFAULT_INTERVAL = 2
+# Seconds a connection shared through Redis is counted after its worker last refreshed it
+HEARTBEAT_TTL = 60
+
+class MemoryPresence:
+    """Connections in each room of this process."""
+
+    def __init__(self):
+        self.rooms = {}
+        # Rooms of each connection, to leave them all on disconnect
+        self.sids = {}
+        self.lock = threading.Lock()
+
+    def join(self, room, sid):
+        with self.lock:
+            self.rooms.setdefault(room, set()).add(sid)
+            self.sids.setdefault(sid, set()).add(room)
+
+    def leave(self, room, sid):
+        with self.lock:
+            self.rooms.get(room, set()).discard(sid)
+            if not self.rooms.get(room):
+                self.rooms.pop(room, None)
+            self.sids.get(sid, set()).discard(room)
+            if not self.sids.get(sid):
+                self.sids.pop(sid, None)
+
+    def disconnect(self, sid):
+        """Leave every room of the connection and return them."""
+        with self.lock:
+            rooms = self.sids.get(sid, set()).copy()
+        for room in rooms:
+            self.leave(room, sid)
+        return rooms
+
+    def count(self, room):
+        with self.lock:
+            return len(self.rooms.get(room, ()))
+
+class RedisPresence:
+    """Connections in each room of every worker, as Redis sorted sets of sids by when they were last seen.
+
+    Each worker refreshes its own connections with heartbeat(), so those of a worker that stopped
+    without disconnecting them drop out of the counts after the TTL. A worker also records its
+    connections under its id, to remove the ones left by its previous run when it starts.
+    """
+
+    PREFIX = 'vintage-vault:presence:'
+    # Seconds the record of a worker's connections is kept after its last change or heartbeat
+    WORKER_EXPIRY = 24 * 60 * 60
+
+    def __init__(self, client, worker_id, ttl=HEARTBEAT_TTL, clock=time.time):
+        self.client = client
+        self.worker_key = self.PREFIX + 'worker:' + worker_id
+        self.ttl = ttl
+        self.clock = clock
+        # This worker's connections, to refresh and disconnect them
+        self.local = MemoryPresence()
+
+    @classmethod
+    def from_url(cls, url, worker_id, ttl=HEARTBEAT_TTL):
+        import redis
+        client = redis.Redis.from_url(url, socket_timeout=1, decode_responses=True)
+        client.ping()
+        return cls(client, worker_id, ttl)
+
+    def join(self, room, sid):
+        key = self.PREFIX + 'room:' + room
+        pipeline = self.client.pipeline()
+        pipeline.zadd(key, {sid: self.clock()}).expire(key, self.ttl)
+        pipeline.sadd(self.worker_key, f'{room}\n{sid}').expire(self.worker_key, self.WORKER_EXPIRY)
+        pipeline.execute()
+        self.local.join(room, sid)
+
+    def leave(self, room, sid):
+        self.local.leave(room, sid)
+        pipeline = self.client.pipeline()
+        pipeline.zrem(self.PREFIX + 'room:' + room, sid)
+        pipeline.srem(self.worker_key, f'{room}\n{sid}')
+        pipeline.execute()
+
+    def disconnect(self, sid):
+        rooms = self.local.disconnect(sid)
+        pipeline = self.client.pipeline()
+        for room in rooms:
+            pipeline.zrem(self.PREFIX + 'room:' + room, sid)
+            pipeline.srem(self.worker_key, f'{room}\n{sid}')
+        pipeline.execute()
+        return rooms
+
+    def count(self, room):
+        pipeline = self.client.pipeline()
+        pipeline.zremrangebyscore(self.PREFIX + 'room:' + room, '-inf', self.clock() - self.ttl)
+        pipeline.zcard(self.PREFIX + 'room:' + room)
+        return pipeline.execute()[-1]
+
+    def heartbeat(self):
+        """Mark this worker's connections as still there."""
+        now = self.clock()
+        with self.local.lock:
+            rooms = {room: list(sids) for room, sids in self.local.rooms.items()}
+        pipeline = self.client.pipeline()
+        for room, sids in rooms.items():
+            key = self.PREFIX + 'room:' + room
+            pipeline.zadd(key, dict.fromkeys(sids, now)).expire(key, self.ttl)
+        pipeline.expire(self.worker_key, self.WORKER_EXPIRY)
+        pipeline.execute()
+
+    def clear_worker(self):
+        """Remove the connections this worker left behind when it last stopped."""
+        pipeline = self.client.pipeline()
+        for entry in self.client.smembers(self.worker_key):
+            room, sid = entry.split('\n', 1)
+            pipeline.zrem(self.PREFIX + 'room:' + room, sid)
+        pipeline.delete(self.worker_key)
+        pipeline.execute()
+
+class PresenceTracker:
+    """Viewers of each room, announced to the room with throttled viewer_count events."""
+
+    def __init__(self, backend=None, interval=DEFAULT_INTERVAL, clock=time.monotonic):
+        self.configure(backend or MemoryPresence(), interval)
+        self.clock = clock
+
+    def configure(self, backend, interval=DEFAULT_INTERVAL):
+        self.backend = backend
+        self.interval = interval
+        # When each room was last told its count, and the rooms with an announcement waiting
+        self.announced = {}
+        self.scheduled = set()
+        self.lock = threading.Lock()
+
+    def join(self, room, sid):
+        self.update(self.backend.join, room, sid)
+
+    def leave(self, room, sid):
+        self.update(self.backend.leave, room, sid)
+
+    def disconnect(self, sid):
+        try:
+            rooms = self.backend.disconnect(sid)
+        except Exception as e:
+            logger.error(f"Presence update failed: {str(e)}")
+            return
+        for room in rooms:
+            self.changed(room)
+
+    def update(self, change, room, sid):
+        # Viewer counts must not stop users joining or leaving rooms
+        try:
+            change(room, sid)
+        except Exception as e:
+            logger.error(f"Presence update failed: {str(e)}")
+            return
+        self.changed(room)
+
+    def count(self, room):
+        """Viewers of the room, 0 if they can't be counted."""
+        try:
+            return self.backend.count(room)
+        except Exception as e:
+            logger.error(f"Presence count failed: {str(e)}")
+            return 0
+
+    def changed(self, room):
+        """Announce the room's count now, or once its interval has passed since the last one."""
+        from main import socketio
+        with self.lock:
+            if room in self.scheduled:
+                return
+            wait = self.announced.get(room, -self.interval) + self.interval - self.clock()
+            if wait > 0:
+                self.scheduled.add(room)
+            else:
+                self.announced[room] = self.clock()
+        if wait > 0:
+            socketio.start_background_task(self.announce_later, room, wait)
+        else:
+            self.announce(room)
+
+    def announce_later(self, room, wait):
+        from main import socketio
+        socketio.sleep(wait)
+        with self.lock:
+            self.scheduled.discard(room)
+            self.announced[room] = self.clock()
+        self.announce(room)
+
+    def announce(self, room):
+        viewers = self.count(room)
+        if not viewers:
+            # Nobody is left to tell
+            with self.lock:
+                if room not in self.scheduled:
+                    self.announced.pop(room, None)
+            return
+        emitter.emit('viewer_count', {'viewers': viewers}, room=room)
+
+
+# Viewers of the auction and authentication chat rooms
+presence = PresenceTracker()
+
+def default_worker_id():
+    """The host and process id, which a container restart keeps, otherwise set PRESENCE_WORKER_ID."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def send_heartbeats(backend):
+    """Refresh this worker's connections in Redis a few times per TTL."""
+    from main import socketio
+    while True:
+        socketio.sleep(backend.ttl / 3)
+        try:
+            backend.heartbeat()
+        except Exception as e:
+            logger.error(f"Presence heartbeat failed: {str(e)}")
+
+def init_presence(app):
+    """Share presence through Redis when it is configured, otherwise count in process."""
+    from main import socketio
+    backend = MemoryPresence()
+    url = app.config.get('REDIS_URL')
+    if url and url.startswith(('redis://', 'rediss://')):
+        try:
+            backend = RedisPresence.from_url(url, app.config.get('PRESENCE_WORKER_ID') or default_worker_id())
+            backend.clear_worker()
+            socketio.start_background_task(send_heartbeats, backend)
+        except Exception as e:
+            backend = MemoryPresence()
+            logger.error(f"Presence falling back to memory, Redis is unavailable: {str(e)}")
+    presence.configure(backend, app.config.get('VIEWER_COUNT_INTERVAL', DEFAULT_INTERVAL))
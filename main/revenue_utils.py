@@ -0,0 +1,67 @@
+"""Keep the daily revenue rollup used by the manager dashboard up to date.
+
+Each day's row is recalculated from the items that ended that day whenever one of them is
+finalised or paid, so the dashboard only reads a few pre-aggregated rows.
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+from sqlalchemy import and_, case, delete, exists, func, insert, or_, select
+from .models import db, Item, AuthenticationRequest, RevenueDaily
+from .cache_utils import mark_stats_changed
+
+logger = logging.getLogger(__name__)
+
+def daily_revenue(*conditions, now=None):
+    """SELECT of the rollup columns for each day, from the auctions ended before now."""
+    now = now or datetime.now()
+    day = func.date(Item.auction_end, type_=db.Date)
+    amount = func.coalesce(Item.current_bid_amount, 0)
+    paid = Item.status == 3
+    authenticated = exists().where(
+        AuthenticationRequest.item_id == Item.item_id,
+        AuthenticationRequest.status == 2
+    )
+    return select(
+        day.label('day'),
+        func.sum(amount).label('projected'),
+        func.sum(case((paid, amount), else_=0)).label('paid'),
+        func.sum(case((and_(paid, ~authenticated), amount * Item.base_fee / 100), else_=0)).label('base_commission'),
+        func.sum(case((and_(paid, authenticated), amount * Item.auth_fee / 100), else_=0)).label('auth_commission'),
+        func.count().label('completed_count'),
+        func.count(case((paid, 1))).label('paid_count')
+    ).where(Item.auction_end < now, *conditions).group_by(day)
+
+def refresh_revenue_days(days, now=None):
+    """Recalculate the rollup rows of the given days, in the caller's transaction."""
+    days = sorted(set(days))
+    if not days:
+        return
+    # Ranges rather than date(auction_end) so the auction_end index is used
+    starts = [datetime.combine(day, time.min) for day in days]
+    ended_on = or_(*(and_(Item.auction_end >= start, Item.auction_end < start + timedelta(days=1)) for start in starts))
+    rows = db.session.execute(daily_revenue(ended_on, now=now)).mappings().all()
+    db.session.execute(delete(RevenueDaily).where(RevenueDaily.day.in_(days)))
+    if rows:
+        db.session.execute(insert(RevenueDaily), [dict(row) for row in rows])
+    mark_stats_changed()
+
+def rebuild_revenue_rollup(now=None):
+    """Recalculate the whole rollup from the items table, returns the number of days."""
+    try:
+        rows = db.session.execute(daily_revenue(now=now)).mappings().all()
+        db.session.execute(delete(RevenueDaily))
+        if rows:
+            db.session.execute(insert(RevenueDaily), [dict(row) for row in rows])
+        mark_stats_changed()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logger.info(f"Rebuilt the revenue rollup for {len(rows)} days")
+    return len(rows)
+
+def ensure_revenue_rollup():
+    """Build the rollup if it is empty but auctions have already ended, e.g. after an upgrade."""
+    if RevenueDaily.query.first() is None and Item.query.filter(Item.auction_end < datetime.now()).first():
+        rebuild_revenue_rollup()
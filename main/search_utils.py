@@ -0,0 +1,194 @@
+"""Full-text search over auction items.
+
+SQLite uses an FTS5 table kept in sync with the items table by triggers. PostgreSQL uses GIN
+indexes over tsvector expressions, so both backends update the index as items are inserted or
+edited. flask rebuild-search-index repopulates the SQLite table if it has drifted.
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import Float, Integer, case, func, literal_column, or_, select, text
+from .models import db, Item, Category, AuthenticationRequest
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'items_fts'
+# Column weights for ranking matches: title, description, category name
+FTS_WEIGHTS = (10.0, 1.0, 5.0)
+# Auctions ending within this window count towards the ending soon facet
+ENDING_SOON = timedelta(hours=24)
+# Upper bounds of the price facet buckets, the last bucket is open ended
+PRICE_BUCKETS = [50, 100, 500, 1000]
+MAX_PER_PAGE = 50
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+        USING fts5(title, description, category, tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON items BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = new.item_id;
+        INSERT INTO {FTS_TABLE}(rowid, title, description, category)
+        VALUES (new.item_id, new.title, new.description,
+                (SELECT name FROM categories WHERE id = new.category_id));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, description, category_id
+        ON items BEGIN
+        UPDATE {FTS_TABLE} SET title = new.title, description = new.description,
+            category = (SELECT name FROM categories WHERE id = new.category_id)
+        WHERE rowid = old.item_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON items BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.item_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_category AFTER UPDATE OF name ON categories BEGIN
+        UPDATE {FTS_TABLE} SET category = new.name
+        WHERE rowid IN (SELECT item_id FROM items WHERE category_id = new.id);
+    END"""
+]
+
+POSTGRES_SCHEMA = [
+    # Replaced by ix_items_search_text, which still indexes items without a description
+    "DROP INDEX IF EXISTS ix_items_search",
+    """CREATE INDEX IF NOT EXISTS ix_items_search_text ON items
+        USING GIN (to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, '')))""",
+    """CREATE INDEX IF NOT EXISTS ix_categories_search ON categories
+        USING GIN (to_tsvector('english', name))"""
+]
+
+def init_search_index():
+    """Create the search index for the configured database backend."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_SCHEMA:
+            db.session.execute(text(statement))
+        # Rebuild if the index has drifted from the items table, e.g. after the tables were recreated.
+        # Edits made without the triggers aren't detected, flask rebuild-search-index repairs those
+        indexed = db.session.execute(text(f'SELECT COUNT(*), TOTAL(rowid) FROM {FTS_TABLE}')).one()
+        items = db.session.execute(text('SELECT COUNT(*), TOTAL(item_id) FROM items')).one()
+        if tuple(indexed) != tuple(items):
+            rebuild_search_index()
+    elif dialect == 'postgresql':
+        for statement in POSTGRES_SCHEMA:
+            db.session.execute(text(statement))
+    db.session.commit()
+
+def rebuild_search_index():
+    """Repopulate the SQLite search index from the items table, returns the number of items indexed.
+
+    PostgreSQL's expression indexes are kept up to date by the database, so nothing is done there.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return 0
+    db.session.execute(text(f'DELETE FROM {FTS_TABLE}'))
+    count = db.session.execute(text(f"""
+        INSERT INTO {FTS_TABLE}(rowid, title, description, category)
+        SELECT items.item_id, items.title, items.description, categories.name
+        FROM items LEFT JOIN categories ON categories.id = items.category_id
+    """)).rowcount
+    logger.info('Search index rebuilt')
+    return count
+
+def parse_terms(query):
+    """Split a search query into words, dropping any search syntax."""
+    return re.findall(r'\w+', (query or '').lower())[:10]
+
+def current_price():
+    """SQL expression for the current price of an item."""
+    return func.coalesce(Item.current_bid_amount, Item.minimum_price)
+
+def ranked_matches(terms):
+    """Return (item_id, rank) rows matching every term as a prefix, lower ranks are better."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return text(
+            f'SELECT rowid AS item_id, bm25({FTS_TABLE}, {weights}) AS rank '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match'
+        ).bindparams(match=match).columns(item_id=Integer, rank=Float).subquery()
+
+    # Same expressions as the GIN indexes so the planner can use them, with literals rather than parameters
+    tsquery = func.to_tsquery('english', ' & '.join(f'{term}:*' for term in terms))
+    empty = literal_column("''")
+    item_vector = func.to_tsvector(
+        'english', func.coalesce(Item.title, empty) + literal_column("' '") + func.coalesce(Item.description, empty)
+    )
+    category_vector = func.to_tsvector('english', Category.name)
+    # Category matches are ranked alongside text matches, weighted against the title as in SQLite
+    category_weight = FTS_WEIGHTS[2] / FTS_WEIGHTS[0]
+    rank = func.ts_rank(item_vector, tsquery) + category_weight * func.ts_rank(category_vector, tsquery)
+    return select(
+        Item.item_id.label('item_id'),
+        (-rank).label('rank')
+    ).join(Category, Category.id == Item.category_id)\
+        .where(or_(item_vector.op('@@')(tsquery), category_vector.op('@@')(tsquery)))\
+        .subquery()
+
+def search_items(query=None, category_id=None, status=0, authenticated=False, min_price=None,
+                 max_price=None, ending_soon=False, page=1, per_page=20):
+    """Search items, returning a page of ranked results with facet counts."""
+    now = datetime.now()
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    page = max(1, page)
+    price = current_price()
+    terms = parse_terms(query)
+
+    base = db.session.query(Item)
+    if terms:
+        matches = ranked_matches(terms)
+        base = base.join(matches, matches.c.item_id == Item.item_id)
+        order = [matches.c.rank.asc(), Item.auction_end.asc(), Item.item_id.asc()]
+    else:
+        order = [Item.auction_completed.asc(), Item.auction_end.asc(), Item.item_id.asc()]
+
+    if status == 1:
+        base = base.filter(Item.auction_end > now)
+    elif status == 2:
+        base = base.filter(Item.auction_end <= now)
+    if authenticated:
+        base = base.filter(Item.authentication_requests.any(AuthenticationRequest.status == 2))
+
+    # Each facet is counted with every filter applied except its own
+    category_filter = [Item.category_id == category_id] if category_id else []
+    price_filter = []
+    if min_price is not None:
+        price_filter.append(price >= min_price)
+    if max_price is not None:
+        price_filter.append(price <= max_price)
+    ending_filter = [Item.auction_end > now, Item.auction_end <= now + ENDING_SOON] if ending_soon else []
+
+    results = base.filter(*category_filter, *price_filter, *ending_filter)
+    total = results.count()
+    items = results.order_by(*order).offset((page - 1) * per_page).limit(per_page).all()
+
+    return {
+        'items': items,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'facets': {
+            'categories': category_facet(base.filter(*price_filter, *ending_filter)),
+            'price': price_facet(base.filter(*category_filter, *ending_filter), price),
+            'ending_soon': base.filter(*category_filter, *price_filter)
+            .filter(Item.auction_end > now, Item.auction_end <= now + ENDING_SOON).count()
+        }
+    }
+
+def category_facet(query):
+    """Count matching items per category."""
+    rows = query.join(Category, Category.id == Item.category_id)\
+        .with_entities(Category.id, Category.name, func.count(Item.item_id))\
+        .group_by(Category.id, Category.name)\
+        .order_by(Category.name.asc()).all()
+    return [{'id': category_id, 'name': name, 'count': count} for category_id, name, count in rows]
+
+def price_facet(query, price):
+    """Count matching items per price bucket."""
+    bucket = case(
+        *[(price < bound, index) for index, bound in enumerate(PRICE_BUCKETS)],
+        else_=len(PRICE_BUCKETS)
+    )
+    counts = dict(query.with_entities(bucket, func.count(Item.item_id)).group_by(bucket).all())
+    bounds = [0] + PRICE_BUCKETS + [None]
+    return [{'min': bounds[i], 'max': bounds[i + 1], 'count': counts.get(i, 0)}
+            for i in range(len(PRICE_BUCKETS) + 1)]
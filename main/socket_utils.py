@@ -0,0 +1,103 @@
+"""Share Socket.IO events between workers through a message queue.
+
+Each worker only holds the sockets connected to it. With a message queue every emit, including
+those from scheduled jobs outside a request, is published to the queue and each worker sends it
+to its own clients, so bid updates, auction results, notifications and chat messages reach
+clients of every worker.
+"""
+
+import logging
+import pickle
+import queue
+import threading
+import socketio as python_socketio
+
+logger = logging.getLogger(__name__)
+
+# Channel the workers publish their events on
+CHANNEL = 'vintage-vault-socketio'
+# Queue URL of the in-process stand-in for Redis
+MEMORY_QUEUE = 'memory://'
+
+class MemoryBus:
+    """Delivers each published message to every subscriber of its channel, within one process."""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = queue.Queue()
+        with self.lock:
+            self.subscribers.setdefault(channel, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, channel, subscription):
+        with self.lock:
+            if subscription in self.subscribers.get(channel, []):
+                self.subscribers[channel].remove(subscription)
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(channel, []))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+
+memory_bus = MemoryBus()
+
+class MemoryManager(python_socketio.PubSubManager):
+    """Client manager that passes events between the Socket.IO servers of one process, for tests.
+
+    Messages are pickled like the Redis manager does, so payloads that could not be sent to
+    another worker fail here too.
+    """
+
+    name = 'memory'
+
+    def __init__(self, channel=CHANNEL, write_only=False, logger=None, bus=memory_bus):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = bus
+        self.subscription = None if write_only else bus.subscribe(channel)
+
+    def _publish(self, data):
+        self.bus.publish(self.channel, pickle.dumps(data))
+
+    def _listen(self):
+        while True:
+            message = self.subscription.get()
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        """Stop listening, ending the listener thread."""
+        if self.subscription is not None:
+            self.bus.unsubscribe(self.channel, self.subscription)
+            self.subscription.put(None)
+
+def client_manager(url, channel=CHANNEL, write_only=False):
+    """The Socket.IO client manager for the message queue URL, None to keep clients in this process.
+
+    Redis URLs use python-socketio's Redis manager and memory:// the in-process stand-in.
+    """
+    if not url:
+        return None
+    if url == MEMORY_QUEUE:
+        return MemoryManager(channel=channel, write_only=write_only)
+    if url.startswith(('redis://', 'rediss://')):
+        return python_socketio.RedisManager(url, channel=channel, write_only=write_only)
+    raise ValueError(f"Unsupported Socket.IO message queue: {url}")
+
+def init_socketio(socketio, app):
+    """Initialise the WebSocket server, sharing events through Redis when it is configured."""
+    url = app.config.get('REDIS_URL')
+    try:
+        manager = client_manager(url)
+    except Exception as e:
+        manager = None
+        logger.error(f"Socket.IO events will only reach this worker's clients: {str(e)}")
+    # Always passed so a manager from an earlier app isn't reused
+    socketio.init_app(app, cors_allowed_origins='*', client_manager=manager)
+    if manager is not None:
+        logger.info(f"Socket.IO events are shared through {manager.name}")
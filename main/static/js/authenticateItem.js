@@ -347,6 +347,6 @@ $(document).ready(function() {
   
   // Leave the room when the page unloads
   $(window).on('beforeunload', function() {
-    window.globalSocket.emit('leave', { 'auth_url': url });
+    window.globalSocket.emit('leave_chat', { 'auth_url': url });
   });
 });
\ No newline at end of file
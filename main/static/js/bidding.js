@@ -183,8 +183,19 @@ $(document).ready(function() {
     });
   };
 
+  // Id of the latest bid shown, updates sent by different workers can arrive out of order
+  let latestBidId = 0;
+
   // Listen for bid updates
   window.globalSocket.on('bid_update', function(data) {
+    // Skip bids older than the one shown, so the price never goes back down
+    const bids = (data.bids || [data]).filter(bid => !(bid.bid_id <= latestBidId));
+    if (!bids.length) {
+      return;
+    }
+    data = bids[bids.length - 1];
+    latestBidId = Math.max(latestBidId, data.bid_id || 0);
+
     // Update the highest bid
     if (maxBid.length) {
       maxBid.text(`${parseFloat(data.bid_amount).toFixed(2)}`);
@@ -210,17 +221,20 @@ $(document).ready(function() {
       }
     }
 
-    const newBid = `
-      <li style="padding: 10px;">
-      <div class="bid-info-row">
-        ${data.bid_username}</strong> - £${parseFloat(data.bid_amount).toFixed(2)}
-        <small class='text-muted'>(${data.bid_time})</small>
-      </div>
-      </li>
-      <hr class="full-width-hr">
-    `;
+    // Bids accepted close together arrive in one update, oldest first
+    bids.forEach(function(bid) {
+      const newBid = `
+        <li style="padding: 10px;">
+        <div class="bid-info-row">
+          ${bid.bid_username}</strong> - £${parseFloat(bid.bid_amount).toFixed(2)}
+          <small class='text-muted'>(${bid.bid_time})</small>
+        </div>
+        </li>
+        <hr class="full-width-hr">
+      `;
 
-    bidHistory.prepend(newBid);
+      bidHistory.prepend(newBid);
+    });
 
     bidCount.html($(`<button href='#' class="bid-count btn btn-primary">${bidHistory.children().length / 2} bids</button>`));
     bidHistory.prop('start', bidHistory.children().length / 2);
@@ -260,6 +274,12 @@ $(document).ready(function() {
     }
   });
 
+  // Show how many users are viewing the auction live
+  window.globalSocket.on('viewer_count', function(data) {
+    $('#viewer-counter .viewer-count').text(data.viewers);
+    $('#viewer-counter').prop('hidden', !data.viewers);
+  });
+
   // Leave the auction room when the user navigates away
   $(window).on('beforeunload', function() {
     window.globalSocket.emit('leave', { 'item_url': itemURL });
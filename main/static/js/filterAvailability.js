@@ -37,7 +37,7 @@ document.addEventListener('DOMContentLoaded', function() {
   
   // Global filter states
   let availableNowFilterActive = false;
-  let selectedCategory = "";
+  let selectedCategory = categoryFilter ? categoryFilter.value : "";
   let searchTerm = "";
   
   // Function to calculate daily table height
@@ -237,11 +237,16 @@ document.addEventListener('DOMContentLoaded', function() {
     applyAllFilters();
   });
   
-  // Listen for category changes and update both tables
+  // Listen for category changes and reload both tables with only that category's experts
   if (categoryFilter) {
     categoryFilter.addEventListener('change', function() {
-      selectedCategory = categoryFilter.value;
-      applyAllFilters();
+      const params = new URLSearchParams(window.location.search);
+      if (categoryFilter.value) {
+        params.set('category', categoryFilter.value);
+      } else {
+        params.delete('category');
+      }
+      window.location.search = params.toString();
     });
   }
   
@@ -20,131 +20,136 @@ $(document).ready(function() {
     });
   }, 60000);
   
-  // Function to apply filters and sorting
-  function applyFiltersAndSort() {
-    const searchTerm = $('#search-bar').val().toLowerCase().trim();
+  // Show the "no results" message when the filters match no auctions
+  function updateNoResults() {
+    $('#no-results').toggleClass('d-none', $('.auction-grid-wrapper').length > 0);
+  }
+
+  // Build the query string for the server-side filters and sort
+  function listingParams() {
+    const params = new URLSearchParams();
     const categoryFilter = $('#category-filter').val();
     const typeFilter = $('#type-filter').val();
-    const authenticatedOnly = $('#authenticated-only').is(':checked');
     const sortOption = $('#sort-filter').val();
     
-    let items = $('.auction-grid-wrapper').get(); // Get all items as an array
-    let visibleItems = 0;
+    if (categoryFilter) params.set('category', categoryFilter);
+    // Always sent, the home page opens on live auctions while the APIs default to all of them
+    if (typeFilter) params.set('status', typeFilter);
+    if ($('#authenticated-only').is(':checked')) params.set('authenticated', '1');
+    // Searches stay in relevance order
+    if (sortOption && sortOption !== 'ending-soonest' && !searchTerm()) params.set('sort', sortOption);
+    return params;
+  }
 
-    $('#auction-type').text(typeFilter === "1" ? "Live Auctions" : typeFilter === "2" ? "Ended Auctions" : "All Auctions");
-    
-    // Filter items
-    items.forEach(function(item) {
-      const $item = $(item);
-      const title = $item.data('title').toLowerCase();
-      const category = $item.find('.category').data('category');
-      const auctionEndElement = $item.find('.countdown');
-      const isEnded = auctionEndElement.hasClass('countdown-ended');
-      const authStatus = $item.find('.authentication-status').data('authentication');
-      
-      // Type filter: 1 = Live Auctions, 2 = Ended Auctions
-      let passesTypeFilter = true;
-      if (typeFilter === "1") {
-        passesTypeFilter = !isEnded;
-      } else if (typeFilter === "2") {
-        passesTypeFilter = isEnded;
-      }
-      
-      // Category filter
-      let passesCategoryFilter = true;
-      if (categoryFilter && categoryFilter !== "") {
-        passesCategoryFilter = (category == categoryFilter);
-      }
-      
-      // Authentication filter, 2 = Authenticated
-      let passesAuthFilter = true;
-      if (authenticatedOnly) {
-        passesAuthFilter = (authStatus == 2);
-      }
-      
-      // Search term filter
-      let passesSearchFilter = true;
-      if (searchTerm !== "") {
-        passesSearchFilter = title.includes(searchTerm);
-      }
-      
-      // Show/hide based on all filters
-      if (passesTypeFilter && passesCategoryFilter && passesAuthFilter && passesSearchFilter) {
-        $item.css('display', '');
-        visibleItems++;
-      } else {
-        $item.css('display', 'none');
-      }
-    });
-    
-    // Only sort and rearrange if there are items to show
-    if (visibleItems > 0) {
-      // Sort visible items
-      items.sort(function(a, b) {
-        const $a = $(a);
-        const $b = $(b);
-        const isAVisible = $a.css('display') !== 'none';
-        const isBVisible = $b.css('display') !== 'none';
-        
-        // Prioritize visible items
-        if (isAVisible && !isBVisible) return -1;
-        if (!isAVisible && isBVisible) return 1;
-        if (!isAVisible && !isBVisible) return 0;
-        
-        // Both visible, apply sorting
-        switch (sortOption) {
-          case 'price-low-high':
-            return parseFloat($a.data('price')) - parseFloat($b.data('price'));
-          case 'price-high-low':
-            return parseFloat($b.data('price')) - parseFloat($a.data('price'));
-          case 'ending-soonest':
-            const isAEnded = $a.find('.countdown').hasClass('countdown-ended');
-            const isBEnded = $b.find('.countdown').hasClass('countdown-ended');
-            // If one is ended and the other isn't, ended goes to the bottom
-            if (isAEnded && !isBEnded) return 1;
-            if (!isAEnded && isBEnded) return -1;
-            // Both active or both ended, sort by end time ascending
-            return new Date($a.data('end')) - new Date($b.data('end'));
-          case 'ending-latest':
-            return new Date($b.data('end')) - new Date($a.data('end'));
-          case 'title-a-z':
-            return $a.data('title').localeCompare($b.data('title'));
-          default:
-            return 0;
+  // Searches are ranked by the search API and paged by number, the listing is paged by cursor
+  function searchTerm() {
+    return $('#search-bar').val().trim();
+  }
+
+  function pageUrl(next) {
+    const params = listingParams();
+    if (searchTerm()) {
+      params.set('q', searchTerm());
+      params.set('cards', '1');
+      if (next) params.set('page', next);
+      return '/api/search?' + params.toString();
+    }
+    if (next) params.set('cursor', next);
+    return '/api/items?' + params.toString();
+  }
+
+  // Fetch a page of auctions, replacing the listing when no page is given
+  let loadingPage = false;
+  let pendingReload = false;
+  function loadItems(next) {
+    const $loadMore = $('#load-more');
+    if (!$loadMore.length) return;
+    if (loadingPage) {
+      // Reload again once the current request finishes so the latest filters win
+      pendingReload = pendingReload || !next;
+      return;
+    }
+    loadingPage = true;
+
+    $.getJSON(pageUrl(next))
+      .done(function(data) {
+        const $cards = $($.parseHTML(data.html)).filter('.auction-grid-wrapper');
+        const nextPage = data.next_cursor || data.next_page || '';
+        if (next) {
+          $('#auction-container').append($cards);
+        } else {
+          $('#auction-container').html($cards);
+        }
+
+        $cards.find('.countdown').each(function() {
+          updateCountdown($(this));
+        });
+
+        $loadMore.data('cursor', nextPage);
+        $loadMore.toggleClass('d-none', !nextPage);
+
+        updateNoResults();
+        AOS.refresh();
+      })
+      .always(function() {
+        loadingPage = false;
+        if (pendingReload) {
+          pendingReload = false;
+          loadItems(null);
         }
       });
-      
-      // Re-append sorted items to container without affecting animation
-      const $container = $('#auction-container');
-      // Store the current scroll position
-      const scrollTop = $(window).scrollTop();
-      
-      // Detach all items
-      const $items = $('.auction-grid-wrapper').detach();
-      
-      // Re-append in sorted order
-      items.forEach(function(item) {
-        $container.append(item);
-      });
-      
-      // Restore scroll position to prevent jumps
-      $(window).scrollTop(scrollTop);
-    }
-    
-    // Display "no results" message as appropriate
-    if (visibleItems === 0) {
-      $('#no-results').removeClass('d-none');
-    } else {
-      $('#no-results').addClass('d-none');
+  }
+
+  // Reload the listing from the first page when a server-side filter changes
+  function reloadItems() {
+    const typeFilter = $('#type-filter').val();
+    $('#auction-type').text(typeFilter === "1" ? "Live Auctions" : typeFilter === "2" ? "Ended Auctions" : "All Auctions");
+    $('#sort-filter').prop('disabled', searchTerm() !== '');
+
+    // Keep the filters in the address bar so the page can be refreshed or shared, live is the default
+    const params = listingParams();
+    if (params.get('status') === '1') params.delete('status');
+    window.history.replaceState(null, '', params.toString() ? '/?' + params.toString() : '/');
+
+    if (!$('#load-more').length) {
+      window.location.reload();
+      return;
     }
+    loadItems(null);
+  }
+
+  // Infinite scroll, load the next page when the end of the listing is visible
+  const loadMoreElement = document.getElementById('load-more');
+  if (loadMoreElement && 'IntersectionObserver' in window) {
+    const observer = new IntersectionObserver(function(entries) {
+      entries.forEach(function(entry) {
+        const cursor = $(loadMoreElement).data('cursor');
+        if (entry.isIntersecting && cursor) {
+          loadItems(cursor);
+        }
+      });
+    }, { rootMargin: '400px' });
+    observer.observe(loadMoreElement);
   }
   
   // Event listeners for filters and sorting
-  $('#search-bar').on('input', applyFiltersAndSort);
-  $('#category-filter').on('change', applyFiltersAndSort);
-  $('#type-filter').on('change', applyFiltersAndSort);
-  $('#authenticated-only').on('change', applyFiltersAndSort);
-  $('#sort-filter').on('change', applyFiltersAndSort);
+  let searchTimer = null;
+  $('#search-bar').on('input', function() {
+    // Wait for the user to stop typing before searching
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(reloadItems, 250);
+  });
+  $('#category-filter').on('change', reloadItems);
+  $('#type-filter').on('change', reloadItems);
+  $('#authenticated-only').on('change', reloadItems);
+  $('#sort-filter').on('change', reloadItems);
+
+  // Open on the live auctions unless the address bar asks for others
+  if (!new URLSearchParams(window.location.search).has('status')) {
+    $('#type-filter').val('1');
+    $('#auction-type').text('Live Auctions');
+    loadItems(null);
+  }
   
   function updateCountdown(element) {
     const endTime = element.data('end');
@@ -311,9 +316,4 @@ $(document).ready(function() {
   
   window.addEventListener('scroll', reveal);
   reveal();
-  
-  // Set default to live auctions
-  $('#type-filter').val('1');
-  $('#auction-type').text('Live Auctions');
-  applyFiltersAndSort();
 });
\ No newline at end of file
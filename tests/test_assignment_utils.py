@@ -0,0 +1,171 @@
+"""Test the batched expert suitability scores."""
+
+import pytest
+import random
+from datetime import datetime, time, timedelta
+from itertools import permutations
+from main.models import (
+    db, User, Category, Item, AuthenticationRequest, ExpertAssignment, ExpertAvailability, ExpertCategory, Message,
+    Notification
+)
+from main.assignment_utils import ExpertScorer, best_experts, hungarian, solve_assignments
+from main.page_dashboard.routes import calculate_expert_suitability
+from tests.test_utils import common_setup_database, count_queries, login_as
+
+@pytest.fixture(scope="module")
+def scoring_data(app, common_setup_database):
+    """Experts with a mix of availability, categories and workloads, and requests ending at different times"""
+    with app.app_context():
+        now = datetime.now()
+        today = now.date()
+        requester = User.query.filter_by(username="regular_user").first()
+        categories = Category.query.order_by(Category.id).all()
+
+        # (availability as (days from today, start, end, status), categories, open assignments)
+        profiles = [
+            ([(0, time(0, 0), time(23, 59, 59), True)], [0], 0),
+            ([(0, time(23, 59, 59), time(23, 59, 59), True), (2, time(9), time(17), True)], [1], 1),
+            ([(1, time(9), time(17), True), (2, time(6), time(8), True)], [0, 1], 3),
+            ([(3, time(1), time(5), True)], [], 0),
+            ([(3, time(20), time(22), True), (5, time(9), time(17), True)], [0], 2),
+            ([(1, time(9), time(17), False)], [0], 0),
+            ([(-1, time(9), time(17), True)], [1], 5),
+            ([], [0], 0)
+        ]
+        items = [
+            Item(seller_id=requester.id, category_id=categories[index % 2].id, title=f"Scored item {index}",
+                 description="Scoring test", auction_start=now - timedelta(days=1),
+                 auction_end=datetime.combine(today + timedelta(days=days), time(hour)), minimum_price=10)
+            for index, (days, hour) in enumerate([(0, 23), (1, 12), (3, 2), (3, 10), (4, 0), (6, 12)])
+        ]
+        db.session.add_all(items)
+        db.session.flush()
+        requests = [AuthenticationRequest(item_id=item.item_id, requester_id=requester.id, status=1) for item in items]
+        db.session.add_all(requests)
+        db.session.flush()
+
+        for index, (slots, expertise, workload) in enumerate(profiles):
+            expert = User(username=f"scored_expert{index}", email=f"scored{index}@test.com", role=2)
+            expert.set_password("Password@123")
+            db.session.add(expert)
+            db.session.flush()
+            for days, start, end, status in slots:
+                db.session.add(ExpertAvailability(expert_id=expert.id, day=today + timedelta(days=days),
+                                                  start_time=start, end_time=end, status=status))
+            for category in expertise:
+                db.session.add(ExpertCategory(expert_id=expert.id, category_id=categories[category].id))
+            for assigned in range(workload):
+                db.session.add(ExpertAssignment(request_id=requests[assigned].request_id, expert_id=expert.id,
+                                                status=1))
+        db.session.commit()
+
+    yield now
+
+    with app.app_context():
+        ExpertCategory.query.delete()
+        db.session.commit()
+
+def test_scores_match_per_pair_calculation(app, scoring_data):
+    """Test every expert and request pair scores the same as calculate_expert_suitability"""
+    now = scoring_data
+    with app.app_context():
+        requests = AuthenticationRequest.query.all()
+        workloads = {}
+        for assignment in ExpertAssignment.query.filter(ExpertAssignment.status.in_([1, 2])):
+            workloads[assignment.expert_id] = workloads.get(assignment.expert_id, 0) + 1
+
+        scorer = ExpertScorer(now, [req.request_id for req in requests])
+        compared = set()
+        for req in requests:
+            for expert, score in scorer.scores(req):
+                assert score == calculate_expert_suitability(expert, req, workloads, now), \
+                    (expert.username, req.item.title)
+                compared.add(score)
+        # The data covers unavailable, partly and fully suitable experts
+        assert -1 in compared and len(compared) > 5
+
+def test_eligibility_excludes_requester_and_assigned(app, scoring_data):
+    """Test experts already assigned to a request aren't offered it again"""
+    with app.app_context():
+        req = AuthenticationRequest.query.order_by(AuthenticationRequest.request_id).first()
+        scorer = ExpertScorer(scoring_data, [req.request_id])
+        eligible = [expert.username for expert, _ in scorer.scores(req)]
+        assigned = {assignment.expert.username for assignment in req.expert_assignments}
+        assert assigned and not assigned & set(eligible)
+        assert eligible == sorted(eligible)
+
+def test_scoring_does_not_query_per_request(app, scoring_data):
+    """Test scores are computed from the data loaded when the scorer is created"""
+    with app.app_context():
+        requests = AuthenticationRequest.query.all()
+        for req in requests:
+            req.item
+        scorer = ExpertScorer(scoring_data, [req.request_id for req in requests])
+
+        with count_queries() as statements:
+            recommended = [best_experts(scorer.scores(req)) for req in requests]
+        assert not statements
+        assert all(recommended)
+
+def test_assign_updates_workload(app, scoring_data):
+    """Test an assignment made by the scorer lowers the expert's later scores"""
+    with app.app_context():
+        first, second = AuthenticationRequest.query.order_by(AuthenticationRequest.request_id.desc()).limit(2)
+        scorer = ExpertScorer(scoring_data, [first.request_id, second.request_id])
+        expert, score = max(scorer.scores(second), key=lambda pair: pair[1])
+        scorer.assign(expert, first.request_id)
+        assert dict(scorer.scores(second))[expert] == pytest.approx(score - 0.3 / 5)
+        assert expert not in dict(scorer.scores(first))
+
+def test_hungarian_finds_minimum_cost():
+    """Test the matching against every possible assignment of small random matrices"""
+    rng = random.Random(7)
+    for rows, columns in [(1, 1), (3, 3), (3, 5), (5, 6)]:
+        costs = [[rng.choice([0, -rng.random()]) for _ in range(columns)] for _ in range(rows)]
+        matching = hungarian(costs)
+        assert len(set(matching)) == rows
+        best = min(sum(costs[i][j] for i, j in enumerate(choice)) for choice in permutations(range(columns), rows))
+        assert sum(costs[i][j] for i, j in enumerate(matching)) == pytest.approx(best)
+
+def test_solver_spreads_batch_within_cap(app, scoring_data):
+    """Test the batch is shared between experts and scored at their growing workloads"""
+    with app.app_context():
+        requests = AuthenticationRequest.query.all()
+        scorer = ExpertScorer(scoring_data, [req.request_id for req in requests], workload_statuses=(1,))
+        matches = solve_assignments(scorer, requests, max_per_expert=1)
+
+        experts = [expert.id for _, expert, _ in matches]
+        assert len(experts) == len(set(experts))
+        for req, expert, score in matches:
+            assert expert.id in {candidate.id for candidate, _ in scorer.scores(req)}
+            assert score > 0
+
+        # A higher cap can only do as well or better
+        uncapped = solve_assignments(scorer, requests, max_per_expert=len(requests))
+        assert sum(score for *_, score in uncapped) >= sum(score for *_, score in matches) - 1e-9
+
+@login_as(role=3)
+def test_bulk_auto_assign_experts(client, scoring_data):
+    """Test the bulk endpoint assigns, messages and notifies in one go"""
+    with client.application.app_context():
+        request_ids = [req.request_id for req in AuthenticationRequest.query.all()]
+        messages, notifications = Message.query.count(), Notification.query.count()
+
+    response = client.post('/dashboard/api/bulk-auto-assign-experts',
+                           json={'request_ids': request_ids, 'max_per_expert': 2})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['assignments'] and data['total_suitability'] > 0
+
+    with client.application.app_context():
+        per_expert = {}
+        for assignment in data['assignments']:
+            per_expert[assignment['expert_id']] = per_expert.get(assignment['expert_id'], 0) + 1
+            assert db.session.query(ExpertAssignment).filter_by(**assignment).count() == 1
+        assert max(per_expert.values()) <= 2
+        assert Message.query.count() == messages + len(data['assignments'])
+        assert Notification.query.count() == notifications + 2 * len(data['assignments'])
+
+    response = client.post('/dashboard/api/bulk-auto-assign-experts',
+                           json={'request_ids': request_ids, 'max_per_expert': 0})
+    assert response.status_code == 400
@@ -3,6 +3,7 @@
 import pytest
 from flask import url_for
 from main.models import User, db
+from main.cache_utils import stats_cache
 from unittest.mock import patch
 from werkzeug.security import generate_password_hash, check_password_hash
 from tests.test_utils import *
@@ -113,6 +114,9 @@ def test_register_success(client, app, soup):
             db.session.delete(test_user)
         db.session.commit()
     
+    # The user count on the manager dashboard is recomputed after registering
+    stats_cache.get_or_compute('manager_stats', dict)
+
     # Send welcome notification
     with patch('main.models.User.send_welcome_notification'):
         response = register_user(
@@ -128,6 +132,7 @@ def test_register_success(client, app, soup):
         with app.app_context():
             user = User.query.filter_by(username="newuser").first()
             assert user is not None
+            assert stats_cache.backend.get('manager_stats') == (False, None)
             assert user.email == "newuser@test.com"
         
         # Check user is logged in after registration
@@ -499,7 +499,7 @@ def test_expert_accept_authentication(mock_socketio, client, setup_database):
         assert "authenticated" in notification.message.lower()
 
 @patch('main.page_authenticate_item.routes.socketio')
-@patch('main.page_authenticate_item.routes.send_notification_email')
+@patch('main.notification_utils.queue_emails')
 def test_expert_decline_authentication(mock_email, mock_socketio, client, setup_database):
     """Test expert declining an authentication request"""
     mock_socketio.emit = MagicMock()
@@ -0,0 +1,68 @@
+"""Test the expert availability index against scanning the availability records."""
+
+import pytest
+import random
+from datetime import date, datetime, time, timedelta
+from main.models import db, User, ExpertAvailability
+from main.availability_utils import AvailabilityIndex
+from tests.test_utils import common_setup_database
+
+@pytest.fixture(scope="module")
+def availability_data(app, common_setup_database):
+    """Experts with random slots over the next ten days"""
+    rng = random.Random(3)
+    with app.app_context():
+        today = date.today()
+        experts = []
+        for index in range(6):
+            expert = User(username=f"indexed_expert{index}", email=f"indexed{index}@test.com", role=2)
+            expert.set_password("Password@123")
+            db.session.add(expert)
+            db.session.flush()
+            experts.append(expert.id)
+            for day in rng.sample(range(-1, 10), rng.randint(0, 11)):
+                start = rng.randint(0, 22)
+                db.session.add(ExpertAvailability(
+                    expert_id=expert.id, day=today + timedelta(days=day),
+                    start_time=time(start), end_time=time(rng.randint(start + 1, 23)),
+                    status=rng.random() < 0.8))
+        db.session.commit()
+    return experts
+
+def test_index_matches_scanning_records(app, availability_data):
+    """Test every question is answered as a scan of the expert's records would"""
+    rng = random.Random(5)
+    with app.app_context():
+        today = date.today()
+        index = AvailabilityIndex(today)
+        records = ExpertAvailability.query.filter(ExpertAvailability.day >= today).all()
+
+        for _ in range(300):
+            expert_id = rng.choice(availability_data)
+            moment = datetime.combine(today + timedelta(days=rng.randint(0, 9)), time(rng.randint(0, 23), rng.choice([0, 30])))
+            auction_end = moment + timedelta(hours=rng.randint(0, 72))
+            available = [r for r in records if r.expert_id == expert_id and r.status]
+
+            assert index.available_at(expert_id, moment) == any(
+                r.day == moment.date() and r.start_time <= moment.time() < r.end_time for r in available)
+            assert index.available_later(expert_id, moment) == any(
+                r.day == moment.date() and moment.time() < r.start_time for r in available)
+            assert index.available_before(expert_id, auction_end, moment) == any(
+                moment.date() <= r.day < auction_end.date() or (
+                    r.day == auction_end.date() and r.start_time < (auction_end - timedelta(hours=3)).time())
+                for r in available)
+
+def test_index_window_and_records(app, availability_data):
+    """Test the index only holds its window and keeps the first record of each day for the grids"""
+    with app.app_context():
+        today = date.today()
+        index = AvailabilityIndex(today, today + timedelta(days=2), availability_data[:3])
+        for record in ExpertAvailability.query.order_by(ExpertAvailability.availability_id.desc()):
+            inside = record.expert_id in availability_data[:3] and today <= record.day <= today + timedelta(days=2)
+            first = ExpertAvailability.query.filter_by(expert_id=record.expert_id, day=record.day)\
+                .order_by(ExpertAvailability.availability_id).first()
+            if not inside:
+                assert index.record(record.expert_id, record.day) is None
+            else:
+                assert index.record(record.expert_id, record.day) == (first.day, first.start_time, first.end_time, first.status)
+                assert index.available_on(record.expert_id, record.day) == first.status
@@ -0,0 +1,49 @@
+"""Test bid updates to busy auction rooms are coalesced into frames."""
+
+from unittest.mock import MagicMock, patch
+from main.broadcast_utils import BidCoalescer
+
+def bid(amount, user_id=1):
+    return {'bid_userid': user_id, 'bid_username': f'user{user_id}', 'bid_amount': amount, 'bid_time': '2025-01-01 12:00'}
+
+def test_bids_within_window_share_one_frame():
+    """Test each room gets one frame with its latest bid and every bid of the window"""
+    coalescer = BidCoalescer(window=0.2)
+    with patch('main.socketio') as mock_socketio:
+        tasks = []
+        mock_socketio.start_background_task = MagicMock(side_effect=lambda task, *args: tasks.append((task, args)))
+        for amount in (10, 11, 12):
+            coalescer.publish('hot-item', bid(amount))
+        coalescer.publish('quiet-item', bid(5, user_id=2))
+
+        # One flush is scheduled per room, nothing is sent before the window closes
+        assert len(tasks) == 2
+        mock_socketio.emit.assert_not_called()
+        assert coalescer.metrics()['pending_rooms'] == 2
+
+        for task, args in tasks:
+            task(*args)
+        mock_socketio.sleep.assert_called_with(0.2)
+        frames = {call.kwargs['room']: call.args for call in mock_socketio.emit.call_args_list}
+        assert frames['hot-item'][0] == 'bid_update'
+        assert frames['hot-item'][1]['bid_amount'] == 12
+        assert [b['bid_amount'] for b in frames['hot-item'][1]['bids']] == [10, 11, 12]
+        assert frames['quiet-item'][1]['bids'] == [bid(5, user_id=2)]
+
+        # A bid after the window starts a new frame
+        coalescer.publish('hot-item', bid(13))
+        assert len(tasks) == 3
+
+    assert coalescer.metrics() == {
+        'window': 0.2, 'bids': 5, 'frames': 2, 'frames_saved': 2, 'largest_frame': 3, 'pending_rooms': 1
+    }
+
+def test_zero_window_sends_each_bid():
+    """Test bids are sent straight away without a window"""
+    coalescer = BidCoalescer(window=0)
+    with patch('main.socketio') as mock_socketio:
+        coalescer.publish('item', bid(10))
+        coalescer.publish('item', bid(11))
+        mock_socketio.start_background_task.assert_not_called()
+        assert [call.args[1]['bid_amount'] for call in mock_socketio.emit.call_args_list] == [10, 11]
+    assert coalescer.metrics()['frames_saved'] == 0
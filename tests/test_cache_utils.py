@@ -0,0 +1,93 @@
+"""Test the statistics cache and its invalidation."""
+
+import datetime
+from main.models import db, User, Item, Category
+from main.cache_utils import MemoryCache, StatsCache, stats_cache, init_stats_cache
+from main.revenue_utils import refresh_revenue_days
+from main.bid_utils import place_bid
+from main.auction_utils import finalise_ended_auctions
+from tests.test_utils import common_setup_database
+
+class FakeClock:
+    """Clock the test moves forward by hand"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_memory_cache_expires_and_evicts():
+    """Test entries expire after their time to live and the least recently used is evicted"""
+    clock = FakeClock()
+    cache = MemoryCache(max_entries=2, clock=clock)
+    cache.set('a', 1, ttl=10)
+    cache.set('b', 2, ttl=10)
+    assert cache.get('a') == (True, 1)
+
+    # 'b' is now the least recently used
+    cache.set('c', 3, ttl=10)
+    assert cache.get('b') == (False, None)
+    assert cache.get('c') == (True, 3)
+
+    clock.now = 10
+    assert cache.get('a') == (False, None)
+
+def test_stats_cache_counts_hits_and_misses():
+    """Test values are computed once until invalidated"""
+    cache = StatsCache(MemoryCache(), ttl=60)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'user_count': len(calls)}
+
+    assert cache.get_or_compute('stats', compute) == {'user_count': 1}
+    assert cache.get_or_compute('stats', compute) == {'user_count': 1}
+    cache.invalidate()
+    assert cache.get_or_compute('stats', compute) == {'user_count': 2}
+
+    metrics = cache.metrics()
+    assert (metrics['hits'], metrics['misses'], metrics['invalidations']) == (1, 2, 1)
+    assert metrics['hit_rate'] == 33.3
+
+def test_revenue_change_invalidates_after_commit(app):
+    """Test a rollup refresh clears the cache only once its transaction commits"""
+    with app.app_context():
+        stats_cache.get_or_compute('manager_stats', dict)
+        refresh_revenue_days([datetime.date.today()])
+        assert stats_cache.backend.get('manager_stats')[0]
+
+        db.session.commit()
+        assert stats_cache.backend.get('manager_stats') == (False, None)
+
+def test_bids_and_finalisation_invalidate(app, common_setup_database):
+    """Test an accepted bid and a finalised auction clear the cache, and a rejected bid doesn't"""
+    with app.app_context():
+        seller, bidder = User.query.order_by(User.id).limit(2).all()
+        now = datetime.datetime.now()
+        item = Item(seller_id=seller.id, category_id=Category.query.first().id, title='Stats item',
+                    description='Stats item', auction_start=now, auction_end=now + datetime.timedelta(hours=1),
+                    minimum_price=10)
+        db.session.add(item)
+        db.session.commit()
+
+        stats_cache.get_or_compute('manager_stats', dict)
+        assert place_bid(item.item_id, bidder.id, 5)[0] is None
+        assert stats_cache.backend.get('manager_stats')[0]
+        assert place_bid(item.item_id, bidder.id, 20)[0]
+        assert stats_cache.backend.get('manager_stats') == (False, None)
+
+        stats_cache.get_or_compute('manager_stats', dict)
+        assert finalise_ended_auctions(now=now + datetime.timedelta(hours=2), item_ids=[item.item_id]) == 1
+        assert stats_cache.backend.get('manager_stats') == (False, None)
+
+def test_unavailable_redis_falls_back_to_memory(app):
+    """Test the app keeps working with an in-process cache if Redis can't be reached"""
+    original = stats_cache.backend, stats_cache.ttl
+    app.config['REDIS_URL'] = 'redis://127.0.0.1:1/0'
+    try:
+        init_stats_cache(app)
+        assert stats_cache.metrics()['backend'] == 'memory'
+    finally:
+        app.config['REDIS_URL'] = None
+        stats_cache.configure(*original)
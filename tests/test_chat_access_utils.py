@@ -0,0 +1,101 @@
+"""Test who may join authentication chats is cached and dropped when the expert changes."""
+
+import pytest
+from datetime import datetime, timedelta
+from main.models import db, User, Item, Category, AuthenticationRequest, ExpertAssignment
+from main.chat_access_utils import ChatAccessCache, chat_access, mark_chat_access_changed
+from tests.test_utils import MockUser, common_setup_database, count_queries, logged_in_user
+
+@pytest.fixture
+def chat(app, common_setup_database):
+    """A pending request by the regular user assigned to the expert, returns its URL and the users."""
+    with app.app_context():
+        users = {user.username: user.id for user in User.query.all()}
+        now = datetime.now()
+        item = Item(seller_id=users['regular_user'], category_id=Category.query.first().id, title='Chat item',
+                    description='Chat item', auction_start=now, auction_end=now + timedelta(days=1), minimum_price=1)
+        db.session.add(item)
+        db.session.flush()
+        request = AuthenticationRequest(item_id=item.item_id, requester_id=users['regular_user'], status=1)
+        db.session.add(request)
+        db.session.flush()
+        db.session.add(ExpertAssignment(request_id=request.request_id, expert_id=users['expert_user'], status=1))
+        db.session.commit()
+        url = request.url
+    chat_access.clear()
+    yield url, users
+    chat_access.clear()
+
+def test_repeated_joins_are_cached(app, chat):
+    """Test the members are loaded once and unknown rooms are refused without an error"""
+    url, users = chat
+    cache = ChatAccessCache()
+    with app.app_context():
+        assert cache.allowed(url, MockUser(id=users['regular_user']))
+        with count_queries() as statements:
+            assert cache.allowed(url, MockUser(id=users['expert_user'], role=2))
+            assert cache.allowed(url, MockUser(id=users['manager_user'], role=3))
+            assert not cache.allowed(url, MockUser(id=-1))
+        assert statements == []
+
+        assert not cache.allowed('no-such-chat', MockUser(id=users['manager_user'], role=3))
+        assert not cache.allowed('no-such-chat', MockUser(id=users['manager_user'], role=3))
+    assert cache.loads == 2
+
+def test_reassignment_drops_expert_after_commit(app, chat):
+    """Test an expert giving up a request is refused once the change commits, and not if it rolls back"""
+    url, users = chat
+    expert = MockUser(id=users['expert_user'], role=2)
+    with app.app_context():
+        assert chat_access.allowed(url, expert)
+        request = AuthenticationRequest.query.filter_by(url=url).first()
+
+        request.expert_assignments[-1].status = 3
+        mark_chat_access_changed(request.request_id)
+        db.session.rollback()
+        assert url in chat_access.rooms
+
+        request.expert_assignments[-1].status = 3
+        mark_chat_access_changed(request.request_id)
+        assert chat_access.allowed(url, expert)
+        db.session.commit()
+        assert url not in chat_access.rooms
+        assert not chat_access.allowed(url, expert)
+        assert chat_access.allowed(url, MockUser(id=users['regular_user']))
+
+def test_socket_join_chat(app, client, chat):
+    """Test only the request's members get into the chat room"""
+    url, users = chat
+    socketio = app.extensions['socketio']
+    for user, joined in [(MockUser(id=users['expert_user'], role=2), True), (MockUser(id=-1), False)]:
+        with logged_in_user(client, user):
+            socket = socketio.test_client(app, flask_test_client=client)
+            try:
+                socket.emit('join_chat', {'auth_url': url})
+                socket.emit('join_chat', {'auth_url': 'no-such-chat'})
+                socket.get_received()
+                socketio.emit('probe', {}, room=url)
+                socketio.emit('probe', {}, room='no-such-chat')
+                assert len(socket.get_received()) == joined
+            finally:
+                socket.disconnect()
+
+def test_change_during_load_is_not_cached(app, chat):
+    """Test members loaded while their request changed are returned but loaded again on the next join"""
+    url, users = chat
+    cache = ChatAccessCache()
+    load = cache.load
+
+    def load_then_change(url):
+        members = load(url)
+        cache.invalidate([members[0]])
+        return members
+
+    with app.app_context():
+        cache.load = load_then_change
+        assert cache.allowed(url, MockUser(id=users['expert_user'], role=2))
+        assert url not in cache.rooms and cache.changed == {}
+        cache.load = load
+        assert cache.allowed(url, MockUser(id=users['expert_user'], role=2))
+        assert url in cache.rooms
+    assert cache.loads == 2
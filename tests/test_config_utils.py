@@ -0,0 +1,66 @@
+"""Test the manager configuration cache."""
+
+import json
+from sqlalchemy import event
+from main.models import db, ManagerConfig
+from main.config_utils import ConfigCache, config_cache, get_config, set_config, seed_manager_config
+from tests.test_utils import login_as
+from tests.test_cache_utils import FakeClock
+
+def test_config_cache_reloads_after_ttl(app):
+    """Test values are read from the database once per time to live"""
+    with app.app_context():
+        seed_manager_config()
+        clock = FakeClock()
+        cache = ConfigCache(ttl=60, clock=clock)
+        assert cache.get(ManagerConfig.MAX_DURATION_KEY) == get_config(ManagerConfig.MAX_DURATION_KEY)
+        cache.get(ManagerConfig.BASE_FEE_KEY)
+        assert cache.loads == 1
+
+        clock.now = 60
+        cache.get(ManagerConfig.BASE_FEE_KEY)
+        assert cache.loads == 2
+
+def test_seed_manager_config_is_idempotent(app):
+    """Test seeding adds missing keys without changing existing values"""
+    with app.app_context():
+        set_config(ManagerConfig.BASE_FEE_KEY, 2.5)
+        db.session.delete(db.session.get(ManagerConfig, ManagerConfig.MAX_DURATION_KEY))
+        db.session.commit()
+
+        seed_manager_config()
+        seed_manager_config()
+        assert ManagerConfig.query.count() == 3
+        assert get_config(ManagerConfig.BASE_FEE_KEY) == '2.5'
+        assert get_config(ManagerConfig.MAX_DURATION_KEY) == '5'
+        set_config(ManagerConfig.BASE_FEE_KEY, '1.00')
+
+@login_as(role=3)
+def test_manager_dashboard_does_not_write_config(client):
+    """Test viewing the dashboard reads the cached configuration without committing"""
+    with client.application.app_context():
+        seed_manager_config()
+        client.get('/dashboard/')
+        loads = config_cache.loads
+
+        commits = []
+        def record(session):
+            commits.append(session)
+        event.listen(db.session, 'after_commit', record)
+        try:
+            assert client.get('/dashboard/').status_code == 200
+        finally:
+            event.remove(db.session, 'after_commit', record)
+        assert not commits
+        assert config_cache.loads == loads
+
+@login_as(role=3)
+def test_update_refreshes_cached_config(client):
+    """Test a fee change is used straight away by this worker"""
+    with client.application.app_context():
+        get_config(ManagerConfig.AUTHENTICATED_FEE_KEY)
+        response = client.put('/dashboard/api/update-auth', data=json.dumps({'fee': 7.5}),
+                              content_type='application/json')
+        assert response.status_code == 200
+        assert get_config(ManagerConfig.AUTHENTICATED_FEE_KEY) == '7.5'
+        set_config(ManagerConfig.AUTHENTICATED_FEE_KEY, '5.00')
@@ -3,13 +3,24 @@
 import pytest
 import json
 from datetime import datetime, timedelta
-from main.models import db, User, Item, Category, AuthenticationRequest, ExpertAssignment, ManagerConfig
+from decimal import Decimal
+from sqlalchemy import func
+from main.models import (
+    db, User, Item, Bid, Category, AuthenticationRequest, ExpertAssignment, ManagerConfig, RevenueDaily
+)
+from main.auction_utils import finalise_ended_auctions
+from main.revenue_utils import rebuild_revenue_rollup
+from main.page_dashboard.routes import revenue_buckets, revenue_chart_data
 from tests.test_utils import (
     MockUser, logged_in_user, login_as, mock_login_user, 
     common_setup_database, verify_page_title, verify_element_exists, 
     clear_all_tables
 )
 
+def highest_bid_total(*conditions):
+    """Sum of the highest bids of the items matching the conditions, straight from the items table"""
+    return db.session.query(func.sum(Item.current_bid_amount)).filter(*conditions).scalar() or 0.0
+
 @pytest.fixture(scope="module")
 def setup_database(app, common_setup_database):
     """Create custom test data for manager dashboard tests"""
@@ -586,4 +597,104 @@ def test_expert_update_user_role_api(client, setup_database):
     assert response.status_code == 403
     data = json.loads(response.data)
     assert 'error' in data
-    assert 'Unauthorised' in data['error']
\ No newline at end of file
+    assert 'Unauthorised' in data['error']
+
+def test_revenue_chart_matches_per_bucket_totals(app, setup_database):
+    """Test the revenue chart from the rollup matches totalling each bucket from the items"""
+    with app.app_context():
+        now = datetime.now()
+        category = Category.query.first()
+        # Completed auctions spread over the last 200 days, and one still running today
+        items = [Item(
+            seller_id=setup_database['regular_user_id'],
+            category_id=category.id,
+            title=f"Revenue Item {days}",
+            description="Item for the revenue chart",
+            auction_start=now - timedelta(days=days + 1),
+            auction_end=now - timedelta(days=days, hours=days % 5),
+            minimum_price=1.00,
+            status=3 if days % 2 else 2
+        ) for days in range(0, 200, 3)]
+        items.append(Item(seller_id=setup_database['regular_user_id'], category_id=category.id,
+                          title="Running Item", description="Item for the revenue chart", minimum_price=1.00,
+                          auction_start=now, auction_end=now + timedelta(minutes=5)))
+        db.session.add_all(items)
+        db.session.commit()
+        item_ids = [item.item_id for item in items]
+        db.session.add_all([
+            Bid(item_id=item_id, bidder_id=setup_database['test_user1_id'], bid_amount=Decimal('10.10') + index)
+            for index, item_id in enumerate(item_ids)
+        ])
+        db.session.commit()
+        rebuild_revenue_rollup(now)
+
+        try:
+            expected = {}
+            for chart, label, start, end in revenue_buckets(now):
+                bucket = (Item.auction_end >= start, Item.auction_end < end, Item.auction_end < now)
+                for series, total in (('projected', highest_bid_total(*bucket)),
+                                      ('paid', highest_bid_total(*bucket, Item.status == 3))):
+                    values = expected.setdefault(chart, {}).setdefault(series, {'labels': [], 'values': []})
+                    values['labels'].append(label)
+                    values['values'].append(float(total))
+
+            assert revenue_chart_data(now) == expected
+            assert any(expected['six_months']['paid']['values'])
+        finally:
+            Bid.query.filter(Bid.item_id.in_(item_ids)).delete()
+            Item.query.filter(Item.item_id.in_(item_ids)).delete()
+            RevenueDaily.query.delete()
+            db.session.commit()
+
+def test_revenue_rollup_updated_on_finalise_and_payment(app, client, setup_database, monkeypatch):
+    """Test finalising and paying for an auction updates its day in the rollup"""
+    with app.app_context():
+        now = datetime.now()
+        item = Item(seller_id=setup_database['regular_user_id'], category_id=Category.query.first().id,
+                    title="Rollup Item", description="Item for the revenue rollup", minimum_price=1.00,
+                    auction_start=now - timedelta(days=1), auction_end=now - timedelta(minutes=1))
+        db.session.add(item)
+        db.session.commit()
+        db.session.add(Bid(item_id=item.item_id, bidder_id=setup_database['test_user1_id'], bid_amount=Decimal('40.00')))
+        db.session.commit()
+        item_id, url, day, base_fee = item.item_id, item.url, item.auction_end.date(), item.base_fee
+
+        try:
+            finalise_ended_auctions(item_ids=[item_id])
+            row = db.session.get(RevenueDaily, day)
+            assert (row.projected, row.paid, row.completed_count, row.paid_count) == (Decimal('40.00'), 0, 1, 0)
+
+            mock_login_user(monkeypatch, MockUser(id=setup_database['test_user1_id'], username='test_user1'))
+            assert client.post(f'/item/{url}/mark-won').status_code == 200
+            db.session.expire_all()
+            row = db.session.get(RevenueDaily, day)
+            assert (row.paid, row.paid_count) == (Decimal('40.00'), 1)
+            # The item has no approved authentication, so only the base fee is charged
+            assert (row.base_commission, row.auth_commission) == (Decimal('40.00') * base_fee / 100, 0)
+
+            # Incremental updates match rebuilding the day from scratch
+            incremental = (row.projected, row.paid, row.base_commission, row.completed_count, row.paid_count)
+            rebuild_revenue_rollup()
+            row = db.session.get(RevenueDaily, day)
+            assert (row.projected, row.paid, row.base_commission, row.completed_count, row.paid_count) == incremental
+        finally:
+            Bid.query.filter_by(item_id=item_id).delete()
+            Item.query.filter_by(item_id=item_id).delete()
+            RevenueDaily.query.delete()
+            db.session.commit()
+
+@login_as(role=3)
+def test_metrics_api(client):
+    """Test managers can read the cache, bid broadcast, emit queue and finalisation counters"""
+    response = client.get('/dashboard/api/metrics')
+    assert response.status_code == 200
+    metrics = response.get_json()
+    assert {'hits', 'misses', 'hit_rate'} <= set(metrics['stats_cache'])
+    assert {'bids', 'frames', 'frames_saved'} <= set(metrics['bid_broadcasts'])
+    assert {'depth', 'sent', 'dropped', 'latency'} <= set(metrics['emits'])
+    assert {'runs', 'items', 'seconds', 'last_rate', 'rate'} <= set(metrics['finalisation'])
+
+@login_as(role=1)
+def test_metrics_api_unauthorised(client):
+    """Test other users can't read the counters"""
+    assert client.get('/dashboard/api/metrics').status_code == 403
@@ -7,7 +7,7 @@ from main.models import db, User, Item, Category, Bid, AuthenticationRequest, Im
 from tests.test_utils import (
     MockUser, logged_in_user, login_as, mock_login_user, 
     common_setup_database, verify_page_title, verify_element_exists, 
-    clear_all_tables
+    clear_all_tables, count_queries
 )
 
 @pytest.fixture(scope="module")
@@ -541,4 +541,64 @@ def test_user_dashboard_empty_states(client, setup_database, soup):
         watchlist_tab = page.find('div', id='watchlist')
         watchlist_empty_state = watchlist_tab.find('div', class_='empty-state')
         assert watchlist_empty_state is not None
-        assert "You are not watching any auctions" in watchlist_empty_state.text
\ No newline at end of file
+        assert "You are not watching any auctions" in watchlist_empty_state.text
+
+
+def add_dashboard_auctions(user_id, other_id, category_id, count):
+    """Give the user auctions they sell, bid on, won and watch, with bids and watchers from another user"""
+    now = datetime.now()
+    for index in range(count):
+        selling = Item(seller_id=user_id, category_id=category_id, title=f"Counted selling {user_id}-{index}",
+                       description="Query count test", auction_start=now - timedelta(days=1),
+                       auction_end=now + timedelta(days=1 + index), minimum_price=10)
+        bidding = Item(seller_id=other_id, category_id=category_id, title=f"Counted bidding {user_id}-{index}",
+                       description="Query count test", auction_start=now - timedelta(days=1),
+                       auction_end=now + timedelta(days=2), minimum_price=10)
+        won = Item(seller_id=other_id, category_id=category_id, title=f"Counted won {user_id}-{index}",
+                   description="Query count test", auction_start=now - timedelta(days=3),
+                   auction_end=now - timedelta(days=1), minimum_price=10, status=2 + index % 2)
+        db.session.add_all([selling, bidding, won])
+        db.session.flush()
+        winning_bid = Bid(item_id=won.item_id, bidder_id=user_id, bid_amount=20)
+        db.session.add_all([
+            Bid(item_id=selling.item_id, bidder_id=other_id, bid_amount=15),
+            Bid(item_id=bidding.item_id, bidder_id=user_id, bid_amount=12),
+            Bid(item_id=bidding.item_id, bidder_id=other_id, bid_amount=14),
+            winning_bid,
+            AuthenticationRequest(item_id=selling.item_id, requester_id=user_id, status=1)
+        ])
+        db.session.flush()
+        won.winning_bid_id = winning_bid.bid_id
+        for watcher in (user_id, other_id):
+            db.session.execute(
+                text("INSERT INTO user_watched_items (user_id, item_id) VALUES (:user_id, :item_id)"),
+                {"user_id": watcher, "item_id": bidding.item_id}
+            )
+    db.session.commit()
+
+
+def test_user_dashboard_query_count_is_constant(client, setup_database):
+    """Test the dashboard runs the same number of queries however many auctions the user has"""
+    with client.application.app_context():
+        busy_user = User(username="busy_user", email="busyuser@test.com", role=1)
+        busy_user.set_password("Password@123")
+        db.session.add(busy_user)
+        db.session.commit()
+        user_id = busy_user.id
+
+        def dashboard_queries():
+            with logged_in_user(client, MockUser(id=user_id, username="busy_user", role=1)):
+                with count_queries() as statements:
+                    response = client.get('/dashboard/')
+            assert response.status_code == 200
+            return len(statements), response.data.decode()
+
+        add_dashboard_auctions(user_id, setup_database['test_user2_id'], setup_database['antiques_category_id'], 1)
+        few, _ = dashboard_queries()
+        add_dashboard_auctions(user_id, setup_database['test_user2_id'], setup_database['antiques_category_id'], 6)
+        many, page = dashboard_queries()
+
+        assert many == few
+        assert page.count("Counted selling") == 7
+        assert page.count("Counted bidding") == 14
+        assert page.count("Counted won") == 7
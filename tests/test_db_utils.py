@@ -0,0 +1,146 @@
+"""Test the database configuration utilities."""
+
+import gc
+import weakref
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from main.models import db, Bid, Category, Item, User
+from main.db_utils import (
+    engine_options, sqlite_pragmas, apply_sqlite_pragmas, create_missing_indexes, add_availability_unique_index,
+    drop_all_tables, dispose_engine_after_fork, dispose_engines_after_fork, forked_engines
+)
+
+def test_sqlite_engine_options():
+    """Test SQLite only gets the lock timeout and no pool sizing"""
+    options = engine_options('sqlite:///database.db', {})
+    assert options['connect_args'] == {'timeout': 30}
+    assert 'pool_size' not in options
+
+def test_postgres_engine_options_use_a_pool():
+    """Test PostgreSQL keeps a pool of connections by default"""
+    options = engine_options('postgresql://user@localhost/vault', {})
+    assert 'poolclass' not in options
+    assert options['pool_size'] == 5
+    assert options['max_overflow'] == 10
+    assert options['pool_pre_ping'] is True
+    # SQLite's connect arguments must not be sent to PostgreSQL
+    assert options['connect_args'] == {'connect_timeout': 10}
+
+def test_postgres_engine_options_from_environment():
+    """Test the pool can be sized or turned off from the environment"""
+    options = engine_options('postgresql://user@localhost/vault',
+                             {'DB_POOL_SIZE': '20', 'DB_MAX_OVERFLOW': '0', 'DB_POOL_RECYCLE': '60'})
+    assert (options['pool_size'], options['max_overflow'], options['pool_recycle']) == (20, 0, 60)
+
+    options = engine_options('postgresql://user@localhost/vault', {'DB_POOL': 'null'})
+    assert options['poolclass'] is NullPool
+    assert 'pool_size' not in options
+
+def test_engines_disposed_after_fork_are_held_weakly(tmp_path):
+    """Test each engine is tracked once, replaced by the fork hook and forgotten once dropped"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'fork.db'}")
+    dispose_engine_after_fork(engine)
+    dispose_engine_after_fork(engine)
+    assert sum(tracked is engine for tracked in forked_engines) == 1
+
+    pool = engine.pool
+    dispose_engines_after_fork()
+    assert engine.pool is not pool
+
+    dropped = weakref.ref(engine)
+    del engine, pool
+    gc.collect()
+    assert dropped() is None
+
+def test_sqlite_pragmas(tmp_path):
+    """Test new SQLite connections use WAL and foreign keys, and tests keep the rollback journal"""
+    pragmas = sqlite_pragmas({})
+    engine = create_engine(f"sqlite:///{tmp_path / 'pragmas.db'}")
+    apply_sqlite_pragmas(engine, pragmas)
+    with engine.connect() as connection:
+        assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert connection.execute(text('PRAGMA foreign_keys')).scalar() == 1
+    engine.dispose()
+
+    testing = sqlite_pragmas({}, testing=True)
+    assert (testing['journal_mode'], testing['foreign_keys']) == ('DELETE', 'OFF')
+
+def test_finalised_database_dropped_with_foreign_keys(app, tmp_path):
+    """Test a database with a won auction can be dropped although items and bids reference each other"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'finalised.db'}")
+    apply_sqlite_pragmas(engine, sqlite_pragmas({}))
+    db.metadata.create_all(engine)
+    # Items read the maximum auction duration from the app's configuration
+    with app.app_context(), Session(engine) as session:
+        seller = User(username='seller', email='seller@test.com', password_hash='x')
+        bidder = User(username='bidder', email='bidder@test.com', password_hash='x')
+        category = Category(name='Clocks', description='Clocks')
+        session.add_all([seller, bidder, category])
+        session.flush()
+        now = datetime.now()
+        item = Item(seller_id=seller.id, category_id=category.id, title='Clock', description='Clock',
+                    auction_start=now - timedelta(days=2), auction_end=now - timedelta(days=1), minimum_price=1)
+        session.add(item)
+        session.flush()
+        bid = Bid(item_id=item.item_id, bidder_id=bidder.id, bid_amount=5, bid_time=now - timedelta(days=1))
+        session.add(bid)
+        session.flush()
+        item.winning_bid_id = bid.bid_id
+        session.commit()
+
+    with pytest.raises(IntegrityError):
+        db.metadata.drop_all(engine)
+
+    drop_all_tables(engine, db.metadata)
+    with engine.connect() as connection:
+        assert inspect(connection).get_table_names() == []
+        # Checks are back on for the pooled connection
+        assert connection.execute(text('PRAGMA foreign_keys')).scalar() == 1
+    engine.dispose()
+
+def test_sqlite_pragmas_from_environment():
+    """Test pragmas can be overridden from the environment but not used to inject SQL"""
+    assert sqlite_pragmas({'SQLITE_SYNCHRONOUS': 'FULL'})['synchronous'] == 'FULL'
+    with pytest.raises(ValueError):
+        sqlite_pragmas({'SQLITE_CACHE_SIZE': '1; DROP TABLE users'})
+
+def test_missing_indexes_are_created(app):
+    """Test indexes added after a table was created are added to the existing database"""
+    with app.app_context():
+        index = next(index for index in Bid.__table__.indexes if index.name == 'ix_bids_bidder_item')
+        index.drop(db.engine)
+
+        assert create_missing_indexes(db) == ['ix_bids_bidder_item']
+        assert create_missing_indexes(db) == []
+
+def test_duplicate_availability_removed_before_unique_index(app):
+    """Test an old availability table keeps the first record of each day when the unique index is added"""
+    with app.app_context():
+        db.session.execute(text('DROP INDEX uq_expert_availability_expert_day'))
+        db.session.execute(text(
+            'CREATE INDEX ix_expert_availability_expert_day ON expert_availability (expert_id, day)'
+        ))
+        rows = [
+            (990, '2030-01-01', '09:00:00.000000'),
+            (990, '2030-01-01', '10:00:00.000000'),
+            (990, '2030-01-02', '11:00:00.000000')
+        ]
+        for expert_id, day, start in rows:
+            db.session.execute(text(
+                "INSERT INTO expert_availability (expert_id, day, start_time, end_time, status) "
+                "VALUES (:expert_id, :day, :start, '17:00:00.000000', 1)"
+            ), {'expert_id': expert_id, 'day': day, 'start': start})
+        db.session.commit()
+
+        assert add_availability_unique_index(db) == 1
+        assert create_missing_indexes(db) == ['uq_expert_availability_expert_day']
+        starts = db.session.execute(text(
+            'SELECT start_time FROM expert_availability WHERE expert_id = 990 ORDER BY day')).scalars().all()
+        assert [start[:5] for start in starts] == ['09:00', '11:00']
+
+        db.session.execute(text('DELETE FROM expert_availability WHERE expert_id = 990'))
+        db.session.commit()
@@ -0,0 +1,140 @@
+"""Test the email outbox and its sender."""
+
+import datetime
+import pytest
+from main import mail
+from main.models import db, EmailOutbox, Notification
+from main.email_utils import (
+    send_notification_email, queue_email, send_queued_emails, drain_email_outbox, claim_emails, MAX_ATTEMPTS
+)
+from tests.test_utils import MockUser, SMTPStub
+
+@pytest.fixture
+def outbox(app):
+    """Empty outbox, cleared again after the test"""
+    with app.app_context():
+        EmailOutbox.query.delete()
+        db.session.commit()
+        yield
+        EmailOutbox.query.delete()
+        db.session.commit()
+
+@pytest.fixture
+def use_smtp_server(app):
+    """Point the mail extension at a local SMTP server for the duration of a test"""
+    original = app.extensions['mail']
+
+    def configure(port):
+        app.extensions['mail'] = mail.init_mail({
+            'MAIL_SERVER': '127.0.0.1',
+            'MAIL_PORT': port,
+            'MAIL_DEFAULT_SENDER': 'vault@test.com'
+        })
+
+    yield configure
+    app.extensions['mail'] = original
+
+def test_notification_email_is_queued(app, outbox):
+    """Test sending a notification email only adds it to the outbox"""
+    with app.app_context():
+        notification = Notification(user_id=1, message="You have been outbid on 'Clock'.",
+                                    item_url='clock', item_title='Clock', notification_type=1)
+        send_notification_email(MockUser(id=1, username='bidder'), notification)
+
+        email = EmailOutbox.query.one()
+        assert email.recipient == 'bidder@test.com'
+        assert email.subject == "You've been outbid on Clock"
+        assert 'item/clock' in email.body
+        assert email.status == EmailOutbox.PENDING
+
+def test_failed_email_keeps_caller_transaction(app, outbox):
+    """Test a failing outbox insert is rolled back alone, leaving the caller's changes to commit"""
+    with app.app_context():
+        notification = Notification(user_id=1, message='Your item has been authenticated!', notification_type=4)
+        db.session.add(notification)
+        no_email = MockUser(id=1)
+        no_email.email = None
+        send_notification_email(no_email, notification)
+        send_notification_email(MockUser(id=1, username='seller'), notification)
+        db.session.commit()
+
+        assert EmailOutbox.query.one().recipient == 'seller@test.com'
+        assert db.session.get(Notification, notification.id) is not None
+        db.session.delete(notification)
+        db.session.commit()
+
+def test_outbox_sent_over_one_connection(app, outbox, use_smtp_server):
+    """Test a batch of emails is sent over a single SMTP connection"""
+    with app.app_context(), SMTPStub() as server:
+        use_smtp_server(server.port)
+        for index in range(3):
+            queue_email(f'user{index}@test.com', f'Subject {index}', 'Body')
+
+        assert drain_email_outbox() == 3
+        assert server.connections == 1
+        assert [message['to'] for message in server.messages] == [
+            ['user0@test.com'], ['user1@test.com'], ['user2@test.com']
+        ]
+        assert EmailOutbox.query.filter_by(status=EmailOutbox.SENT).count() == 3
+
+        # Nothing is sent twice
+        assert send_queued_emails() == 0
+
+def test_claimed_emails_are_not_sent_twice(app, outbox, use_smtp_server):
+    """Test emails claimed by another worker are skipped until the claim times out"""
+    with app.app_context(), SMTPStub() as server:
+        use_smtp_server(server.port)
+        queue_email('user@test.com', 'Subject', 'Body')
+        db.session.commit()
+        email_id = EmailOutbox.query.one().id
+
+        # Another worker claims the email first
+        assert [email.id for email in claim_emails([email_id], datetime.datetime.now())] == [email_id]
+        assert claim_emails([email_id], datetime.datetime.now()) == []
+        assert send_queued_emails() == 0
+        assert server.messages == []
+
+        # The claim times out if that worker dies
+        email = db.session.get(EmailOutbox, email_id)
+        email.next_attempt_at = datetime.datetime.now()
+        db.session.commit()
+        assert send_queued_emails() == 1
+        assert email.status == EmailOutbox.SENT
+
+def test_rejected_email_is_retried_with_backoff(app, outbox, use_smtp_server):
+    """Test a rejected email is retried later without blocking the rest of the batch"""
+    with app.app_context(), SMTPStub(reject=['bad@test.com']) as server:
+        use_smtp_server(server.port)
+        queue_email('bad@test.com', 'Rejected', 'Body')
+        queue_email('good@test.com', 'Accepted', 'Body')
+
+        assert send_queued_emails() == 1
+        rejected = EmailOutbox.query.filter_by(recipient='bad@test.com').one()
+        assert rejected.status == EmailOutbox.PENDING
+        assert rejected.attempts == 1
+        assert rejected.next_attempt_at > datetime.datetime.now()
+
+        # Not due yet
+        assert send_queued_emails() == 0
+
+        # Gives up after the last attempt
+        for _ in range(MAX_ATTEMPTS - 1):
+            rejected.next_attempt_at = datetime.datetime.now()
+            db.session.commit()
+            send_queued_emails()
+        assert rejected.status == EmailOutbox.FAILED
+        assert rejected.attempts == MAX_ATTEMPTS
+
+def test_unreachable_server_keeps_emails_queued(app, outbox, use_smtp_server):
+    """Test emails stay queued when the SMTP server cannot be reached"""
+    with app.app_context():
+        with SMTPStub() as server:
+            port = server.port
+        use_smtp_server(port)
+        queue_email('user@test.com', 'Subject', 'Body')
+
+        assert send_queued_emails() == 0
+        email = EmailOutbox.query.one()
+        assert email.status == EmailOutbox.PENDING
+        assert email.attempts == 1
+        assert email.last_error
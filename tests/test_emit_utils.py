@@ -0,0 +1,119 @@
+"""Test Socket.IO events are queued, merged, rate limited and dropped by the emit dispatcher."""
+
+from unittest.mock import MagicMock, patch
+from main.emit_utils import EmitDispatcher
+
+def frame(*amounts):
+    bids = [{'bid_amount': amount} for amount in amounts]
+    return dict(bids[-1], bids=bids)
+
+def background(mock_socketio):
+    """Collect the background tasks started instead of running them."""
+    tasks = []
+    mock_socketio.start_background_task = MagicMock(side_effect=lambda task, *args: tasks.append((task, args)))
+    return tasks
+
+def test_events_are_sent_in_background():
+    """Test emits return before sending, and one task sends them oldest first"""
+    emitter = EmitDispatcher(queue_size=10)
+    with patch('main.socketio') as mock_socketio:
+        tasks = background(mock_socketio)
+        emitter.emit('new_message', {'message': 'hello'}, room='chat')
+        emitter.emit('new_notification', {'message': 'hi'}, room='user_a')
+        mock_socketio.emit.assert_not_called()
+        assert len(tasks) == 1 and emitter.metrics()['depth'] == 2
+
+        task, args = tasks[0]
+        task(*args)
+        assert [call.args[0] for call in mock_socketio.emit.call_args_list] == ['new_message', 'new_notification']
+        assert mock_socketio.emit.call_args.kwargs == {'room': 'user_a'}
+
+        # The next event starts a new task once the queue has emptied
+        emitter.emit('new_message', {'message': 'again'}, room='chat')
+        assert len(tasks) == 2
+
+    metrics = emitter.metrics()
+    assert metrics['sent'] == 2 and metrics['max_depth'] == 2
+    assert sum(metrics['latency'].values()) == 2
+
+def test_waiting_updates_are_merged():
+    """Test a room's waiting bid_update takes in newer bids and viewer_count the newer count"""
+    emitter = EmitDispatcher(queue_size=10)
+    with patch('main.socketio') as mock_socketio:
+        tasks = background(mock_socketio)
+        emitter.emit('bid_update', frame(10, 11), room='hot-item')
+        emitter.emit('viewer_count', {'viewers': 3}, room='hot-item')
+        emitter.emit('bid_update', frame(12), room='hot-item')
+        emitter.emit('bid_update', frame(5), room='quiet-item')
+        emitter.emit('viewer_count', {'viewers': 4}, room='hot-item')
+        assert emitter.metrics()['depth'] == 3
+
+        task, args = tasks[0]
+        task(*args)
+        sent = {(call.args[0], call.kwargs['room']): call.args[1] for call in mock_socketio.emit.call_args_list}
+        assert sent[('bid_update', 'hot-item')] == frame(10, 11, 12)
+        assert sent[('bid_update', 'quiet-item')] == frame(5)
+        assert sent[('viewer_count', 'hot-item')] == {'viewers': 4}
+    assert emitter.metrics()['merged'] == 2
+
+def test_merged_bid_update_keeps_highest_bid():
+    """Test a frame arriving out of order doesn't lower the waiting frame's bid"""
+    emitter = EmitDispatcher(queue_size=10)
+    with patch('main.socketio') as mock_socketio:
+        tasks = background(mock_socketio)
+        emitter.emit('bid_update', frame(12), room='item')
+        emitter.emit('bid_update', frame(11), room='item')
+        task, args = tasks[0]
+        task(*args)
+        sent = mock_socketio.emit.call_args.args[1]
+        assert sent == {'bid_amount': 12, 'bids': [{'bid_amount': 12}, {'bid_amount': 11}]}
+
+def test_full_queue_drops_viewer_counts_first():
+    """Test viewer counts are dropped once the queue is full and other events past its reserve"""
+    emitter = EmitDispatcher(queue_size=2)
+    with patch('main.socketio') as mock_socketio:
+        background(mock_socketio)
+        emitter.emit('bid_update', frame(10), room='item')
+        emitter.emit('viewer_count', {'viewers': 3}, room='item')
+        emitter.emit('viewer_count', {'viewers': 4}, room='item')
+        emitter.emit('viewer_count', {'viewers': 5}, room='chat')
+        emitter.emit('new_message', {'message': 'first'}, room='chat')
+        emitter.emit('force_reload', {'status': 'done'}, room='chat')
+        emitter.emit('new_message', {'message': 'second'}, room='chat')
+        emitter.emit('bid_update', frame(11), room='item')
+        # Handlers never send while the queue is backed up
+        mock_socketio.emit.assert_not_called()
+    metrics = emitter.metrics()
+    assert metrics['depth'] == 4 and metrics['merged'] == 2
+    assert metrics['dropped'] == {'viewer_count': 1, 'new_message': 1}
+
+def test_rate_limited_events_wait_without_blocking_others():
+    """Test an event type over its rate waits for a token while other types are still sent"""
+    now = [0.0]
+    emitter = EmitDispatcher(queue_size=10, rates={'bid_update': 1}, clock=lambda: now[0])
+    with patch('main.socketio') as mock_socketio:
+        tasks = background(mock_socketio)
+        # One token is left after the first bid
+        mock_socketio.sleep = MagicMock(side_effect=lambda seconds: now.__setitem__(0, now[0] + seconds))
+        emitter.emit('bid_update', frame(10), room='first-item')
+        emitter.emit('bid_update', frame(20), room='second-item')
+        emitter.emit('bid_update', frame(30), room='third-item')
+        emitter.emit('new_message', {'message': 'hello'}, room='chat')
+
+        task, args = tasks[0]
+        task(*args)
+        sent = [(call.args[0], call.kwargs['room']) for call in mock_socketio.emit.call_args_list]
+        assert sent == [('bid_update', 'first-item'), ('new_message', 'chat'),
+                        ('bid_update', 'second-item'), ('bid_update', 'third-item')]
+        assert [call.args[0] for call in mock_socketio.sleep.call_args_list] == [1.0, 1.0]
+
+def test_zero_queue_sends_in_caller():
+    """Test events are sent straight away without a queue, and failures are counted rather than raised"""
+    emitter = EmitDispatcher(queue_size=0)
+    with patch('main.socketio') as mock_socketio:
+        emitter.emit('force_reload', {'status': 'done'}, room='chat')
+        mock_socketio.emit.assert_called_once_with('force_reload', {'status': 'done'}, room='chat')
+        mock_socketio.emit.side_effect = RuntimeError('slow client')
+        emitter.emit('force_reload', {'status': 'done'}, room='chat')
+        mock_socketio.start_background_task.assert_not_called()
+    assert emitter.metrics()['sent'] == 1 and emitter.metrics()['failed'] == 1
@@ -371,4 +371,36 @@ def test_update_availability_next_week(client, setup_database):
         assert availability is not None
         assert availability.start_time.strftime('%H:%M') == '10:00'
         assert availability.end_time.strftime('%H:%M') == '16:00'
-        assert availability.status is True
\ No newline at end of file
+        assert availability.status is True
+
+@login_as(role=2)
+def test_update_availability_repeat_weeks(client, setup_database):
+    """Test a schedule saved for several weeks is upserted without duplicate days"""
+    week_start = setup_database['next_week_start'] + timedelta(weeks=4)
+    # Saved for the mock user login_as logs in
+    expert_id = 1
+    response = client.get(f'/expert/availability?week_start={week_start.strftime("%Y-%m-%d")}', follow_redirects=True)
+    csrf_token = response.data.decode('utf-8').split('name="csrf_token" value="')[1].split('"')[0]
+
+    def submit(**days):
+        form_data = {'csrf_token': csrf_token, 'week_start': week_start.strftime('%Y-%m-%d'), 'repeat_weeks': '4'}
+        form_data.update(days)
+        return client.post('/expert/availability', data=form_data, follow_redirects=True)
+
+    response = submit(day_3_start='09:00', day_3_end='12:00', day_3_status='available')
+    assert b'Availability updated successfully for 4 weeks' in response.data
+    # Saving again updates the same records
+    submit(day_3_start='10:00', day_3_end='14:00', day_3_status='available')
+    # A day without times only changes its status
+    submit(day_3_status='unavailable')
+
+    with client.application.app_context():
+        days = [week_start + timedelta(days=3, weeks=week) for week in range(4)]
+        records = ExpertAvailability.query.filter(
+            ExpertAvailability.expert_id == expert_id, ExpertAvailability.day.in_(days)
+        ).order_by(ExpertAvailability.day).all()
+        assert [record.day for record in records] == days
+        for record in records:
+            assert record.start_time == time(10, 0)
+            assert record.end_time == time(14, 0)
+            assert record.status is False
@@ -1,6 +1,9 @@
 """Test homepage functionality."""
 
 import pytest
+import datetime
+from bs4 import BeautifulSoup
+from sqlalchemy import text
 from main.models import Item, User, Category, db, Bid, Image
 from tests.test_utils import (
     MockUser, logged_in_user, login_as, setup_test_data, clean_test_data,
@@ -156,7 +159,103 @@ def test_auction_countdown_displayed(client, setup_database, soup):
     for countdown in countdown_elements:
         assert 'data-end' in countdown.attrs
 
-# Tests for search functionality, not used in the current implementation
+# Tests for the paginated listing
+def test_listing_api_first_page(json_client, setup_database):
+    """Test the listing API returns rendered cards for the first page"""
+    response = json_client.get('/api/items')
+    assert response.status_code == 200
+    assert response.json['count'] == Item.query.count()
+    assert response.json['next_cursor'] is None
+    assert 'auction-grid-wrapper' in response.json['html']
+
+def test_listing_api_keyset_pages(json_client, setup_database, monkeypatch):
+    """Test that following the cursor walks every item exactly once in listing order"""
+    monkeypatch.setattr('main.page_home.routes.PAGE_SIZE', 2)
+
+    seen = []
+    cursor = None
+    while True:
+        url = f'/api/items?cursor={cursor}' if cursor else '/api/items'
+        response = json_client.get(url)
+        assert response.status_code == 200
+        assert response.json['count'] <= 2
+        page = BeautifulSoup(response.json['html'], 'html.parser')
+        seen += [int(card['data-item-id']) for card in page.select('.auction-grid-wrapper')]
+        cursor = response.json['next_cursor']
+        if not cursor:
+            break
+
+    expected = [item.item_id for item in Item.query.order_by(
+        Item.auction_completed.asc(), Item.auction_end.asc(), Item.item_id.asc()).all()]
+    assert seen == expected
+
+@pytest.mark.parametrize('sort, key', [
+    ('price-low-high', lambda item: (item.current_price(), item.item_id)),
+    ('price-high-low', lambda item: (-item.current_price(), item.item_id)),
+    ('ending-latest', lambda item: (-item.auction_end.timestamp(), item.item_id)),
+    ('title-a-z', lambda item: (item.title.lower(), item.item_id))
+])
+def test_listing_api_sorted_pages(json_client, setup_database, monkeypatch, sort, key):
+    """Test that each sort is applied by the server across every page of the cursor"""
+    monkeypatch.setattr('main.page_home.routes.PAGE_SIZE', 2)
+
+    seen = []
+    cursor = None
+    while True:
+        url = f'/api/items?sort={sort}&cursor={cursor}' if cursor else f'/api/items?sort={sort}'
+        response = json_client.get(url)
+        assert response.status_code == 200
+        page = BeautifulSoup(response.json['html'], 'html.parser')
+        seen += [int(card['data-item-id']) for card in page.select('.auction-grid-wrapper')]
+        cursor = response.json['next_cursor']
+        if not cursor:
+            break
+
+    assert seen == [item.item_id for item in sorted(Item.query.all(), key=key)]
+
+    # A cursor only continues the sort it came from
+    first = json_client.get(f'/api/items?sort={sort}').json['next_cursor']
+    assert json_client.get(f'/api/items?cursor={first}').status_code == 400
+
+def test_listing_api_filters(json_client, setup_database):
+    """Test that category and status filters are applied by the server"""
+    category = Category.query.first()
+    response = json_client.get(f'/api/items?category={category.id}')
+    assert response.json['count'] == Item.query.filter_by(category_id=category.id).count()
+
+    now = datetime.datetime.now()
+    response = json_client.get('/api/items?status=1')
+    assert response.json['count'] == Item.query.filter(Item.auction_end > now).count()
+
+    response = json_client.get('/api/items?status=2')
+    assert response.json['count'] == Item.query.filter(Item.auction_end <= now).count()
+
+def test_listing_api_invalid_cursor(json_client, setup_database):
+    """Test that a malformed cursor is rejected"""
+    response = json_client.get('/api/items?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+def test_home_page_first_page_only(client, setup_database, soup, monkeypatch):
+    """Test that the home page only renders the first page and links to the next one"""
+    monkeypatch.setattr('main.page_home.routes.PAGE_SIZE', 2)
+    response = client.get('/')
+    page = soup(response.data)
+
+    assert len(page.select('.auction-grid-wrapper')) == 2
+    load_more = page.select_one('#load-more')
+    assert load_more is not None
+    assert load_more['data-cursor']
+
+def test_home_page_status_filter(client, setup_database, soup):
+    """Test that the status filter from the query string is applied and selected"""
+    response = client.get('/?status=1')
+    page = soup(response.data)
+
+    live_items = Item.query.filter(Item.auction_end > datetime.datetime.now()).count()
+    assert len(page.select('.auction-grid-wrapper')) == live_items
+    assert page.select_one('#type-filter option[selected]')['value'] == '1'
+
+# Tests for the search API
 def test_search_api_endpoint(json_client, setup_database):
     """Test the search API endpoint returns correct JSON data"""
     response = json_client.get('/api/search')
@@ -164,14 +263,99 @@ def test_search_api_endpoint(json_client, setup_database):
     
     # Check items count matches database
     items_count = Item.query.count()
-    assert len(response.json) == items_count
+    assert response.json['total'] == items_count
+    assert len(response.json['results']) == items_count
     
     # Check structure of returned items
-    first_item = response.json[0]
+    first_item = response.json['results'][0]
     assert 'item_id' in first_item
     assert 'title' in first_item
     assert 'url' in first_item
 
+def test_search_prefix_match(json_client, setup_database):
+    """Test that search terms match word prefixes"""
+    response = json_client.get('/api/search?q=Tes')
+    assert response.json['total'] == Item.query.count()
+
+    response = json_client.get('/api/search?q=nomatchword')
+    assert response.json['total'] == 0
+    assert response.json['results'] == []
+
+def test_search_ranks_title_matches_first(app, json_client, setup_database):
+    """Test that title matches rank above description-only matches"""
+    with app.app_context():
+        user = User.query.first()
+        category = Category.query.first()
+        now = datetime.datetime.now()
+        described = Item(seller_id=user.id, category_id=category.id, title='Plain wooden box',
+                         description='A box that once held a gramophone needle set',
+                         auction_start=now, auction_end=now + datetime.timedelta(days=1))
+        titled = Item(seller_id=user.id, category_id=category.id, title='Gramophone with brass horn',
+                      description='Working condition, recently serviced',
+                      auction_start=now, auction_end=now + datetime.timedelta(days=2))
+        db.session.add_all([described, titled])
+        db.session.commit()
+        described_id, titled_id = described.item_id, titled.item_id
+
+    # New items are searchable as soon as they are inserted
+    response = json_client.get('/api/search?q=gramophone')
+    ids = [result['item_id'] for result in response.json['results']]
+    assert ids == [titled_id, described_id]
+
+    with app.app_context():
+        Item.query.filter(Item.item_id.in_([described_id, titled_id])).delete()
+        db.session.commit()
+
+    response = json_client.get('/api/search?q=gramophone')
+    assert response.json['total'] == 0
+
+def test_search_index_rebuilt_from_cli(app, json_client, setup_database):
+    """Test the rebuild command repairs an index edited out of step with the items"""
+    item = Item.query.first()
+    with app.app_context():
+        db.session.execute(text("UPDATE items_fts SET title = 'zeppelin' WHERE rowid = :id"), {'id': item.item_id})
+        db.session.commit()
+    assert json_client.get('/api/search?q=zeppelin').json['total'] == 1
+
+    result = app.test_cli_runner().invoke(args=['rebuild-search-index'])
+    assert f'for {Item.query.count()} items' in result.output
+    assert json_client.get('/api/search?q=zeppelin').json['total'] == 0
+
+def test_search_category_name(json_client, setup_database):
+    """Test that the category name is searchable"""
+    category = Category.query.first()
+    response = json_client.get(f'/api/search?q={category.name}')
+    assert response.json['total'] == Item.query.filter_by(category_id=category.id).count()
+
+def test_search_facets(json_client, setup_database):
+    """Test that facets count every matching item"""
+    response = json_client.get('/api/search?q=test')
+    facets = response.json['facets']
+    total = response.json['total']
+
+    assert sum(category['count'] for category in facets['categories']) == total
+    assert sum(bucket['count'] for bucket in facets['price']) == total
+    assert facets['ending_soon'] <= total
+
+    # Filtering by a category keeps the category facet counts for the other categories
+    category = facets['categories'][0]
+    response = json_client.get(f"/api/search?q=test&category={category['id']}")
+    assert response.json['total'] == category['count']
+    assert response.json['facets']['categories'] == facets['categories']
+
+def test_search_price_filter_and_pages(json_client, setup_database):
+    """Test that price filters and pagination are applied"""
+    response = json_client.get('/api/search?min_price=0&max_price=15')
+    for result in response.json['results']:
+        assert result['price'] <= 15
+
+    response = json_client.get('/api/search?per_page=2&page=1')
+    assert len(response.json['results']) == 2
+    assert response.json['next_page'] == 2
+
+    response = json_client.get('/api/search?per_page=2&page=1&cards=1')
+    assert 'auction-grid-wrapper' in response.json['html']
+
 def test_search_filter_functionality(client, setup_database, soup):
     """Test that search and filter elements exist and have proper attributes"""
     response = client.get('/')
@@ -1,7 +1,9 @@
 """Test item page functionality."""
 
 import pytest
-from main.models import User, db, Category, Bid, Image, Item, Notification, AuthenticationRequest
+from main.models import (
+    User, db, Category, Bid, Image, Item, Notification, AuthenticationRequest, ExpertAssignment
+)
 from unittest.mock import patch, MagicMock
 import json
 import datetime
@@ -382,7 +384,8 @@ def test_image_gallery_display(client, setup_auction_data, soup):
 def test_socket_bid_notification(client, app, setup_auction_data):
     """Test that socket events are emitted on bid"""
     # Create the mock directly in the test
-    with patch('main.page_item.routes.socketio') as mock_socketio:
+    # Bid updates are sent by the broadcaster, straight away in tests
+    with patch('main.socketio') as mock_socketio:
         mock_socketio.emit = MagicMock()
         
         # First ensure there's a bid to outbid
@@ -419,6 +422,8 @@ def test_socket_bid_notification(client, app, setup_auction_data):
         assert emit_args[0] == 'bid_update' 
         assert 'bid_amount' in emit_args[1] 
         assert float(emit_args[1]['bid_amount']) == 20.00
+        # Clients use the id to skip frames older than the bid shown
+        assert emit_args[1]['bid_id'] == emit_args[1]['bids'][-1]['bid_id']
 
 @login_as(role=1, user_id=2, username="expert_user") 
 def test_authenticated_item_display(client, setup_auction_data, soup):
@@ -708,4 +713,184 @@ def test_item_page_socket_connection(client, app, setup_auction_data, soup):
     
     # Look for any script containing socket.io-related code
     socket_script = page.find('script', src=lambda s: s and 'socket.io' in s)
-    inline_socket = page.find('script', string=lambda s: s and ('socket' in s or 'io.connect' in s) if s else False)
\ No newline at end of file
+    inline_socket = page.find('script', string=lambda s: s and ('socket' in s or 'io.connect' in s) if s else False)
+def test_bid_summary_tracks_highest_bid(app, setup_auction_data):
+    """Test the stored bid summary follows new and deleted bids"""
+    with app.app_context():
+        item = Item.query.filter_by(url='active-auction').first()
+        # Bulk deletes skip the ORM but still reset the summary
+        Bid.query.filter_by(item_id=item.item_id).delete()
+        db.session.commit()
+        assert item.bid_count == 0
+        assert item.current_bid_amount is None
+        assert item.highest_bid() is None
+        assert item.current_price() == item.minimum_price
+
+        first = Bid(item_id=item.item_id, bidder_id=2, bid_amount=20.00, bid_time=datetime.datetime.now())
+        db.session.add(first)
+        db.session.commit()
+        highest = Bid(item_id=item.item_id, bidder_id=3, bid_amount=30.00, bid_time=datetime.datetime.now())
+        db.session.add(highest)
+        db.session.commit()
+        assert item.bid_count == 2
+        assert float(item.current_bid_amount) == 30.00
+        assert item.current_bidder_id == 3
+        assert item.highest_bid() == highest
+
+        # A lower bid is counted but does not replace the highest bid
+        db.session.add(Bid(item_id=item.item_id, bidder_id=2, bid_amount=25.00, bid_time=datetime.datetime.now()))
+        db.session.commit()
+        assert item.bid_count == 3
+        assert item.current_bid_id == highest.bid_id
+
+        # Deleting the highest bid falls back to the next highest
+        db.session.delete(highest)
+        db.session.commit()
+        assert item.bid_count == 2
+        assert float(item.current_bid_amount) == 25.00
+        assert item.current_bidder_id == 2
+
+def test_repair_bid_summaries(app, setup_auction_data):
+    """Test the repair command recalculates corrupted bid summaries"""
+    with app.app_context():
+        item = Item.query.filter_by(url='active-auction').first()
+        Bid.query.filter_by(item_id=item.item_id).delete()
+        db.session.add(Bid(item_id=item.item_id, bidder_id=2, bid_amount=30.00, bid_time=datetime.datetime.now()))
+        db.session.add(Bid(item_id=item.item_id, bidder_id=3, bid_amount=20.00, bid_time=datetime.datetime.now()))
+        item.bid_count = 7
+        item.current_bid_amount = 1.00
+        item.current_bidder_id = None
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['repair-bid-summaries'])
+        assert 'Repaired bid summaries' in result.output
+
+        db.session.expire_all()
+        item = Item.query.filter_by(url='active-auction').first()
+        assert item.bid_count == 2
+        assert float(item.current_bid_amount) == 30.00
+        assert item.current_bidder_id == 2
+
+def test_concurrent_bids_are_monotonic(app, setup_auction_data):
+    """Test many threads bidding on one item only accept strictly increasing bids"""
+    import random
+    import threading
+    from decimal import Decimal
+    from main import bid_utils
+
+    with app.app_context():
+        item = Item.query.filter_by(url='active-auction').first()
+        Bid.query.filter_by(item_id=item.item_id).delete()
+        db.session.commit()
+        item_id = item.item_id
+
+    # Every amount is attempted by several threads, so most bids lose a race
+    amounts = [Decimal(amount) for amount in range(10, 70)]
+    results = []
+
+    def bidder(bidder_id):
+        attempts = amounts * 2
+        random.shuffle(attempts)
+        with app.app_context():
+            for amount in attempts:
+                bid, reason = bid_utils.place_bid(item_id, bidder_id, amount)
+                results.append((bid, reason))
+
+    threads = [threading.Thread(target=bidder, args=(bidder_id,)) for bidder_id in (2, 3) * 3]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        history = Bid.query.filter_by(item_id=item_id).order_by(Bid.bid_id).all()
+        accepted = [bid for bid, _ in results if bid]
+        assert len(history) == len(accepted)
+        assert {reason for _, reason in results if reason} <= {bid_utils.TOO_LOW}
+
+        # Each accepted bid beats the one before it, so no amount appears twice
+        history_amounts = [bid.bid_amount for bid in history]
+        assert all(a < b for a, b in zip(history_amounts, history_amounts[1:]))
+        assert history_amounts[-1] == amounts[-1]
+
+        item = db.session.get(Item, item_id)
+        assert item.bid_count == len(history)
+        assert item.current_bid_id == history[-1].bid_id
+        assert item.current_bid_amount == history[-1].bid_amount
+
+@patch('main.notification_utils.queue_emails')
+def test_finalise_ended_auctions(mock_email, app, setup_auction_data):
+    """Test ended auctions are finalised in one batch with their notifications"""
+    from main.auction_utils import finalise_ended_auctions, finalise_metrics
+
+    with app.app_context():
+        now = datetime.datetime.now()
+        category_id = Category.query.first().id
+        Item.query.filter(Item.url.in_(['finalise-sold', 'finalise-unsold'])).delete()
+        sold = Item(seller_id=1, category_id=category_id, url='finalise-sold',
+                    title='Finalise Sold', description='Sold auction', minimum_price=10.00,
+                    auction_start=now - datetime.timedelta(days=2), auction_end=now - datetime.timedelta(minutes=5))
+        unsold = Item(seller_id=1, category_id=category_id, url='finalise-unsold',
+                      title='Finalise Unsold', description='Unsold auction', minimum_price=10.00,
+                      auction_start=now - datetime.timedelta(days=2), auction_end=now - datetime.timedelta(minutes=5))
+        db.session.add_all([sold, unsold])
+        db.session.commit()
+        # Only finalise the test items, other tests leave ended auctions behind
+        Item.query.filter(Item.auction_end <= now, Item.item_id.notin_([sold.item_id, unsold.item_id]))\
+            .update({'auction_completed': True}, synchronize_session=False)
+
+        db.session.add_all([
+            Bid(item_id=sold.item_id, bidder_id=2, bid_amount=20.00, bid_time=now - datetime.timedelta(hours=2)),
+            Bid(item_id=sold.item_id, bidder_id=3, bid_amount=30.00, bid_time=now - datetime.timedelta(hours=1))
+        ])
+        auth_request = AuthenticationRequest(item_id=unsold.item_id, requester_id=1, status=1)
+        db.session.add(auth_request)
+        db.session.commit()
+        db.session.add(ExpertAssignment(request_id=auth_request.request_id, expert_id=2, status=1))
+        Notification.query.filter(Notification.item_url.in_(['finalise-sold', 'finalise-unsold'])).delete()
+        db.session.commit()
+        sold_id, unsold_id, request_id = sold.item_id, unsold.item_id, auth_request.request_id
+
+        runs = finalise_metrics['runs']
+        assert finalise_ended_auctions() == 2
+        assert finalise_metrics['runs'] == runs + 1
+        # Finalised auctions are not picked up again
+        assert finalise_ended_auctions() == 0
+
+        sold = db.session.get(Item, sold_id)
+        assert sold.auction_completed and sold.status == 2
+        assert sold.winning_bid.bidder_id == 3
+        unsold = db.session.get(Item, unsold_id)
+        assert unsold.auction_completed and unsold.winning_bid_id is None
+
+        notifications = {(n.user_id, n.notification_type) for n in Notification.query.filter(
+            Notification.item_url.in_(['finalise-sold', 'finalise-unsold'])).all()}
+        # Winner, loser and seller of the sold item, seller of the unsold item, cancelled authentication
+        assert notifications == {(3, 2), (2, 3), (1, 5), (1, 6), (1, 4), (2, 4)}
+        assert db.session.get(AuthenticationRequest, request_id).status == 4
+        assert ExpertAssignment.query.filter_by(request_id=request_id).first().status == 4
+
+        # Emails go to everyone except the losing bidder, queued together
+        mock_email.assert_called_once()
+        assert len(mock_email.call_args[0][0]) == 5
+
+def test_notify_saves_batch_and_runs_channels(app, setup_auction_data, monkeypatch):
+    """Test the dispatcher saves a batch of notifications and hands them to each channel"""
+    from main import notification_utils
+    delivered = []
+    monkeypatch.setattr(notification_utils, 'CHANNELS', [delivered.extend])
+
+    with app.app_context():
+        item = Item.query.filter_by(url='active-auction').first()
+        ids = notification_utils.notify([
+            notification_utils.notification_event(2, 1, 'First', item),
+            notification_utils.notification_event(db.session.get(User, 3), 1, 'Second', item, email=False),
+            # Unknown users are skipped rather than failing the batch
+            notification_utils.notification_event(9999, 1, 'Unknown', item)
+        ], background=False)
+
+        assert len(ids) == 2
+        saved = Notification.query.filter(Notification.id.in_(ids)).order_by(Notification.id).all()
+        assert [(n.user_id, n.message, n.item_url) for n in saved] == [
+            (2, 'First', 'active-auction'), (3, 'Second', 'active-auction')]
+        assert [(d['user']['id'], d['email']) for d in delivered] == [(2, True), (3, False)]
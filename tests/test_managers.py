@@ -5,7 +5,7 @@ from datetime import date, datetime, timedelta
 from main.models import db, User, Category, ExpertAvailability, ExpertCategory
 from tests.test_utils import (
     login_as, verify_element_exists, verify_page_title,
-    verify_flash_message, MockUser, mock_login_user
+    verify_flash_message, MockUser, mock_login_user, count_queries
 )
 
 def create_expert_availability(expert_id, day, start_time, end_time, status=True):
@@ -318,4 +318,36 @@ def test_current_time_display(client, setup_expert_availability_data, soup):
     page = soup(response.data)
     
     # Verify page contains current time text
-    assert 'Current time:' in page.get_text() 
\ No newline at end of file
+    assert 'Current time:' in page.get_text() 
+
+@login_as(role=3, user_id=3, username="manager_user")
+def test_availability_queries_independent_of_expert_count(client, setup_expert_availability_data, soup):
+    """Test the grids are built with the same number of queries however many experts there are."""
+    with client.application.app_context():
+        with count_queries() as before:
+            assert client.get('/manager/expert-availability').status_code == 200
+
+        category = Category(name="Grid Category", description="Experts added by the query count test")
+        db.session.add(category)
+        db.session.commit()
+        for index in range(5):
+            expert = User(username=f"grid_expert{index}", email=f"grid_expert{index}@example.com", role=2)
+            expert.set_password("Password@123")
+            db.session.add(expert)
+            db.session.commit()
+            create_expert_availability(expert.id, date.today() + timedelta(days=index),
+                                       datetime.strptime("09:00", "%H:%M").time(),
+                                       datetime.strptime("17:00", "%H:%M").time())
+            setup_expert_categories(expert.id, [category.id])
+
+        with count_queries() as after:
+            response = client.get('/manager/expert-availability')
+        assert len(after) == len(before)
+        assert 'grid_expert4' in response.data.decode()
+
+        # Only the selected category's experts are listed
+        response = client.get(f'/manager/expert-availability?category={category.id}')
+        page = soup(response.data)
+        names = {row.find('td').text for row in page.find(id='weeklyTable').find('tbody').find_all('tr')}
+        assert names == {f"grid_expert{index}" for index in range(5)}
+        assert page.find('option', selected=True)['value'] == str(category.id)
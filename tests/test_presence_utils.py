@@ -0,0 +1,164 @@
+"""Test the live viewers of auction rooms are counted and announced without flooding them."""
+
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+from main.models import db, Category, Item, User
+from main.presence_utils import MemoryPresence, PresenceTracker, RedisPresence
+from tests.test_utils import common_setup_database, login_as
+
+def test_memory_presence_counts_connections():
+    """Test joins, leaves and disconnects change the counts of the rooms the connection was in"""
+    backend = MemoryPresence()
+    backend.join('item', 'a')
+    backend.join('item', 'b')
+    backend.join('item', 'b')
+    backend.join('chat', 'b')
+    assert backend.count('item') == 2 and backend.count('chat') == 1
+
+    backend.leave('item', 'a')
+    assert backend.disconnect('b') == {'item', 'chat'}
+    assert backend.count('item') == 0 and backend.count('chat') == 0
+    assert not backend.rooms and not backend.sids
+
+class RedisStub:
+    """The sorted set and set commands RedisPresence uses, run straight away by its pipelines"""
+
+    def __init__(self):
+        self.keys = {}
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def zadd(self, key, scores):
+        self.keys.setdefault(key, {}).update(scores)
+
+    def zrem(self, key, member):
+        self.keys.get(key, {}).pop(member, None)
+
+    def zremrangebyscore(self, key, low, high):
+        self.keys[key] = {member: score for member, score in self.keys.get(key, {}).items() if score > high}
+
+    def zcard(self, key):
+        return len(self.keys.get(key, {}))
+
+    def sadd(self, key, member):
+        self.keys.setdefault(key, set()).add(member)
+
+    def srem(self, key, member):
+        self.keys.get(key, set()).discard(member)
+
+    def smembers(self, key):
+        return set(self.keys.get(key, set()))
+
+    def delete(self, key):
+        self.keys.pop(key, None)
+
+    def expire(self, key, seconds):
+        pass
+
+class Pipeline:
+    def __init__(self, client):
+        self.client = client
+        self.results = []
+
+    def __getattr__(self, name):
+        def command(*args):
+            self.results.append(getattr(self.client, name)(*args))
+            return self
+        return command
+
+    def execute(self):
+        return self.results
+
+def test_redis_presence_drops_stopped_workers():
+    """Test viewers of a worker that stopped without disconnecting them stop being counted"""
+    now = [1000.0]
+    client = RedisStub()
+    first = RedisPresence(client, 'web-1', ttl=60, clock=lambda: now[0])
+    second = RedisPresence(client, 'web-2', ttl=60, clock=lambda: now[0])
+    first.join('item', 'a')
+    first.join('item', 'b')
+    second.join('item', 'c')
+    assert second.count('item') == 3
+
+    # Only the second worker is still refreshing its viewers
+    now[0] += 45
+    second.heartbeat()
+    now[0] += 30
+    assert second.count('item') == 1
+
+    # The first worker restarts and removes what it left behind
+    first.join('chat', 'd')
+    assert first.count('chat') == 1
+    RedisPresence(client, 'web-1', ttl=60, clock=lambda: now[0]).clear_worker()
+    assert first.count('chat') == 0 and second.count('item') == 1
+
+    assert second.disconnect('c') == {'item'}
+    assert second.count('item') == 0
+
+def test_viewer_counts_are_throttled():
+    """Test the first change is announced at once and a burst after it in one later announcement"""
+    now = [100.0]
+    tracker = PresenceTracker(interval=2, clock=lambda: now[0])
+    with patch('main.socketio') as mock_socketio:
+        tasks = []
+        mock_socketio.start_background_task = MagicMock(side_effect=lambda task, *args: tasks.append((task, args)))
+
+        tracker.join('item', 'a')
+        mock_socketio.emit.assert_called_once_with('viewer_count', {'viewers': 1}, room='item')
+
+        for sid in 'bcd':
+            tracker.join('item', sid)
+        tracker.leave('item', 'b')
+        assert len(tasks) == 1 and mock_socketio.emit.call_count == 1
+
+        task, args = tasks[0]
+        assert args == ('item', 2)
+        now[0] += 2
+        task(*args)
+        assert mock_socketio.emit.call_args.args == ('viewer_count', {'viewers': 3})
+
+        # Empty rooms aren't announced to
+        now[0] += 2
+        for sid in 'acd':
+            tracker.disconnect(sid)
+        assert mock_socketio.emit.call_args.args == ('viewer_count', {'viewers': 2})
+        task, args = tasks[1]
+        task(*args)
+        assert mock_socketio.emit.call_count == 3
+    assert tracker.count('item') == 0
+
+def test_watcher_count(app, common_setup_database):
+    """Test the watchers of an item are counted"""
+    with app.app_context():
+        users = User.query.order_by(User.id).all()
+        now = datetime.now()
+        item = Item(seller_id=users[0].id, category_id=Category.query.first().id, title='Watched item',
+                    description='Watched item', auction_start=now, auction_end=now + timedelta(days=1), minimum_price=1)
+        db.session.add(item)
+        db.session.commit()
+        watchers = item.watcher_count()
+        for user in users[1:]:
+            user.watched_items.append(item)
+        db.session.commit()
+        assert item.watcher_count() == watchers + len(users) - 1
+
+@login_as(role=1)
+def test_socket_viewers_of_auction_room(client, app):
+    """Test viewers joining and leaving an auction room are told how many are viewing"""
+    socketio = app.extensions['socketio']
+    first = socketio.test_client(app, flask_test_client=client)
+    second = socketio.test_client(app, flask_test_client=client)
+    try:
+        first.emit('join_auction', {'item_url': 'presence-item'})
+        second.emit('join_auction', {'item_url': 'presence-item'})
+        counts = [event['args'][0]['viewers'] for event in first.get_received() if event['name'] == 'viewer_count']
+        assert counts == [1, 2]
+
+        second.disconnect()
+        counts = [event['args'][0]['viewers'] for event in first.get_received() if event['name'] == 'viewer_count']
+        assert counts == [1]
+    finally:
+        for socket in (first, second):
+            if socket.is_connected():
+                socket.disconnect()
@@ -0,0 +1,90 @@
+"""Test the dashboard and item page queries use indexes rather than full table scans."""
+
+import datetime
+import re
+import uuid
+import pytest
+from sqlalchemy import event
+from main.models import (
+    db, User, Item, Bid, AuthenticationRequest, ExpertAssignment, ExpertAvailability, Message, Notification
+)
+from tests.test_utils import clear_all_tables, create_test_users, create_test_categories
+
+# Tables that grow with use, scanning any of them is a regression
+HOT_TABLES = {
+    'items', 'bids', 'images', 'notifications', 'expert_assignments', 'expert_availability',
+    'messages', 'message_images', 'authentication_requests', 'user_watched_items'
+}
+
+@pytest.fixture(scope="module")
+def plan_data(app):
+    """A user, expert and manager with an item, bids, an authentication request and notifications"""
+    with app.app_context():
+        clear_all_tables(db.session)
+        users = create_test_users()
+        categories = create_test_categories()
+        regular, expert, manager = users
+        now = datetime.datetime.now()
+
+        item = Item(seller_id=regular.id, category_id=categories[0].id, url=uuid.uuid4().hex,
+                    title='Planned item', description='Planned item', minimum_price=10,
+                    auction_start=now - datetime.timedelta(days=1), auction_end=now + datetime.timedelta(days=1))
+        db.session.add(item)
+        db.session.commit()
+        db.session.add_all([
+            Bid(item_id=item.item_id, bidder_id=manager.id, bid_amount=20, bid_time=now),
+            Notification(user_id=regular.id, message='Welcome', notification_type=0)
+        ])
+        regular.watched_items.append(item)
+        request = AuthenticationRequest(item_id=item.item_id, requester_id=regular.id)
+        db.session.add(request)
+        db.session.commit()
+        db.session.add_all([
+            ExpertAssignment(request_id=request.request_id, expert_id=expert.id),
+            ExpertAvailability(expert_id=expert.id, day=now.date(), start_time=datetime.time(9),
+                               end_time=datetime.time(17), status=True),
+            Message(authentication_request_id=request.request_id, sender_id=expert.id, message_text='Hello')
+        ])
+        db.session.commit()
+        yield {'users': {user.role: user.id for user in users}, 'item': item.url, 'request': request.url}
+        clear_all_tables(db.session)
+
+def full_scans(app, client, user_id, path):
+    """Request a page as the user and return the full table scans in the plans of its queries"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get(path)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert response.status_code == 200
+
+        scans = []
+        for statement, parameters in statements:
+            for row in db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters):
+                match = re.fullmatch(r'SCAN (\w+?)(?:_\d+)?', row[-1])
+                if match and match.group(1) in HOT_TABLES:
+                    scans.append((row[-1], statement))
+        return scans
+
+@pytest.mark.parametrize('role, path', [
+    (1, '/dashboard/'),
+    (2, '/dashboard/'),
+    (3, '/dashboard/'),
+    (1, '/'),
+    (1, '/item/{item}'),
+    (2, '/authenticate/{request}')
+])
+def test_page_queries_use_indexes(app, client, plan_data, role, path):
+    """Test every query of the page is answered from an index"""
+    scans = full_scans(app, client, plan_data['users'][role], path.format(**plan_data))
+    assert not scans, '\n'.join(f'{detail}: {statement}' for detail, statement in scans)
@@ -0,0 +1,81 @@
+"""Test Socket.IO events are shared between workers through the message queue."""
+
+import json
+import time
+import pytest
+import socketio as python_socketio
+from flask import Flask
+from flask_socketio import SocketIO
+from main.socket_utils import MemoryBus, MemoryManager, client_manager, init_socketio
+
+class Worker:
+    """A worker's Socket.IO server with the auction room handler, recording the packets it sends
+
+    Flask-SocketIO's test client refuses message queues, so clients are connected through the
+    server's Engine.IO handlers instead.
+    """
+
+    def __init__(self, bus):
+        self.manager = MemoryManager(bus=bus)
+        self.server = python_socketio.Server(client_manager=self.manager, async_mode='threading', async_handlers=False)
+        self.sent = []
+        self.server._send_eio_packet = lambda eio_sid, packet: self.sent.append((eio_sid, packet.data))
+
+        @self.server.on('join_auction')
+        def on_join(sid, data):
+            self.server.enter_room(sid, data['item_url'])
+
+    def connect(self, eio_sid, room=None):
+        self.server._handle_eio_connect(eio_sid, {})
+        self.server._handle_eio_message(eio_sid, '0')
+        if room:
+            self.server._handle_eio_message(eio_sid, '2' + json.dumps(['join_auction', {'item_url': room}]))
+
+    def events(self, eio_sid, timeout=2):
+        """Wait for the events sent to the client, delivered by the queue listener"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            # Event packets are a 2 followed by the JSON of the name and data
+            events = [json.loads(data[1:]) for sent_to, data in self.sent if sent_to == eio_sid and data[0] == '2']
+            if events:
+                return events
+            time.sleep(0.01)
+        return []
+
+def test_emit_reaches_clients_of_other_workers():
+    """Test an event emitted by one worker outside a request reaches the room on another"""
+    bus = MemoryBus()
+    bidders, scheduler = Worker(bus), Worker(bus)
+    try:
+        bidders.connect('bidder', room='queued-item')
+        bidders.connect('browser')
+        bidders.sent.clear()
+
+        scheduler.server.emit('bid_update', {'bid_amount': 25.0}, room='queued-item')
+
+        assert bidders.events('bidder') == [['bid_update', {'bid_amount': 25.0}]]
+        # Clients outside the room don't get it
+        assert not bidders.events('browser', timeout=0.1)
+    finally:
+        bidders.manager.close()
+        scheduler.manager.close()
+
+def test_client_manager_for_queue_url():
+    """Test the queue URL picks the manager, without one clients stay in the process"""
+    assert client_manager(None) is None
+    assert isinstance(client_manager('memory://'), MemoryManager)
+    assert isinstance(client_manager('redis://localhost:6379/0', write_only=True), python_socketio.RedisManager)
+    with pytest.raises(ValueError):
+        client_manager('ftp://localhost')
+
+def test_init_socketio_falls_back_to_one_worker():
+    """Test the app uses the configured queue, and keeps clients in the process if it can't"""
+    app = Flask(__name__)
+    app.config['REDIS_URL'] = 'memory://'
+    server = SocketIO()
+    init_socketio(server, app)
+    assert isinstance(server.server.manager, MemoryManager)
+
+    app.config['REDIS_URL'] = 'ftp://localhost'
+    init_socketio(server, app)
+    assert not isinstance(server.server.manager, python_socketio.PubSubManager)
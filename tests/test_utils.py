@@ -5,9 +5,12 @@ from functools import wraps
 from contextlib import contextmanager
 import datetime
 import json
+from sqlalchemy import event
 from main.models import db, User, Category, Item, Image, Bid, Notification, Message, MessageImage, AuthenticationRequest, ExpertAssignment, ExpertAvailability
 import uuid
 import pytest
+import socketserver
+import threading
 
 def clear_all_tables(db_session):
     """Clear all tables in the correct order to avoid foreign key issues"""
@@ -21,6 +24,18 @@ def clear_all_tables(db_session):
     
     db_session.commit()
 
+@contextmanager
+def count_queries():
+    """Collect the SQL statements run inside the block, needs an app context"""
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
 @contextmanager
 def db_transaction():
     """Context manager for database transactions that rolls back on exception"""
@@ -610,4 +625,65 @@ def create_test_expert_availability(app, expert_id, days=None, available=True):
             records.append(record)
         
         db.session.commit()
-        return records
\ No newline at end of file
+        return records
+
+class SMTPStub:
+    """Minimal local SMTP server recording the messages it receives"""
+
+    def __init__(self, reject=()):
+        self.messages = []
+        self.connections = 0
+        self.reject = set(reject)
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode())
+
+            def handle(self):
+                stub.connections += 1
+                sender, recipients = None, []
+                self.reply('220 localhost SMTP stub')
+                for line in self.rfile:
+                    command = line.decode().strip()
+                    verb = command[:4].upper()
+                    if verb in ('EHLO', 'HELO'):
+                        self.reply('250 localhost')
+                    elif verb == 'MAIL':
+                        sender, recipients = command.split(':', 1)[1].strip(' <>'), []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        recipient = command.split(':', 1)[1].strip(' <>')
+                        if recipient in stub.reject:
+                            self.reply('550 Mailbox unavailable')
+                        else:
+                            recipients.append(recipient)
+                            self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        data = []
+                        for data_line in self.rfile:
+                            if data_line in (b'.\r\n', b'.\n'):
+                                break
+                            data.append(data_line.decode())
+                        stub.messages.append({'from': sender, 'to': recipients, 'data': ''.join(data)})
+                        self.reply('250 OK')
+                    elif verb in ('RSET', 'NOOP'):
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Command not implemented')
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()